@@ -10,8 +10,10 @@ from src.config import settings
 engine = create_engine(
     settings.database_url,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    # Replace pooled connections before server/proxy idle timeouts silently drop them
+    pool_recycle=1800,
     echo=False  # Set to True for SQL query logging
 )
 
@@ -36,9 +38,9 @@ def get_db_session():
     for attempt in range(MAX_RETRIES):
         try:
             db = SessionLocal()
-            # Test the connection with a simple query
-            from sqlalchemy import text
-            db.execute(text("SELECT 1"))
+            # Check out a pooled connection now so connection errors surface here; pool_pre_ping
+            # already validates it, so no extra test query is needed
+            db.connection()
             return db
         except OperationalError as e:
             last_error = e
@@ -0,0 +1,72 @@
+"""Idempotent schema upgrades for databases created by older versions of the models.
+
+Base.metadata.create_all only creates missing tables: it never alters a table that already
+exists or adds indexes to it. upgrade_schema brings such a database in line with the
+models and is safe to run on every startup.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from data.database.connection import Base
+# Import the models so their tables and indexes are registered on Base.metadata
+from data.database import order_models, product_model  # noqa: F401
+
+# A row's tags normalized like ProductBase.normalize_tags (trimmed, lowercased, blanks dropped)
+_NORMALIZED_TAGS = """(
+    SELECT coalesce(
+        jsonb_agg(lower(btrim(t.tag)) ORDER BY t.position) FILTER (WHERE btrim(t.tag) <> ''),
+        '[]'::jsonb
+    )
+    FROM jsonb_array_elements_text(products.tags) WITH ORDINALITY AS t(tag, position)
+)"""
+
+
+def _upgrade_product_tags(engine: Engine):
+    """Convert products.tags from json to jsonb and normalize the stored tags."""
+    columns = {column["name"]: column for column in inspect(engine).get_columns("products")}
+    if "tags" not in columns:
+        return
+
+    with engine.begin() as conn:
+        if not isinstance(columns["tags"]["type"], JSONB):
+            # The tag filter (?|) and its GIN index need jsonb; older tables have json
+            print("[DB] Converting products.tags to jsonb...")
+            conn.execute(text("ALTER TABLE products ALTER COLUMN tags TYPE jsonb USING tags::jsonb"))
+        # The tag filter matches lowercased tags; rows written before normalization may be mixed-case
+        result = conn.execute(text(
+            f"UPDATE products SET tags = {_NORMALIZED_TAGS} "
+            f"WHERE jsonb_typeof(tags) = 'array' AND tags IS DISTINCT FROM {_NORMALIZED_TAGS}"
+        ))
+        if result.rowcount:
+            print(f"[DB] Normalized tags of {result.rowcount} products")
+
+
+def _create_missing_indexes(engine: Engine):
+    """Create model indexes that are missing on tables created before they were added."""
+    try:
+        with engine.begin() as conn:
+            # gin_trgm_ops (product search indexes) comes from pg_trgm
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except SQLAlchemyError as e:
+        print(f"[DB] Could not create the pg_trgm extension: {e}")
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            # Each index in its own transaction, so one failure (e.g. a unique index over
+            # existing duplicates) neither blocks startup nor the other indexes
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except SQLAlchemyError as e:
+                print(f"[DB] Could not create index {index.name}: {e}")
+
+
+def upgrade_schema(engine: Engine):
+    """
+    Bring existing tables in line with the models (run after Base.metadata.create_all).
+
+    Args:
+        engine: Database engine
+    """
+    _upgrade_product_tags(engine)
+    _create_missing_indexes(engine)
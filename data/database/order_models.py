@@ -1,5 +1,5 @@
 """Order-related database models."""
-from sqlalchemy import Column, Integer, String, Numeric, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Numeric, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from data.database.connection import Base
@@ -12,7 +12,7 @@ class Voucher(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     code = Column(String(50), unique=True, nullable=False, index=True)
-    amount = Column(Numeric(10, 2), nullable=False)  # Voucher value in USD
+    amount = Column(Numeric(10, 2, asdecimal=False), nullable=False)  # Voucher value in USD
     is_used = Column(Boolean, default=False, nullable=False, index=True)
     used_at = Column(DateTime(timezone=True), nullable=True)
     generated_by_session = Column(String(100), nullable=True, index=True)  # Session ID that generated it
@@ -20,6 +20,14 @@ class Voucher(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     expires_at = Column(DateTime(timezone=True), nullable=True)  # Optional expiration
     
+    __table_args__ = (
+        # Small index over unused vouchers only, for claiming a voucher at purchase
+        # (UPDATE ... WHERE code = :code AND is_used = false); it stays small as used vouchers accumulate
+        Index("ix_vouchers_unused_code", code, postgresql_where=is_used.is_(False)),
+        # A session's unused voucher (generate_voucher returns it instead of issuing another)
+        Index("ix_vouchers_session_unused", generated_by_session, postgresql_where=is_used.is_(False)),
+    )
+    
     def __repr__(self):
         return f"<Voucher(id={self.id}, code='{self.code}', amount={self.amount}, is_used={self.is_used})>"
 
@@ -32,7 +40,7 @@ class Order(Base):
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String(100), nullable=False, index=True)  # User session identifier
     voucher_code = Column(String(50), ForeignKey("vouchers.code"), nullable=True)
-    total_amount = Column(Numeric(10, 2), nullable=False)
+    total_amount = Column(Numeric(10, 2, asdecimal=False), nullable=False)
     status = Column(String(50), default="completed", nullable=False)  # completed, failed, pending
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     
@@ -40,6 +48,16 @@ class Order(Base):
     voucher = relationship("Voucher", backref="orders")
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # Recent orders per session: index range scan instead of filter + sort
+        Index("ix_orders_session_created", session_id, created_at.desc()),
+        # Purchase idempotency lookup by voucher; unique so a voucher can back at most one order
+        Index("ux_orders_voucher_code", voucher_code, unique=True),
+    )
+    
+    # Fetch server-generated columns (created_at) with RETURNING at INSERT time
+    __mapper_args__ = {"eager_defaults": True}
+    
     def __repr__(self):
         return f"<Order(id={self.id}, session_id='{self.session_id}', total={self.total_amount}, status='{self.status}')>"
 
@@ -50,12 +68,12 @@ class OrderItem(Base):
     __tablename__ = "order_items"
     
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     product_name = Column(String(255), nullable=False)  # Snapshot of product name at time of order
     quantity = Column(Integer, nullable=False)
-    unit_price = Column(Numeric(10, 2), nullable=False)  # Snapshot of price at time of order
-    subtotal = Column(Numeric(10, 2), nullable=False)  # quantity * unit_price
+    unit_price = Column(Numeric(10, 2, asdecimal=False), nullable=False)  # Snapshot of price at time of order
+    subtotal = Column(Numeric(10, 2, asdecimal=False), nullable=False)  # quantity * unit_price
     
     # Relationships
     order = relationship("Order", back_populates="items")
@@ -1,5 +1,6 @@
 """Product model for ecommerce platform."""
-from sqlalchemy import Column, Integer, String, Numeric, Text, Boolean, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Numeric, Text, Boolean, DateTime, JSON, Index, DDL, event
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from data.database.connection import Base
 
@@ -8,6 +9,19 @@ class Product(Base):
     """Product model representing items in the ecommerce store."""
     
     __tablename__ = "products"
+    __table_args__ = (
+        # Matches the admin listing filters (is_active, then category/brand)
+        Index("ix_products_active_category_brand", "is_active", "category", "brand"),
+        # Tag filters (tags ?| array[...]); default jsonb_ops, since jsonb_path_ops has no ?| support
+        Index("ix_products_tags_gin", "tags", postgresql_using="gin"),
+        # Trigram indexes let the catalog's ILIKE '%term%' search use an index scan
+        Index("ix_products_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index(
+            "ix_products_description_trgm", "description",
+            postgresql_using="gin", postgresql_ops={"description": "gin_trgm_ops"}
+        ),
+        Index("ix_products_sku_trgm", "sku", postgresql_using="gin", postgresql_ops={"sku": "gin_trgm_ops"}),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False, index=True)
@@ -15,7 +29,7 @@ class Product(Base):
     description = Column(Text, nullable=False)  # Detailed description for semantic search
     
     # Pricing
-    price = Column(Numeric(10, 2), nullable=False)
+    price = Column(Numeric(10, 2), nullable=False, index=True)
     cost_price = Column(Numeric(10, 2), nullable=True)  # Cost to business
     
     # Inventory
@@ -26,7 +40,7 @@ class Product(Base):
     weight = Column(Numeric(8, 2), nullable=True)  # in grams or kg
     dimensions = Column(JSON, nullable=True)  # {"length": 10, "width": 5, "height": 3}
     category = Column(String(100), nullable=True, index=True)
-    tags = Column(JSON, nullable=True)  # Array of tags ["electronics", "smartphone"]
+    tags = Column(JSONB, nullable=True)  # Array of lowercased tags ["electronics", "smartphone"]
     
     # Media
     images = Column(JSON, nullable=True)  # Array of image URLs
@@ -41,8 +55,23 @@ class Product(Base):
     
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False, index=True)
     
     def __repr__(self):
         return f"<Product(id={self.id}, name='{self.name}', sku='{self.sku}')>"
 
+
+class CatalogVersion(Base):
+    """Single-row counter bumped by every write to product data (validates cached listings)."""
+    
+    __tablename__ = "catalog_version"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+
+
+# Catalog listing order (newest first, id as tie-breaker) for keyset pagination
+Index("ix_products_created_id", Product.created_at.desc(), Product.id.desc())
+
+# gin_trgm_ops comes from the pg_trgm extension, which must exist before the table's indexes
+event.listen(Product.__table__, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
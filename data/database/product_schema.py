@@ -32,6 +32,14 @@ class ProductBase(BaseModel):
             if not all(key in allowed_keys for key in v.keys()):
                 raise ValueError(f"Dimensions can only contain: {allowed_keys}")
         return v
+    
+    @field_validator('tags')
+    @classmethod
+    def normalize_tags(cls, v):
+        # Stored lowercased so tag filters can match in the database without transforming rows
+        if v is not None:
+            return [tag.strip().lower() for tag in v if tag.strip()]
+        return v
 
 
 class ProductCreate(ProductBase):
@@ -66,6 +74,14 @@ class ProductUpdate(BaseModel):
             if not all(key in allowed_keys for key in v.keys()):
                 raise ValueError(f"Dimensions can only contain: {allowed_keys}")
         return v
+    
+    @field_validator('tags')
+    @classmethod
+    def normalize_tags(cls, v):
+        # Stored lowercased so tag filters can match in the database without transforming rows
+        if v is not None:
+            return [tag.strip().lower() for tag in v if tag.strip()]
+        return v
 
 
 class ProductResponse(ProductBase):
@@ -23,6 +23,25 @@ class ShippingInfoCreate(ShippingInfoBase):
     pass
 
 
+class ShippingInfoUpdate(BaseModel):
+    """Schema for partially updating shipping information (omitted fields stay unchanged)."""
+    full_name: Optional[str] = Field(None, min_length=1, max_length=255, description="Full name for shipping")
+    address: Optional[str] = Field(None, min_length=1, max_length=500, description="Complete street address")
+    city: Optional[str] = Field(None, min_length=1, max_length=100, description="City name")
+    zip_code: Optional[str] = Field(None, min_length=1, max_length=20, description="Zip/postal code")
+    
+    # Runs before the length constraints, so they apply to the stripped value
+    @field_validator('full_name', 'address', 'city', 'zip_code', mode='before')
+    @classmethod
+    def validate_not_empty(cls, v):
+        if not isinstance(v, str):
+            return v
+        v = v.strip()
+        if not v:
+            raise ValueError("Field cannot be empty")
+        return v
+
+
 class ShippingInfoResponse(ShippingInfoBase):
     """Schema for shipping information response."""
     id: int
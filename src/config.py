@@ -13,6 +13,9 @@ class Settings(BaseSettings):
     
     database_url: str = Field(..., alias="DATABASE_URL")
     openai_api_key: str = Field(..., alias="OPENAI_API_KEY")
+    # SQLAlchemy connection pool per worker process (use a small pool size behind PgBouncer)
+    db_pool_size: int = Field(default=20, alias="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=10, alias="DB_MAX_OVERFLOW")
     openai_model: str = Field(default="text-embedding-ada-002", alias="OPENAI_MODEL")
     openai_api_base: str = Field(default="", alias="OPENAI_API_BASE")
     # Chat model for agents (can be different from embedding model)
@@ -27,15 +30,38 @@ class Settings(BaseSettings):
     # LLM max tokens limits
     llm_max_tokens_orchestrator: int = Field(default=150, alias="LLM_MAX_TOKENS_ORCHESTRATOR")
     llm_max_tokens_agent: int = Field(default=500, alias="LLM_MAX_TOKENS_AGENT")
+    # Output token cap per response scored by the LLM judge
+    judge_max_tokens: int = Field(default=350, alias="JUDGE_MAX_TOKENS")
+    # Retries (with backoff) for LLM judge calls hitting rate limits or connection errors
+    judge_max_retries: int = Field(default=5, alias="JUDGE_MAX_RETRIES")
+    # Trace LLM judge calls in Langfuse (false = call the API directly, skipping the traced client)
+    eval_trace_judge: bool = Field(default=True, alias="EVAL_TRACE_JUDGE")
+    # OpenAI HTTP connection pool (shared by all agents)
+    openai_max_connections: int = Field(default=200, alias="OPENAI_MAX_CONNECTIONS")
+    openai_max_keepalive_connections: int = Field(default=100, alias="OPENAI_MAX_KEEPALIVE_CONNECTIONS")
+    # LLM-as-a-judge batching: responses per judge call (1 = no batching) and max seconds to wait for a batch
+    evaluation_batch_size: int = Field(default=5, alias="EVALUATION_BATCH_SIZE")
+    evaluation_batch_wait: float = Field(default=2.0, alias="EVALUATION_BATCH_WAIT")
     project_name: str = "Agentic Ecommerce"
     api_version: str = "v1"
     # Langfuse observability
     langfuse_base_url: str = Field(default="", alias="LANGFUSE_BASE_URL")
     langfuse_secret_key: str = Field(default="", alias="LANGFUSE_SECRET_KEY")
     langfuse_public_key: str = Field(default="", alias="LANGFUSE_PUBLIC_KEY")
+    # Langfuse export batching (events per batch, seconds between flushes) and trace sampling (0.0-1.0)
+    langfuse_flush_at: int = Field(default=50, alias="LANGFUSE_FLUSH_AT")
+    langfuse_flush_interval: float = Field(default=1.0, alias="LANGFUSE_FLUSH_INTERVAL")
+    langfuse_sample_rate: float = Field(default=1.0, alias="LANGFUSE_SAMPLE_RATE")
+    # Minimum cosine similarity between query embeddings to reuse a cached search result
+    search_cache_similarity: float = Field(default=0.97, alias="SEARCH_CACHE_SIMILARITY")
+    # SQLite file the query embedding cache is saved to on shutdown and loaded from on startup (empty = off)
+    embedding_cache_path: str = Field(default="data/embedding_cache.sqlite", alias="EMBEDDING_CACHE_PATH")
+    # Redis URL for shared cart storage across workers (empty = in-process carts)
+    redis_url: str = Field(default="", alias="REDIS_URL")
     # Rate limiting
     rate_limit_enabled: bool = Field(default=True, alias="RATE_LIMIT_ENABLED")
     rate_limit_per_minute: int = Field(default=60, alias="RATE_LIMIT_PER_MINUTE")
+    voucher_rate_limit_per_minute: int = Field(default=10, alias="VOUCHER_RATE_LIMIT_PER_MINUTE")
     
     class Config:
         env_file = ".env"
@@ -74,9 +74,15 @@ class EmbeddingStore:
         # Support OpenRouter by using OPENAI_API_BASE if provided
         # When OPENAI_API_BASE is set (e.g., https://openrouter.ai/api/v1), 
         # the codebase uses OpenAI through OpenRouter
+        # Reuse the process-wide HTTP connection pools instead of one pool per store
+        # (imported here: the src.utils package imports this module, so a module-level
+        # import would be circular)
+        from src.utils.llm import get_async_http_client, get_sync_http_client
         embedding_kwargs = {
             "model": settings.openai_model,
-            "openai_api_key": settings.openai_api_key
+            "openai_api_key": settings.openai_api_key,
+            "http_client": get_sync_http_client(),
+            "http_async_client": get_async_http_client()
         }
         
         # If OPENAI_API_BASE is set, use it (for OpenRouter or other providers)
@@ -7,30 +7,38 @@ project_root = Path(__file__).parent.parent
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
+from contextlib import asynccontextmanager
+import anyio.to_thread
 from fastapi import FastAPI
+from langfuse import Langfuse, get_client
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from src.config import settings
 from src.routes.admin import router as admin_router
 from src.routes.user import router as user_router
 from src.middlewares.tokenValidationMiddleware import TokenValidationMiddleware
 from data.database.connection import engine, Base
+from data.database.migrations import upgrade_schema
 # Import order models to ensure tables are created
 from data.database.order_models import Order, OrderItem, Voucher, ShippingInfo
 from src.indexing.embeddings import EmbeddingStore
+from src.querying.service import QueryService
+from src.utils.embedding_cache import embedding_cache
+from src.utils.rate_limit import limiter
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
-
-# Initialize FastAPI app
-app = FastAPI(
-    title=settings.project_name,
-    version=settings.api_version,
-    description="Ecommerce platform with AI agents - Admin & Query API"
+# Configure the Langfuse client before anything calls get_client(), so every span and
+# generation is exported in batches instead of per event
+Langfuse(
+    flush_at=settings.langfuse_flush_at,
+    flush_interval=settings.langfuse_flush_interval,
+    sample_rate=settings.langfuse_sample_rate
 )
 
+# Create database tables, then upgrade tables created by older versions of the models
+Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
+
 # Initialize vector stores at startup
 print("Initializing vector stores...")
 handbook_store = EmbeddingStore(
@@ -48,12 +56,62 @@ handbook_vectorstore = handbook_store.get_vectorstore()
 products_vectorstore = products_store.get_vectorstore()
 print("✓ Vector stores initialized")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the query service and warm caches and connections before serving traffic."""
+    # Sync routes run in AnyIO worker threads and each holds a pooled connection; size the
+    # thread limiter to the pool so requests queue on the limiter instead of timing out on checkout
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.db_pool_size + settings.db_max_overflow
+    
+    # Build the agent stack before the first query instead of on it
+    app.state.query_service = QueryService(
+        handbook_vectorstore=handbook_vectorstore,
+        products_vectorstore=products_vectorstore
+    )
+    
+    if settings.embedding_cache_path:
+        try:
+            loaded = embedding_cache.load(settings.embedding_cache_path, settings.openai_model)
+            print(f"✓ Loaded {loaded} cached query embeddings")
+        except Exception as e:
+            print(f"⚠ Could not load the query embedding cache: {e}")
+    
+    # One tiny embedding request opens a kept-alive connection (DNS + TLS) that the first
+    # real query or chat completion reuses; failures only cost the warm-up
+    try:
+        await handbook_store.embeddings.aembed_query("warmup")
+    except Exception as e:
+        print(f"⚠ OpenAI connection warm-up failed: {e}")
+    
+    yield
+    
+    # Background evaluations leave their scores to the batched export; send what is queued
+    try:
+        await anyio.to_thread.run_sync(get_client().flush)
+    except Exception as e:
+        print(f"⚠ Could not flush Langfuse events: {e}")
+    
+    if settings.embedding_cache_path:
+        try:
+            embedding_cache.save(settings.embedding_cache_path, settings.openai_model)
+        except Exception as e:
+            print(f"⚠ Could not save the query embedding cache: {e}")
+
+
+# Initialize FastAPI app
+app = FastAPI(
+    title=settings.project_name,
+    version=settings.api_version,
+    description="Ecommerce platform with AI agents - Admin & Query API",
+    lifespan=lifespan
+)
+
 # Store vector stores in app state for reuse
 app.state.handbook_vectorstore = handbook_vectorstore
 app.state.products_vectorstore = products_vectorstore
 
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
+# Rate limiter shared with the routes (keyed by session_id)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
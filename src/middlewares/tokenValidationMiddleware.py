@@ -8,6 +8,9 @@ from starlette.requests import Request as StarletteRequest
 # Token limit for queries
 MAX_QUERY_TOKENS = 300
 
+# Query endpoints whose body is validated
+QUERY_PATHS = ("/user/query", "/user/query/stream")
+
 # Initialize tiktoken encoder (using cl100k_base for GPT-4/GPT-3.5)
 tiktoken_encoder = tiktoken.get_encoding("cl100k_base")
 
@@ -16,8 +19,8 @@ class TokenValidationMiddleware(BaseHTTPMiddleware):
     """Middleware to validate query token count before processing."""
     
     async def dispatch(self, request: StarletteRequest, call_next):
-        # Only validate POST requests to /user/query
-        if request.method == "POST" and request.url.path == "/user/query":
+        # Only validate POST requests to the query endpoints
+        if request.method == "POST" and request.url.path in QUERY_PATHS:
             try:
                 # Read the body
                 body_bytes = await request.body()
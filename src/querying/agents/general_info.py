@@ -2,8 +2,10 @@
 import asyncio
 from langfuse.openai import AsyncOpenAI
 from langfuse import get_client
-from src.querying.tools.retrieval import get_handbook_retrieval_function
+from src.querying.tools.retrieval import get_handbook_retrieval_function, execute_handbook_retrieval
 from src.utils.llm import create_chat_completion_with_timeout
+from src.utils.embedding_cache import embedding_cache, normalize_query
+from src.querying.tools.search_cache import exact_handbook_cache, handbook_search_cache
 
 
 class GeneralInfoAgent:
@@ -48,8 +50,6 @@ class GeneralInfoAgent:
         Returns:
             Tuple of (agent response text, list of source documents)
         """
-        from src.querying.tools.retrieval import execute_handbook_retrieval
-        
         langfuse = get_client()
         
         with langfuse.start_as_current_observation(
@@ -57,13 +57,32 @@ class GeneralInfoAgent:
             name="general-info-agent",
             input={"query": query}
         ) as agent_span:
-            # Directly call retrieval (no initial LLM call needed since we only have one tool)
-            tool_result, docs_with_similarity = execute_handbook_retrieval(
-                query=query,
-                k=3,
-                min_similarity=self.min_similarity,
-                vectorstore=self.vectorstore
-            )
+            # Repeated and near-duplicate questions reuse earlier retrievals:
+            # exact (normalized) query first, then by query embedding similarity
+            filter_key = (3, self.min_similarity)
+            exact_key = (normalize_query(query), filter_key)
+            cached = exact_handbook_cache.get(exact_key)
+            if cached is None:
+                # Reuse the query embedding if this (normalized) query was embedded recently
+                embedding = None
+                embedder = getattr(self.vectorstore, "embeddings", None)
+                if embedder is not None:
+                    embedding = await embedding_cache.get_or_embed_async(query, embedder)
+                
+                cached = handbook_search_cache.get(embedding, filter_key) if embedding is not None else None
+                if cached is None:
+                    # Directly call retrieval (no initial LLM call needed since we only have one tool)
+                    cached = execute_handbook_retrieval(
+                        query=query,
+                        k=3,
+                        min_similarity=self.min_similarity,
+                        vectorstore=self.vectorstore,
+                        embedding=embedding
+                    )
+                    if embedding is not None:
+                        handbook_search_cache.put(embedding, filter_key, cached)
+                exact_handbook_cache[exact_key] = cached
+            tool_result, docs_with_similarity = cached
             
             sources = list(docs_with_similarity)
             
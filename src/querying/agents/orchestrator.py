@@ -1,13 +1,19 @@
 """Custom orchestrator agent with OpenAI function calling."""
 import asyncio
-from typing import List, Dict, Any, Optional, Literal
-from langfuse.openai import AsyncOpenAI
+import logging
+import orjson
+from typing import List, Dict, Any, AsyncIterator, Optional, Literal
+from langchain_core.documents import Document
 from langfuse import get_client
 from src.config import settings
+from src.querying.agents.general_info import GeneralInfoAgent
+from src.querying.agents.order import OrderAgent
 from src.utils.memory import ConversationMemory
-from src.utils.llm import create_chat_completion_with_timeout
+from src.utils.llm import create_chat_completion_with_timeout, get_openai_client
 from src.utils.evaluation import evaluate_response_async
 
+logger = logging.getLogger(__name__)
+
 
 class OrchestratorAgent:
     """
@@ -30,13 +36,8 @@ class OrchestratorAgent:
         self.handbook_vectorstore = handbook_vectorstore
         self.products_vectorstore = products_vectorstore
         
-        # Initialize OpenAI client (async)
-        client_kwargs = {
-            "api_key": settings.openai_api_key
-        }
-        if settings.openai_api_base:
-            client_kwargs["base_url"] = settings.openai_api_base
-        self.client = AsyncOpenAI(**client_kwargs)
+        # Shared OpenAI client (async), passed down to the sub-agents
+        self.client = get_openai_client()
         
         self.model = settings.chat_model
         
@@ -103,9 +104,6 @@ class OrchestratorAgent:
         Returns:
             Tuple of (sub-agent response, list of source documents, query parameters dict)
         """
-        from src.querying.agents.general_info import GeneralInfoAgent
-        from src.querying.agents.order import OrderAgent
-        
         if agent_name == "general_info":
             agent = GeneralInfoAgent(self.client, min_similarity, self.handbook_vectorstore)
             response, sources = await agent.invoke(query)
@@ -117,6 +115,36 @@ class OrchestratorAgent:
         else:
             return (f"Unknown agent: {agent_name}", [], {})
     
+    async def _stream_order_agent(
+        self, query: str, min_similarity: float, session_id: str, conversation_history: list
+    ) -> AsyncIterator[tuple]:
+        """
+        Run the order agent, relaying its answer tokens as they are generated.
+        
+        Args:
+            query: User query
+            min_similarity: Minimum similarity threshold for retrieval
+            session_id: User session identifier
+            conversation_history: Previous conversation messages
+            
+        Yields:
+            The agent's ("token", text) and ("discard",) events, then a single
+            ("result", response, sources, query_params) event
+        """
+        agent = OrderAgent(self.client, min_similarity, self.products_vectorstore)
+        parts = []
+        sources, query_params = [], {}
+        async for event in agent.invoke_stream(query, session_id, conversation_history):
+            if event[0] == "token":
+                parts.append(event[1])
+                yield event
+            elif event[0] == "discard":
+                parts.clear()
+                yield event
+            else:
+                _, sources, query_params = event
+        yield ("result", "".join(parts), sources, query_params)
+    
     async def invoke(
         self,
         query: str,
@@ -134,6 +162,34 @@ class OrchestratorAgent:
         Returns:
             Dictionary with response, routing_mode, and agents_used
         """
+        result = None
+        async for event in self.invoke_stream(query, session_id, min_similarity):
+            if event[0] == "done":
+                result = event[1]
+        return result
+    
+    async def invoke_stream(
+        self,
+        query: str,
+        session_id: str,
+        min_similarity: float = 0.75
+    ) -> AsyncIterator[tuple]:
+        """
+        Process a user query through the orchestrator, streaming the answer.
+        
+        Only a single order agent call streams token by token; other answers (direct replies,
+        general info, synthesized multi-agent answers) arrive as one token once complete.
+        
+        Args:
+            query: User's question or request
+            session_id: Session identifier for memory
+            min_similarity: Minimum similarity threshold for retrieval
+            
+        Yields:
+            ("token", text) events, ("discard",) events retracting the text streamed so far
+            (see OrderAgent.invoke_stream), then a single ("done", result) event whose result
+            is the dictionary returned by invoke
+        """
         langfuse = get_client()
         
         # Wrap entire query lifecycle in a trace
@@ -165,53 +221,57 @@ class OrchestratorAgent:
                 response_text = "I apologize, but the request took too long to process. Please try again."
                 self.memory.add_query(session_id, query, response_text, [])
                 root_trace.update(output={"response": response_text, "error": "timeout"})
-                return {
+                yield ("token", response_text)
+                yield ("done", {
                     "response": response_text,
                     "routing_mode": "direct",
                     "agents_used": [],
                     "sources": [],
                     "query_params": {}
-                }
+                })
+                return
             
             message = response.choices[0].message
             
             # Log tool calls from orchestrator
-            if message.tool_calls:
-                import json
-                print(f"[ORCHESTRATOR] Tool calls returned: {len(message.tool_calls)}")
-                for i, tc in enumerate(message.tool_calls):
-                    args = json.loads(tc.function.arguments) if tc.function.arguments else {}
-                    print(f"  Tool call #{i+1}: {tc.function.name} with args: {args}, tool_call_id: {tc.id}")
-            else:
-                print(f"[ORCHESTRATOR] No tool calls returned, content: {message.content[:100] if message.content else 'None'}")
+            if logger.isEnabledFor(logging.DEBUG):
+                if message.tool_calls:
+                    logger.debug("Tool calls returned: %d", len(message.tool_calls))
+                    for i, tc in enumerate(message.tool_calls):
+                        logger.debug(
+                            "  Tool call #%d: %s with args: %s, tool_call_id: %s",
+                            i + 1, tc.function.name, tc.function.arguments, tc.id
+                        )
+                else:
+                    logger.debug("No tool calls returned, content: %s", (message.content or "None")[:100])
             
             agents_used = []
             sub_agent_responses = []
             all_sources = []
             query_params = {}  # Collect query parameters from sub-agents
             routing_mode = "single"  # Default, will be determined from tool calls
+            streamed = False  # Whether the answer was already yielded token by token
             
             # Handle tool calls
             if message.tool_calls:
-                import json
                 tool_messages = []
 
                 # If multiple order-agent calls are returned, collapse into one using the original query
                 order_tool_calls = [tc for tc in message.tool_calls if tc.function.name == "query_order_agent"]
                 if len(order_tool_calls) > 1:
                     first_order = order_tool_calls[0]
-                    first_order.function.arguments = json.dumps({"query": query})
+                    first_order.function.arguments = orjson.dumps({"query": query}).decode()
                     # keep non-order calls plus the first order call
                     filtered = [tc for tc in message.tool_calls if tc.function.name != "query_order_agent"]
                     filtered.insert(0, first_order)
                     message.tool_calls = filtered
-                    print(f"[ORCHESTRATOR] Collapsed {len(order_tool_calls)} order calls into 1 with original query")
+                    logger.debug("Collapsed %d order calls into 1 with original query", len(order_tool_calls))
                 
                 # Prepare agent calls
                 agent_calls = []
                 for tool_call in message.tool_calls:
                     function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
+                    function_args = orjson.loads(tool_call.function.arguments)
                     
                     # Map function name to agent
                     if function_name == "query_general_info":
@@ -243,46 +303,44 @@ class OrchestratorAgent:
                 
                 # Execute agents based on routing mode
                 # Pass conversation history so agents can see previous search results with product_ids
-                if routing_mode == "parallel":
+                if routing_mode == "single" and len(agent_calls) == 1 and agent_calls[0]["agent_name"] == "order":
+                    # The order agent's answer is the final answer: relay it as it is generated
+                    call = agent_calls[0]
+                    async for event in self._stream_order_agent(call["query"], min_similarity, session_id, messages):
+                        if event[0] == "result":
+                            results = [event[1:]]
+                        else:
+                            yield event
+                    streamed = True
+                elif routing_mode == "parallel":
                     # Execute all agents in parallel
                     tasks = [
                         self._call_sub_agent(call["agent_name"], call["query"], min_similarity, session_id, messages)
                         for call in agent_calls
                     ]
                     results = await asyncio.gather(*tasks)
-                    
-                    # Process results
-                    for call, (sub_response, sub_sources, sub_query_params) in zip(agent_calls, results):
-                        sub_agent_responses.append({
-                            "agent": call["agent_name"],
-                            "response": sub_response
-                        })
-                        all_sources.extend(sub_sources)
-                        # Merge query params (order agent will have product search params)
-                        query_params.update(sub_query_params)
-                        tool_messages.append({
-                            "role": "tool",
-                            "content": sub_response,
-                            "tool_call_id": call["tool_call"].id
-                        })
                 else:
                     # Execute agents sequentially
+                    results = []
                     for call in agent_calls:
-                        sub_response, sub_sources, sub_query_params = await self._call_sub_agent(
+                        results.append(await self._call_sub_agent(
                             call["agent_name"], call["query"], min_similarity, session_id, messages
-                        )
-                        sub_agent_responses.append({
-                            "agent": call["agent_name"],
-                            "response": sub_response
-                        })
-                        all_sources.extend(sub_sources)
-                        # Merge query params (order agent will have product search params)
-                        query_params.update(sub_query_params)
-                        tool_messages.append({
-                            "role": "tool",
-                            "content": sub_response,
-                            "tool_call_id": call["tool_call"].id
-                        })
+                        ))
+                
+                # Process results
+                for call, (sub_response, sub_sources, sub_query_params) in zip(agent_calls, results):
+                    sub_agent_responses.append({
+                        "agent": call["agent_name"],
+                        "response": sub_response
+                    })
+                    all_sources.extend(sub_sources)
+                    # Merge query params (order agent will have product search params)
+                    query_params.update(sub_query_params)
+                    tool_messages.append({
+                        "role": "tool",
+                        "content": sub_response,
+                        "tool_call_id": call["tool_call"].id
+                    })
                 
                 # Add assistant message with tool_calls to messages for LLM synthesis
                 messages.append({
@@ -321,11 +379,15 @@ class OrchestratorAgent:
                     response_text = final_message.content or ""
             else:
                 # No tool calls - orchestrator responded directly (e.g., for greetings)
-                print(f"[ORCHESTRATOR] Direct response (no routing): {message.content[:100] if message.content else 'None'}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Direct response (no routing): %s", (message.content or "None")[:100])
                 response_text = message.content or ""
                 routing_mode = "direct"
                 # No agents used, no sources
             
+            if not streamed:
+                yield ("token", response_text)
+            
             # Store in memory with only product sources (for product_id retrieval by order agent)
             # Filter to only include sources with product_id (from order agent), exclude handbook sources
             product_sources = []
@@ -335,7 +397,6 @@ class OrchestratorAgent:
                 else:
                     doc = source
                 
-                from langchain_core.documents import Document
                 if isinstance(doc, Document) and doc.metadata.get("product_id"):
                     # Only store product sources (not handbook sources)
                     product_sources.append(source)
@@ -363,10 +424,10 @@ class OrchestratorAgent:
                     )
                 )
             
-            return {
+            yield ("done", {
                 "response": response_text,
                 "routing_mode": routing_mode,
                 "agents_used": list(set(agents_used)) if agents_used else [],
                 "sources": all_sources,
                 "query_params": query_params
-            }
+            })
@@ -1,22 +1,379 @@
 """Order agent using OpenAI function calling."""
 import asyncio
+import logging
+import orjson
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Optional
 from langfuse.openai import AsyncOpenAI
 from langfuse import get_client
-from src.querying.tools.retrieval import get_product_search_function
+from src.querying.tools.retrieval import get_product_search_function, execute_product_search
 from src.querying.tools.order import (
-    get_add_to_cart_function,
-    get_edit_item_in_cart_function,
-    get_remove_from_cart_function,
-    get_view_cart_function,
-    get_shipping_info_function,
-    get_create_shipping_info_function,
-    get_edit_shipping_info_function,
-    get_get_orders_function,
-    get_purchase_function
+    execute_add_to_cart,
+    execute_edit_item_in_cart,
+    execute_remove_from_cart,
+    execute_view_cart,
+    execute_get_shipping_info,
+    execute_create_shipping_info,
+    execute_edit_shipping_info,
+    execute_get_orders,
+    execute_purchase,
+    has_shipping_info,
+    get_order_tool_definitions
 )
-from src.utils.llm import create_chat_completion_with_timeout, run_db_operation_with_timeout
+from src.utils.llm import (
+    DB_TIMEOUT,
+    create_chat_completion_with_timeout,
+    iterate_stream_with_timeout,
+    run_db_operation_with_timeout
+)
+from src.utils.cart import cart_manager
+from src.utils.embedding_cache import embedding_cache, normalize_query
+from src.querying.tools.search_cache import exact_search_cache, product_search_cache
+from src.utils.db_context import turn_db_session, leave_turn_db_session
 from src.config import settings
 
+logger = logging.getLogger(__name__)
+
+# Most recent history messages (last 6 user/assistant turns) forwarded verbatim
+HISTORY_WINDOW_MESSAGES = 12
+# Tool payloads are only kept for the most recent messages of the window
+TOOL_PAYLOAD_MESSAGES = 4
+
+HISTORY_SUMMARY_PROMPT = (
+    "Summarize this shopping conversation in a few short sentences for another assistant. "
+    "Keep product IDs, product names, cart changes, shipping details, order IDs and voucher codes verbatim."
+)
+
+# Rolling summaries of turns that fell out of the history window, keyed by session_id.
+# Each entry is (fingerprint of the summarized messages, summary text).
+session_summary_cache: dict[str, tuple[int, str]] = {}
+_summary_tasks: dict[str, asyncio.Task] = {}
+
+# Tools whose results are already user-ready; when a step only runs these, the result is
+# returned directly instead of paying another chat completion to rephrase it.
+# view_cart and get_shipping_info are deliberately excluded: they are routinely the first
+# step of a longer flow (e.g. "add 2 more" → view_cart → edit_item_in_cart).
+TERMINAL_TOOLS = {"get_orders"}
+
+# search_products filters reported back with the response (besides the query itself)
+SEARCH_PARAM_KEYS = ("category", "brand", "min_price", "max_price", "is_featured")
+
+# Tools that do not change state; consecutive calls to these run concurrently
+READ_ONLY_TOOLS = {"search_products", "view_cart", "get_shipping_info", "get_orders"}
+
+
+def _is_terminal_result(function_name: str, tool_result: str) -> bool:
+    """Check whether a tool result can be returned to the user as-is."""
+    if function_name == "purchase":
+        # Successful (or already placed) purchases return a deterministic confirmation
+        return tool_result.startswith("✅")
+    return function_name in TERMINAL_TOOLS and not tool_result.startswith("Error")
+
+
+def _window_history(conversation_history: list) -> tuple[list, list]:
+    """
+    Split conversation history into older messages and a recent window.
+    
+    Tool calls and tool results outside the last TOOL_PAYLOAD_MESSAGES are dropped
+    from the window; they rarely help the next decision but cost prompt tokens.
+    
+    Args:
+        conversation_history: Previous conversation messages in OpenAI format
+        
+    Returns:
+        Tuple of (older messages to summarize, recent messages to send verbatim)
+    """
+    older = conversation_history[:-HISTORY_WINDOW_MESSAGES]
+    recent = conversation_history[-HISTORY_WINDOW_MESSAGES:]
+    keep_from = len(recent) - TOOL_PAYLOAD_MESSAGES
+    recent = [
+        message for i, message in enumerate(recent)
+        if i >= keep_from or (message.get("role") != "tool" and not message.get("tool_calls"))
+    ]
+    return older, recent
+
+
+def _prune_tool_results(messages: list, start: int, keep_last: int = TOOL_PAYLOAD_MESSAGES):
+    """
+    Shrink older tool results of the current turn before the next chat completion.
+    
+    The last keep_last tool results stay verbatim; older ones are cut down to their first
+    line so long multi-step turns do not resend every search listing on each step.
+    Messages are modified in place.
+    
+    Args:
+        messages: Messages of the chat completion request
+        start: Index of the first message produced during this turn
+        keep_last: Number of most recent tool results to keep verbatim
+    """
+    tool_indices = [i for i in range(start, len(messages)) if messages[i].get("role") == "tool"]
+    if len(tool_indices) <= keep_last:
+        return
+    names = {
+        tool_call["id"]: tool_call["function"]["name"]
+        for message in messages[start:] for tool_call in message.get("tool_calls") or ()
+    }
+    for i in tool_indices[:-keep_last]:
+        message = messages[i]
+        if message["content"].startswith("[truncated"):
+            continue
+        name = names.get(message["tool_call_id"], "tool")
+        first_line = message["content"].split("\n", 1)[0][:200]
+        message["content"] = f"[truncated {name} result] {first_line}"
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """How to execute an order tool through run_db_operation_with_timeout."""
+    fn: Callable[..., str]
+    timeout_error_message: str
+    # (argument name, default) pairs projected from the tool call arguments
+    arg_map: tuple[tuple[str, Any], ...] = ()
+    timeout: float = DB_TIMEOUT
+    # Optional check run before the tool; returns an error message to reject the call
+    pregate: Optional[Callable[[str, dict], Optional[str]]] = None
+
+
+# Purchase hard-gate rejections, mapped to guidance injected for the model's next step
+EMPTY_CART_ERROR = "Error: Your cart is empty. Please add items to your cart before purchasing."
+MISSING_SHIPPING_ERROR = "Error: Please provide shipping information before purchasing. Use create_shipping_info or provide your shipping details."
+MISSING_VOUCHER_ERROR = "Error: Please provide a voucher code to complete your purchase."
+PURCHASE_GATE_GUIDANCE = {
+    EMPTY_CART_ERROR: "The purchase was rejected because the cart is empty. Help the user add items; do not call purchase again this turn.",
+    MISSING_SHIPPING_ERROR: "The purchase was rejected because no shipping information is saved. Ask the user for full name, address, city and zip code; do not call purchase again until it is saved.",
+    MISSING_VOUCHER_ERROR: "The purchase was rejected because no voucher code was given. Ask the user for their voucher code; do not call purchase again without one.",
+}
+
+
+def _purchase_pregate(session_id: str, function_args: dict) -> Optional[str]:
+    """
+    Hard-gate purchase execution on a non-empty cart, saved shipping info and a voucher code.
+    
+    Args:
+        session_id: User session identifier
+        function_args: Parsed purchase tool call arguments
+        
+    Returns:
+        Error message (a key of PURCHASE_GATE_GUIDANCE) if the purchase cannot proceed, otherwise None
+    """
+    # Check cart has items
+    cart = cart_manager.get_cart(session_id)
+    if not cart or len(cart) == 0:
+        return EMPTY_CART_ERROR
+    
+    # Check shipping info exists (cached per session, so retries skip the database)
+    if not has_shipping_info(session_id):
+        return MISSING_SHIPPING_ERROR
+    
+    # Check voucher code provided
+    if not function_args.get("voucher_code"):
+        return MISSING_VOUCHER_ERROR
+    return None
+
+
+# Every tool except search_products, which also returns sources and goes through the search caches
+TOOL_DISPATCH: dict[str, ToolSpec] = {
+    "add_to_cart": ToolSpec(
+        fn=execute_add_to_cart,
+        timeout_error_message="Error: Adding to cart timed out. Please try again.",
+        arg_map=(("product_id", None), ("quantity", 1))
+    ),
+    "edit_item_in_cart": ToolSpec(
+        fn=execute_edit_item_in_cart,
+        timeout_error_message="Error: Updating cart item timed out. Please try again.",
+        arg_map=(("product_id", None), ("quantity", None))
+    ),
+    "remove_from_cart": ToolSpec(
+        fn=execute_remove_from_cart,
+        timeout_error_message="Error: Removing item from cart timed out. Please try again.",
+        arg_map=(("product_id", None),)
+    ),
+    "view_cart": ToolSpec(
+        fn=execute_view_cart,
+        timeout_error_message="Error: Viewing cart timed out. Please try again."
+    ),
+    "get_shipping_info": ToolSpec(
+        fn=execute_get_shipping_info,
+        timeout_error_message="Error: Retrieving shipping information timed out. Please try again."
+    ),
+    "create_shipping_info": ToolSpec(
+        fn=execute_create_shipping_info,
+        timeout_error_message="Error: Saving shipping information timed out. Please try again.",
+        arg_map=(("shipping_data", {}),)
+    ),
+    "edit_shipping_info": ToolSpec(
+        fn=execute_edit_shipping_info,
+        timeout_error_message="Error: Updating shipping information timed out. Please try again.",
+        arg_map=(("shipping_data", {}),)
+    ),
+    "get_orders": ToolSpec(
+        fn=execute_get_orders,
+        timeout=10.0,
+        timeout_error_message="Error: Retrieving orders timed out. Please try again.",
+        arg_map=(("order_id", None),)
+    ),
+    "purchase": ToolSpec(
+        fn=execute_purchase,
+        timeout=15.0,
+        timeout_error_message="Error: Processing purchase timed out. Please try again.",
+        arg_map=(("voucher_code", None),),
+        pregate=_purchase_pregate
+    ),
+}
+
+
+def _loads(arguments: str) -> dict:
+    """Parse tool call arguments (empty arguments mean no arguments)."""
+    return orjson.loads(arguments) if arguments else {}
+
+
+def _canon(value: Any) -> Any:
+    """Convert parsed tool call arguments into a hashable canonical form (sorted dict items, tuples for lists)."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _canon(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return tuple(_canon(item) for item in value)
+    return value
+
+
+def _merge_tool_call_delta(tool_calls: list, delta) -> None:
+    """
+    Merge a streamed tool call fragment into the tool calls assembled so far.
+    
+    Args:
+        tool_calls: Tool call dicts in OpenAI message format, in index order
+        delta: Tool call fragment from a stream chunk
+    """
+    while len(tool_calls) <= delta.index:
+        tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+    tool_call = tool_calls[delta.index]
+    if delta.id:
+        tool_call["id"] = delta.id
+    if delta.function:
+        if delta.function.name:
+            tool_call["function"]["name"] += delta.function.name
+        if delta.function.arguments:
+            tool_call["function"]["arguments"] += delta.function.arguments
+
+
+class _EarlyToolStarter:
+    """
+    Starts read-only tool calls while the model is still streaming the rest of its step.
+    
+    Only a prefix of the step's tool calls is started early: it stops at the first call that
+    changes state, repeats an earlier call or has unparsable arguments, leaving those (and
+    everything after them) to the normal execution path and its checks.
+    """
+    
+    def __init__(self, agent: "OrderAgent", session_id: str, query: str):
+        """
+        Initialize the starter for one step.
+        
+        Args:
+            agent: Agent executing the tools
+            session_id: User session identifier
+            query: Original user query
+        """
+        self.tasks = []
+        self._agent = agent
+        self._session_id = session_id
+        self._query = query
+        self._signatures = set()
+        self._stopped = False
+    
+    def advance(self, tool_calls: list, complete: int):
+        """
+        Start execution of newly completed tool calls.
+        
+        Args:
+            tool_calls: Tool calls assembled so far
+            complete: Number of leading tool calls whose arguments are fully received
+        """
+        while not self._stopped and len(self.tasks) < complete:
+            tool_call = tool_calls[len(self.tasks)]
+            name = tool_call["function"]["name"]
+            try:
+                args = _loads(tool_call["function"]["arguments"])
+            except ValueError:
+                self._stopped = True
+                break
+            signature = (name, _canon(args))
+            if name not in READ_ONLY_TOOLS or signature in self._signatures:
+                self._stopped = True
+                break
+            self._signatures.add(signature)
+            self.tasks.append(asyncio.create_task(
+                self._agent._execute_tool_isolated(name, args, self._session_id, self._query)
+            ))
+    
+    def cancel(self):
+        """
+        Cancel tool calls started early that are still running.
+        
+        Failures of calls that already finished are retrieved, so an abandoned step does not
+        leave "Task exception was never retrieved" warnings behind.
+        """
+        for task in self.tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()
+
+
+async def collect(events: AsyncIterator[tuple]) -> tuple[str, list, dict]:
+    """
+    Collect OrderAgent.invoke_stream events into a full response.
+    
+    A ("discard",) event drops the text collected so far: it was a preamble of a step that
+    went on to call tools, not part of the answer.
+    
+    Args:
+        events: Event stream from OrderAgent.invoke_stream
+        
+    Returns:
+        Tuple of (agent response text, list of source documents, query parameters dict)
+    """
+    parts = []
+    sources, query_params = [], {}
+    async for event in events:
+        if event[0] == "token":
+            parts.append(event[1])
+        elif event[0] == "discard":
+            parts.clear()
+        else:
+            _, sources, query_params = event
+    return ("".join(parts), sources, query_params)
+
+
+# Tool schemas that do not depend on the agent's configuration
+STATIC_TOOLS = get_order_tool_definitions()
+
+SYSTEM_PROMPT = (
+    "You are Shoplytic's Order Agent. Decide the SINGLE NEXT ACTION per turn.\n\n"
+    "RULES:\n"
+    "- Call exactly ONE tool OR ask for missing info\n"
+    "- Never call multiple tools or perform actions without tools\n"
+    "- Never assume state — always check with tools\n"
+    "- Never calculate cart totals yourself — use view_cart\n\n"
+    "Shopping flow: Search → Add to cart → View cart → Shipping info → Purchase\n\n"
+    "Cart quantities:\n"
+    "- 'add X items' to existing: edit_item_in_cart (new_quantity = current + X)\n"
+    "- 'remove X items': edit_item_in_cart (new_quantity = current - X)\n"
+    "- Complete removal: remove_from_cart\n"
+    "- Always check cart with view_cart first\n\n"
+    "Tools:\n"
+    "- search_products: Find products. Filters: price (below/cheap → max_price, above/premium → min_price), category (laptops/phones/watches → Electronics, shoes/clothes → Clothing, headphones → Accessories), brand, featured\n"
+    "- add_to_cart: Add new product (product_id, optional quantity). Only for items NOT in cart\n"
+    "- view_cart: Check cart contents\n"
+    "- edit_item_in_cart: Update quantity\n"
+    "- remove_from_cart: Complete removal only\n"
+    "- get_shipping_info: Check if shipping info exists\n"
+    "- create_shipping_info: Create (requires fullName, address, city, zipCode)\n"
+    "- edit_shipping_info: Update shipping info\n"
+    "- get_orders: Get orders (optional order_id, else 5 most recent)\n"
+    "- purchase: Complete purchase (requires voucher_code)"
+)
+
 
 class OrderAgent:
     """
@@ -38,225 +395,218 @@ class OrderAgent:
         self.min_similarity = min_similarity
         self.vectorstore = vectorstore
         
-        # Define tools
-        self.tools = [
-            get_product_search_function(min_similarity),
-            get_add_to_cart_function(),
-            get_edit_item_in_cart_function(),
-            get_remove_from_cart_function(),
-            get_view_cart_function(),
-            get_shipping_info_function(),
-            get_create_shipping_info_function(),
-            get_edit_shipping_info_function(),
-            get_get_orders_function(),
-            get_purchase_function()
-        ]
+        # Only the search tool depends on min_similarity; the rest are built once at import
+        self.tools = [get_product_search_function(min_similarity), *STATIC_TOOLS]
+        self.system_prompt = SYSTEM_PROMPT
+    
+    def _get_prior_context(self, session_id: str, older: list) -> str | None:
+        """
+        Return the cached summary of older turns, refreshing it in the background when stale.
         
-        self.system_prompt = (
-            "You are Shoplytic's Order Agent. Decide the SINGLE NEXT ACTION per turn.\n\n"
-            "RULES:\n"
-            "- Call exactly ONE tool OR ask for missing info\n"
-            "- Never call multiple tools or perform actions without tools\n"
-            "- Never assume state — always check with tools\n"
-            "- Never calculate cart totals yourself — use view_cart\n\n"
-            "Shopping flow: Search → Add to cart → View cart → Shipping info → Purchase\n\n"
-            "Cart quantities:\n"
-            "- 'add X items' to existing: edit_item_in_cart (new_quantity = current + X)\n"
-            "- 'remove X items': edit_item_in_cart (new_quantity = current - X)\n"
-            "- Complete removal: remove_from_cart\n"
-            "- Always check cart with view_cart first\n\n"
-            "Tools:\n"
-            "- search_products: Find products. Filters: price (below/cheap → max_price, above/premium → min_price), category (laptops/phones/watches → Electronics, shoes/clothes → Clothing, headphones → Accessories), brand, featured\n"
-            "- add_to_cart: Add new product (product_id, optional quantity). Only for items NOT in cart\n"
-            "- view_cart: Check cart contents\n"
-            "- edit_item_in_cart: Update quantity\n"
-            "- remove_from_cart: Complete removal only\n"
-            "- get_shipping_info: Check if shipping info exists\n"
-            "- create_shipping_info: Create (requires fullName, address, city, zipCode)\n"
-            "- edit_shipping_info: Update shipping info\n"
-            "- get_orders: Get orders (optional order_id, else 5 most recent)\n"
-            "- purchase: Complete purchase (requires voucher_code)"
+        The refresh never blocks the current turn: until it finishes, the previous summary
+        (which covers most of the same turns) is used.
+        
+        Args:
+            session_id: User session identifier
+            older: History messages that fell out of the window
+            
+        Returns:
+            Summary text, or None if no summary is available yet
+        """
+        if not older:
+            return None
+        
+        fingerprint = hash(tuple((m.get("role"), m.get("content")) for m in older))
+        cached = session_summary_cache.get(session_id)
+        if (cached is None or cached[0] != fingerprint) and session_id not in _summary_tasks:
+            _summary_tasks[session_id] = asyncio.create_task(
+                self._summarize_history(session_id, fingerprint, older)
+            )
+        return cached[1] if cached else None
+    
+    async def _summarize_history(self, session_id: str, fingerprint: int, older: list):
+        """
+        Summarize older conversation turns and store the result in session_summary_cache.
+        
+        Args:
+            session_id: User session identifier
+            fingerprint: Fingerprint of the messages being summarized
+            older: History messages that fell out of the window
+        """
+        transcript = "\n".join(
+            f"{m['role']}: {m.get('content') or ''}"
+            for m in older if m.get("role") in ("user", "assistant")
         )
+        try:
+            response = await create_chat_completion_with_timeout(
+                client=self.client,
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": HISTORY_SUMMARY_PROMPT},
+                    {"role": "user", "content": transcript}
+                ],
+                max_tokens=200
+            )
+            session_summary_cache[session_id] = (fingerprint, response.choices[0].message.content or "")
+        except Exception as e:
+            logger.warning("Failed to summarize history for session %s: %s", session_id, e)
+        finally:
+            _summary_tasks.pop(session_id, None)
     
-    async def _execute_tool(self, tool_call, session_id: str, query: str) -> tuple[str, list]:
+    async def _execute_tool(self, function_name: str, function_args: dict, session_id: str, query: str) -> tuple[str, list]:
         """
         Execute a single tool call and return result and sources.
         
         Args:
-            tool_call: Tool call object from LLM
+            function_name: Name of the tool to execute
+            function_args: Tool call arguments (parsed once per step by invoke_stream)
             session_id: User session identifier
             query: Original user query
             
         Returns:
             Tuple of (tool_result, sources_list)
         """
-        import json
-        from langchain_core.documents import Document
-        from src.querying.tools.retrieval import execute_product_search
-        from src.querying.tools.order import (
-            execute_add_to_cart,
-            execute_edit_item_in_cart,
-            execute_remove_from_cart,
-            execute_view_cart,
-            execute_get_shipping_info,
-            execute_create_shipping_info,
-            execute_edit_shipping_info,
-            execute_get_orders,
-            execute_purchase
-        )
-        from src.utils.cart import cart_manager
-        from data.database.connection import SessionLocal
-        from data.database.order_models import ShippingInfo
+        if function_name == "search_products":
+            return await self._search_products(function_args, query)
         
-        function_name = tool_call.function.name
-        function_args = json.loads(tool_call.function.arguments)
-        sources = []
+        spec = TOOL_DISPATCH.get(function_name)
+        if spec is None:
+            return (f"Error: Unknown function '{function_name}'", [])
         
-        # Hard-gate purchase execution
-        if function_name == "purchase":
-            # Check cart has items
-            cart = cart_manager.get_cart(session_id)
-            if not cart or len(cart) == 0:
-                return ("Error: Your cart is empty. Please add items to your cart before purchasing.", sources)
-            
-            # Check shipping info exists
-            db = SessionLocal()
+        if spec.pregate is not None:
+            # Pregates may query the database, so they run off the event loop like the tool itself
             try:
-                shipping_info = db.query(ShippingInfo).filter(
-                    ShippingInfo.session_id == session_id
-                ).first()
-                if not shipping_info:
-                    return ("Error: Please provide shipping information before purchasing. Use create_shipping_info or provide your shipping details.", sources)
-            finally:
-                db.close()
+                rejection = await run_db_operation_with_timeout(
+                    spec.pregate,
+                    timeout=spec.timeout,
+                    timeout_error_message=spec.timeout_error_message,
+                    session_id=session_id,
+                    function_args=function_args
+                )
+            except asyncio.TimeoutError as e:
+                return (str(e), [])
+            if rejection:
+                return (rejection, [])
+        
+        kwargs = {name: function_args.get(name, default) for name, default in spec.arg_map}
+        try:
+            tool_result = await run_db_operation_with_timeout(
+                spec.fn,
+                timeout=spec.timeout,
+                timeout_error_message=spec.timeout_error_message,
+                session_id=session_id,
+                **kwargs
+            )
+        except asyncio.TimeoutError as e:
+            tool_result = str(e)
+        return (tool_result, [])
+    
+    async def _search_products(self, function_args: dict, query: str) -> tuple[str, list]:
+        """
+        Execute a search_products tool call, using the embedding and search caches.
+        
+        Args:
+            function_args: Parsed tool call arguments
+            query: Original user query (used when the model omits the search query)
             
-            # Check voucher code provided
-            if not function_args.get("voucher_code"):
-                return ("Error: Please provide a voucher code to complete your purchase.", sources)
+        Returns:
+            Tuple of (tool_result, sources_list)
+        """
+        search_query = function_args.get("query", query)
+        search_kwargs = {
+            "k": function_args.get("k", 3),
+            "category": function_args.get("category"),
+            "brand": function_args.get("brand"),
+            "min_price": function_args.get("min_price"),
+            "max_price": function_args.get("max_price"),
+            "is_featured": function_args.get("is_featured"),
+            "min_similarity": self.min_similarity
+        }
+        filter_key = tuple(search_kwargs.values())
         
-        # Execute tool
-        if function_name == "search_products":
-            search_query = function_args.get("query", query)
+        # Identical searches skip the embedding lookup too
+        exact_key = (normalize_query(search_query), filter_key)
+        cached = exact_search_cache.get(exact_key)
+        if cached is not None:
+            tool_result, docs_with_similarity = cached
+            return (tool_result, list(docs_with_similarity))
+        
+        # Reuse the embedding prefetched at the start of the turn when the query matches
+        embedding = None
+        embedder = getattr(self.vectorstore, "embeddings", None)
+        if embedder is not None:
+            try:
+                embedding = await asyncio.wait_for(
+                    embedding_cache.get_or_embed_async(search_query, embedder),
+                    timeout=15.0
+                )
+            except Exception as e:
+                logger.warning("Query embedding failed, searching without it: %s", e)
+        
+        cached = product_search_cache.get(embedding, filter_key) if embedding is not None else None
+        if cached is not None:
+            tool_result, docs_with_similarity = cached
+        else:
             try:
                 tool_result, docs_with_similarity = await run_db_operation_with_timeout(
                     execute_product_search,
                     timeout=15.0,
                     timeout_error_message="Error: Product search timed out. Please try again.",
                     query=search_query,
-                    k=function_args.get("k", 3),
-                    category=function_args.get("category"),
-                    brand=function_args.get("brand"),
-                    min_price=function_args.get("min_price"),
-                    max_price=function_args.get("max_price"),
-                    is_featured=function_args.get("is_featured"),
-                    min_similarity=self.min_similarity,
-                    vectorstore=self.vectorstore
-                )
-                sources.extend(docs_with_similarity)
-            except asyncio.TimeoutError as e:
-                tool_result = str(e)
-        elif function_name == "add_to_cart":
-            try:
-                tool_result = await run_db_operation_with_timeout(
-                    execute_add_to_cart,
-                    timeout_error_message="Error: Adding to cart timed out. Please try again.",
-                    session_id=session_id,
-                    product_id=function_args.get("product_id"),
-                    quantity=function_args.get("quantity", 1)
-                )
-            except asyncio.TimeoutError as e:
-                tool_result = str(e)
-        elif function_name == "edit_item_in_cart":
-            try:
-                tool_result = await run_db_operation_with_timeout(
-                    execute_edit_item_in_cart,
-                    timeout_error_message="Error: Updating cart item timed out. Please try again.",
-                    session_id=session_id,
-                    product_id=function_args.get("product_id"),
-                    quantity=function_args.get("quantity")
-                )
-            except asyncio.TimeoutError as e:
-                tool_result = str(e)
-        elif function_name == "remove_from_cart":
-            try:
-                tool_result = await run_db_operation_with_timeout(
-                    execute_remove_from_cart,
-                    timeout_error_message="Error: Removing item from cart timed out. Please try again.",
-                    session_id=session_id,
-                    product_id=function_args.get("product_id")
-                )
-            except asyncio.TimeoutError as e:
-                tool_result = str(e)
-        elif function_name == "view_cart":
-            try:
-                tool_result = await run_db_operation_with_timeout(
-                    execute_view_cart,
-                    timeout_error_message="Error: Viewing cart timed out. Please try again.",
-                    session_id=session_id
-                )
-            except asyncio.TimeoutError as e:
-                tool_result = str(e)
-        elif function_name == "get_shipping_info":
-            try:
-                tool_result = await run_db_operation_with_timeout(
-                    execute_get_shipping_info,
-                    timeout_error_message="Error: Retrieving shipping information timed out. Please try again.",
-                    session_id=session_id
-                )
-            except asyncio.TimeoutError as e:
-                tool_result = str(e)
-        elif function_name == "create_shipping_info":
-            try:
-                shipping_data = function_args.get("shipping_data", {})
-                tool_result = await run_db_operation_with_timeout(
-                    execute_create_shipping_info,
-                    timeout_error_message="Error: Saving shipping information timed out. Please try again.",
-                    session_id=session_id,
-                    shipping_data=shipping_data
-                )
-            except asyncio.TimeoutError as e:
-                tool_result = str(e)
-        elif function_name == "edit_shipping_info":
-            try:
-                shipping_data = function_args.get("shipping_data", {})
-                tool_result = await run_db_operation_with_timeout(
-                    execute_edit_shipping_info,
-                    timeout_error_message="Error: Updating shipping information timed out. Please try again.",
-                    session_id=session_id,
-                    shipping_data=shipping_data
-                )
-            except asyncio.TimeoutError as e:
-                tool_result = str(e)
-        elif function_name == "get_orders":
-            try:
-                tool_result = await run_db_operation_with_timeout(
-                    execute_get_orders,
-                    timeout=10.0,
-                    timeout_error_message="Error: Retrieving orders timed out. Please try again.",
-                    session_id=session_id,
-                    order_id=function_args.get("order_id")
-                )
-            except asyncio.TimeoutError as e:
-                tool_result = str(e)
-        elif function_name == "purchase":
-            try:
-                tool_result = await run_db_operation_with_timeout(
-                    execute_purchase,
-                    timeout=15.0,
-                    timeout_error_message="Error: Processing purchase timed out. Please try again.",
-                    session_id=session_id,
-                    voucher_code=function_args.get("voucher_code")
+                    vectorstore=self.vectorstore,
+                    embedding=embedding,
+                    **search_kwargs
                 )
             except asyncio.TimeoutError as e:
-                tool_result = str(e)
-        else:
-            tool_result = f"Error: Unknown function '{function_name}'"
+                return (str(e), [])
+            if embedding is not None:
+                product_search_cache.put(embedding, filter_key, (tool_result, docs_with_similarity))
+        exact_search_cache[exact_key] = (tool_result, docs_with_similarity)
+        return (tool_result, list(docs_with_similarity))
+    
+    async def _execute_tool_calls(self, calls: list[tuple[str, dict]], session_id: str, query: str) -> list[tuple[str, list]]:
+        """
+        Execute a step's tool calls, running consecutive read-only calls concurrently.
         
-        return (tool_result, sources)
+        State-changing tools act as barriers and run one at a time, so every call still
+        observes the effects of the calls the model placed before it.
+        
+        Args:
+            calls: (function name, parsed arguments) pairs, in the order the model produced them
+            session_id: User session identifier
+            query: Original user query
+            
+        Returns:
+            List of (tool_result, sources_list), in the same order as calls
+        """
+        results = []
+        batch = []
+        for function_name, function_args in calls:
+            if function_name in READ_ONLY_TOOLS:
+                batch.append((function_name, function_args))
+                continue
+            results.extend(await self._execute_read_only_batch(batch, session_id, query))
+            batch = []
+            results.append(await self._execute_tool(function_name, function_args, session_id, query))
+        results.extend(await self._execute_read_only_batch(batch, session_id, query))
+        return results
+    
+    async def _execute_read_only_batch(self, calls: list[tuple[str, dict]], session_id: str, query: str) -> list[tuple[str, list]]:
+        """Execute read-only tool calls concurrently (sequentially when there is only one)."""
+        if len(calls) <= 1:
+            return [await self._execute_tool(name, args, session_id, query) for name, args in calls]
+        return await asyncio.gather(
+            *(self._execute_tool_isolated(name, args, session_id, query) for name, args in calls)
+        )
+    
+    async def _execute_tool_isolated(self, function_name: str, function_args: dict, session_id: str, query: str) -> tuple[str, list]:
+        """Execute a tool in its own task without the shared turn session (Sessions are not thread-safe)."""
+        leave_turn_db_session()
+        return await self._execute_tool(function_name, function_args, session_id, query)
     
     async def invoke(self, query: str, session_id: str, conversation_history: list = None) -> tuple[str, list, dict]:
         """
-        Process a query using the order agent with loop-based execution.
+        Process a query using the order agent and return the complete response.
         
         Args:
             query: User's question or query
@@ -266,111 +616,210 @@ class OrderAgent:
         Returns:
             Tuple of (agent response text, list of source documents, query parameters dict)
         """
-        from langchain_core.documents import Document
-        import json
+        return await collect(self.invoke_stream(query, session_id, conversation_history))
+    
+    async def invoke_stream(self, query: str, session_id: str, conversation_history: list = None) -> AsyncIterator[tuple]:
+        """
+        Process a query using the order agent with loop-based execution, streaming the answer.
         
+        Every step is requested with stream=True: a step only turns out to be the final answer
+        once its first delta arrives, and tool-call steps are assembled from their deltas (and
+        start read-only tools early). The /user/query/stream route relays the answer tokens.
+        
+        Args:
+            query: User's question or query
+            session_id: User session identifier for cart management
+            conversation_history: Previous conversation messages (includes product_ids from previous searches)
+            
+        Yields:
+            ("token", text) events as the response is produced, then a single
+            ("done", sources, query_params) event. Text streamed in a step is only known to be
+            the answer once the step ends without tool calls; if it turns out to be a preamble
+            (or the step times out), a ("discard",) event retracts all text streamed so far.
+        """
         langfuse = get_client()
 
         # Build messages with conversation history if provided
+        # Only a window of recent turns is sent verbatim; older turns are replaced by a summary
         messages = [{"role": "system", "content": self.system_prompt}]
         if conversation_history:
-            messages.extend(conversation_history)
+            older, recent = _window_history(conversation_history)
+            prior_context = self._get_prior_context(session_id, older)
+            if prior_context:
+                messages.append({"role": "system", "content": f"Prior context: {prior_context}"})
+            messages.extend(recent)
         messages.append({"role": "user", "content": query})
+        turn_start = len(messages)
         
         sources = []
         query_params = {}  # Track query parameters used in search_products
+        attempted_purchase_reasons = set()  # Purchase gate rejections already seen this turn
+        
+        # The LLM usually searches with the user's own wording, so start embedding it now
+        # to overlap the embedding round trip with the first chat completion
+        embedder = getattr(self.vectorstore, "embeddings", None)
+        if embedder is not None:
+            embedding_cache.prefetch(query, embedder)
         
         with langfuse.start_as_current_observation(
             as_type="span",
             name="order-agent",
             input={"query": query, "session_id": session_id}
         ) as agent_span:
-            # Loop until completion (max 6 steps for safety)
-            for step in range(6):
-                try:
-                    response = await create_chat_completion_with_timeout(
-                        client=self.client,
-                        model=self.model,
-                        messages=messages,
-                        tools=self.tools,
-                        tool_choice="auto",
-                        max_tokens=settings.llm_max_tokens_agent
-                    )
-                except asyncio.TimeoutError:
-                    agent_span.update(output={"error": "timeout", "steps_completed": step})
-                    return ("I apologize, but the request took too long to process. Please try again.", sources, query_params)
+            # Span output is collected locally and sent once when the turn ends
+            turn_stats = {"steps_completed": 0}
+            try:
+                # Loop until completion (max 6 steps for safety)
+                for step in range(6):
+                    turn_stats["steps_completed"] = step
+                    content_parts = []
+                    tool_calls = []
+                    streamed = False  # Whether this step's text has been yielded as tokens
+                    early = _EarlyToolStarter(self, session_id, query)
+                    try:
+                        _prune_tool_results(messages, turn_start)
+                        try:
+                            stream = await create_chat_completion_with_timeout(
+                                client=self.client,
+                                model=self.model,
+                                messages=messages,
+                                tools=self.tools,
+                                tool_choice="auto",
+                                max_tokens=settings.llm_max_tokens_agent,
+                                stream=True,
+                                # The final chunk reports token usage, which the traced generation records
+                                stream_options={"include_usage": True}
+                            )
+                            async for chunk in iterate_stream_with_timeout(stream):
+                                if not chunk.choices:
+                                    continue
+                                delta = chunk.choices[0].delta
+                                if delta.tool_calls:
+                                    for tool_call_delta in delta.tool_calls:
+                                        _merge_tool_call_delta(tool_calls, tool_call_delta)
+                                    # Every tool call before the last one is complete
+                                    early.advance(tool_calls, len(tool_calls) - 1)
+                                if delta.content:
+                                    content_parts.append(delta.content)
+                                    # Text is only the answer while no tool call has started
+                                    if not tool_calls:
+                                        streamed = True
+                                        yield ("token", delta.content)
+                        except asyncio.TimeoutError:
+                            turn_stats["error"] = "timeout"
+                            if streamed:
+                                yield ("discard",)
+                            yield ("token", "I apologize, but the request took too long to process. Please try again.")
+                            yield ("done", sources, query_params)
+                            return
                 
-                message = response.choices[0].message
+                        content = "".join(content_parts)
                 
-                # Log tool calls
-                if message.tool_calls:
-                    print(f"[ORDER AGENT] Step {step+1}: Tool calls returned: {len(message.tool_calls)}")
-                    for i, tc in enumerate(message.tool_calls):
-                        args = json.loads(tc.function.arguments) if tc.function.arguments else {}
-                        print(f"  Tool call #{i+1}: {tc.function.name} with args: {args}, tool_call_id: {tc.id}")
-                else:
-                    print(f"[ORDER AGENT] Step {step+1}: No tool calls returned, content: {message.content[:100] if message.content else 'None'}")
+                        # Log tool calls (debug only: this runs on every step)
+                        if logger.isEnabledFor(logging.DEBUG):
+                            if tool_calls:
+                                logger.debug("Step %d: %d tool call(s) returned", step + 1, len(tool_calls))
+                                for i, tc in enumerate(tool_calls):
+                                    logger.debug(
+                                        "  Tool call #%d: %s with args: %s, tool_call_id: %s",
+                                        i + 1, tc["function"]["name"], tc["function"]["arguments"], tc["id"]
+                                    )
+                            else:
+                                logger.debug("Step %d: no tool calls returned, content: %s", step + 1, (content or "None")[:100])
                 
-                # 1️⃣ If no tool call → we're done
-                if not message.tool_calls:
-                    agent_span.update(output={"response": (message.content or "")[:500], "steps_completed": step + 1})
-                    return (message.content or "", sources, query_params)
-
-                # 2️⃣ Enforce: no duplicate tool calls with identical signature (function + args)
-                signatures = set()
-                for tc in message.tool_calls:
-                    args = json.loads(tc.function.arguments) if tc.function.arguments else {}
-                    key = (tc.function.name, json.dumps(args, sort_keys=True))
-                    if key in signatures:
-                        agent_span.update(output={"error": "duplicate_tool_calls", "tool": tc.function.name})
-                        raise RuntimeError(
-                            f"OrderAgent violated rule: duplicate tool calls with same args: {tc.function.name}"
-                        )
-                    signatures.add(key)
-
-                # Assistant message with ALL tool calls
-                messages.append({
-                    "role": "assistant",
-                    "content": message.content,
-                    "tool_calls": [
-                        {
-                            "id": tc.id,
-                            "type": "function",
-                            "function": {
-                                "name": tc.function.name,
-                                "arguments": tc.function.arguments
-                            }
-                        } for tc in message.tool_calls
-                    ]
-                })
-
-                # 3️⃣ Execute each tool call
-                for tool_call in message.tool_calls:
-                    # Capture query params for search_products
-                    if tool_call.function.name == "search_products":
-                        function_args = json.loads(tool_call.function.arguments)
-                        search_query = function_args.get("query", query)
-                        query_params["query"] = search_query
-                        if function_args.get("category"):
-                            query_params["category"] = function_args.get("category")
-                        if function_args.get("brand"):
-                            query_params["brand"] = function_args.get("brand")
-                        if function_args.get("min_price") is not None:
-                            query_params["min_price"] = function_args.get("min_price")
-                        if function_args.get("max_price") is not None:
-                            query_params["max_price"] = function_args.get("max_price")
-                        if function_args.get("is_featured") is not None:
-                            query_params["is_featured"] = function_args.get("is_featured")
-
-                    tool_result, tool_sources = await self._execute_tool(tool_call, session_id, query)
-                    sources.extend(tool_sources)
-
-                    messages.append({
-                        "role": "tool",
-                        "content": tool_result,
-                        "tool_call_id": tool_call.id
-                    })
+                        # 1️⃣ If no tool call → we're done (the answer has already been streamed)
+                        if not tool_calls:
+                            turn_stats.update(response=content[:500], steps_completed=step + 1)
+                            yield ("done", sources, query_params)
+                            return
+
+                        # Text streamed before the first tool call was a preamble, not the answer
+                        if streamed:
+                            yield ("discard",)
+
+                        # Parse each tool call's arguments once for the rest of the step
+                        calls = [(tc["function"]["name"], _loads(tc["function"]["arguments"])) for tc in tool_calls]
+
+                        # 2️⃣ Enforce: no duplicate tool calls with identical signature (function + args)
+                        signatures = set()
+                        for name, args in calls:
+                            key = (name, _canon(args))
+                            if key in signatures:
+                                turn_stats.update(error="duplicate_tool_calls", tool=name)
+                                raise RuntimeError(
+                                    f"OrderAgent violated rule: duplicate tool calls with same args: {name}"
+                                )
+                            signatures.add(key)
+
+                        # Assistant message with ALL tool calls (already assembled in request format)
+                        assistant_message = {"role": "assistant", "tool_calls": tool_calls}
+                        if content:
+                            assistant_message["content"] = content
+                        messages.append(assistant_message)
+
+                        # Embed every search query of this step in one request
+                        if embedder is not None:
+                            search_queries = [
+                                args.get("query", query) for name, args in calls if name == "search_products"
+                            ]
+                            if len(search_queries) > 1:
+                                embedding_cache.prefetch_many(search_queries, embedder)
+
+                        # Capture query params for search_products
+                        for function_name, function_args in calls:
+                            if function_name == "search_products":
+                                query_params["query"] = function_args.get("query", query)
+                                query_params.update(
+                                    (key, value) for key in SEARCH_PARAM_KEYS
+                                    if (value := function_args.get(key)) not in (None, "")
+                                )
+
+                        # 3️⃣ Execute the tool calls
+                        # Tool calls started while streaming come first; the rest share one database session
+                        results = list(await asyncio.gather(*early.tasks))
+                        async with turn_db_session():
+                            results.extend(await self._execute_tool_calls(calls[len(results):], session_id, query))
+                    finally:
+                        # Stop early-started tool calls the step did not wait for (API error, duplicate
+                        # rejection, timeout, the consumer closing the stream, or a sibling failing
+                        # inside gather); once gathered successfully they are all done and retrieved
+                        early.cancel()
+
+                    # Tool messages follow the order the model produced the calls in
+                    tool_results = []
+                    for tool_call, (tool_result, tool_sources) in zip(tool_calls, results):
+                        sources.extend(tool_sources)
+                        tool_results.append((tool_call["function"]["name"], tool_result))
+                        messages.append({
+                            "role": "tool",
+                            "content": tool_result,
+                            "tool_call_id": tool_call["id"]
+                        })
+
+                    # Purchase rejected by the hard-gate: tell the model exactly what is missing, and
+                    # if it repeats the same rejected purchase, answer directly instead of looping
+                    for name, result in tool_results:
+                        if name != "purchase" or result not in PURCHASE_GATE_GUIDANCE:
+                            continue
+                        if result in attempted_purchase_reasons:
+                            turn_stats.update(error="repeated_purchase_rejection", steps_completed=step + 1)
+                            yield ("token", result.removeprefix("Error: "))
+                            yield ("done", sources, query_params)
+                            return
+                        attempted_purchase_reasons.add(result)
+                        messages.append({"role": "system", "content": PURCHASE_GATE_GUIDANCE[result]})
+
+                    # 4️⃣ Terminal tools already produced the answer → skip the follow-up LLM call
+                    if all(_is_terminal_result(name, result) for name, result in tool_results):
+                        response_text = "\n\n".join(result for _, result in tool_results)
+                        turn_stats.update(response=response_text[:500], steps_completed=step + 1)
+                        yield ("token", response_text)
+                        yield ("done", sources, query_params)
+                        return
             
-            # If we've exhausted steps
-            agent_span.update(output={"error": "max_steps_exceeded", "steps_completed": 6})
-            return ("I apologize, but the request took too many steps to complete. Please try again.", sources, query_params)
+                # If we've exhausted steps
+                turn_stats.update(error="max_steps_exceeded", steps_completed=6)
+                yield ("token", "I apologize, but the request took too many steps to complete. Please try again.")
+                yield ("done", sources, query_params)
+            finally:
+                agent_span.update(output=turn_stats)
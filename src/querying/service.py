@@ -1,5 +1,5 @@
 """Query service that manages the orchestrator agent with memory."""
-from typing import Optional
+from typing import AsyncIterator, Optional
 from src.querying.agents.orchestrator import OrchestratorAgent
 from src.utils.memory import ConversationMemory
 from src.config import settings
@@ -56,3 +56,31 @@ class QueryService:
         )
         
         return result
+    
+    async def query_stream(
+        self,
+        user_query: str,
+        session_id: str,
+        min_similarity: Optional[float] = None
+    ) -> AsyncIterator[tuple]:
+        """
+        Process a user query through the multi-agent system, streaming the answer.
+        
+        Args:
+            user_query: The user's question or request
+            session_id: Session identifier for maintaining conversation context
+            min_similarity: Optional minimum similarity score threshold
+                           (default: from config)
+            
+        Yields:
+            Events of OrchestratorAgent.invoke_stream; the final ("done", result) event
+            carries the dictionary query returns
+        """
+        min_sim = min_similarity if min_similarity is not None else settings.default_similarity_threshold
+        
+        async for event in self.orchestrator.invoke_stream(
+            query=user_query,
+            session_id=session_id,
+            min_similarity=min_sim
+        ):
+            yield event
@@ -13,6 +13,7 @@ from .order import (
         get_shipping_info_function,
         get_create_shipping_info_function,
         get_purchase_function,
+        get_order_tool_definitions,
         execute_add_to_cart,
         execute_edit_item_in_cart,
         execute_remove_from_cart,
@@ -34,6 +35,7 @@ __all__ = [
     "get_shipping_info_function",
     "get_create_shipping_info_function",
     "get_purchase_function",
+    "get_order_tool_definitions",
     "execute_add_to_cart",
     "execute_edit_item_in_cart",
     "execute_remove_from_cart",
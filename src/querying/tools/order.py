@@ -1,15 +1,161 @@
 """Order management tools using OpenAI function calling."""
-import json
+import threading
 from datetime import datetime
-from typing import Dict, Any, Optional
-from sqlalchemy.orm import joinedload
-from data.database.connection import SessionLocal
+from functools import lru_cache
+from typing import Dict, Any, NamedTuple, Optional
+from cachetools import TTLCache
+from pydantic import ValidationError
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from src.utils.db_context import get_tool_db, release_tool_db
 from data.database.product_model import Product
 from data.database.order_models import Order, OrderItem, Voucher, ShippingInfo
-from data.database.shipping_schema import ShippingInfoCreate
+from data.database.shipping_schema import ShippingInfoCreate, ShippingInfoUpdate
 from src.utils.cart import cart_manager
+from src.utils.catalog_version import bump_catalog_version
 
+def _format_timestamp(value: datetime) -> str:
+    """Format a timestamp as 'YYYY-MM-DD HH:MM:SS' (isoformat is much cheaper than strftime)."""
+    return value.replace(tzinfo=None).isoformat(sep=" ", timespec="seconds")
 
+
+class ProductSnapshot(NamedTuple):
+    """Product fields needed to add it to a cart."""
+    name: str
+    price: float
+    is_active: bool
+    stock_quantity: int
+    primary_image: Optional[str]
+
+
+# product_id -> ProductSnapshot. Admin edits and purchases drop the products they change
+# (see invalidate_product_cache); the TTL bounds staleness after direct database edits.
+_product_cache: TTLCache = TTLCache(maxsize=4096, ttl=60)
+_product_cache_lock = threading.Lock()
+
+
+def get_product_snapshot(product_id: int) -> Optional[ProductSnapshot]:
+    """
+    Get the cart-relevant fields of a product, using a short-lived cache.
+    
+    Args:
+        product_id: Product ID
+        
+    Returns:
+        Product fields, or None if the product does not exist
+    """
+    with _product_cache_lock:
+        cached = _product_cache.get(product_id)
+    if cached is not None:
+        return cached
+    
+    db = get_tool_db()
+    try:
+        row = db.execute(
+            select(Product.name, Product.price, Product.is_active, Product.stock_quantity, Product.primary_image)
+            .where(Product.id == product_id)
+        ).first()
+    finally:
+        release_tool_db(db)
+    if row is None:
+        return None
+    
+    snapshot = ProductSnapshot(row.name, float(row.price), row.is_active, row.stock_quantity, row.primary_image)
+    with _product_cache_lock:
+        _product_cache[product_id] = snapshot
+    return snapshot
+
+
+def invalidate_product_cache(product_id: int):
+    """
+    Drop a product from the cache after it was changed.
+    
+    Args:
+        product_id: Product ID
+    """
+    with _product_cache_lock:
+        _product_cache.pop(product_id, None)
+
+
+# Negative cache of voucher codes that were not found. Only misses are cached: existing
+# vouchers change state (is_used) and are always read from the database.
+_missing_vouchers: TTLCache = TTLCache(maxsize=1024, ttl=5)
+_missing_vouchers_lock = threading.Lock()
+
+# Display names of shipping fields, in the order they are reported
+SHIPPING_FIELD_LABELS = {"full_name": "Full Name", "address": "Address", "city": "City", "zip_code": "Zip Code"}
+
+
+class ShippingSnapshot(NamedTuple):
+    """Saved shipping details of a session."""
+    full_name: str
+    address: str
+    city: str
+    zip_code: str
+
+
+# session_id -> ShippingSnapshot, or None when the session has no shipping info. Shipping
+# info is only written through the tools below, which keep this in sync; the TTL bounds
+# staleness from any other writer. TTLCache is not thread-safe and tools run in worker
+# threads, hence the lock.
+_shipping_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+_shipping_cache_lock = threading.Lock()
+_NOT_CACHED = object()
+
+
+def get_shipping_snapshot(session_id: str) -> Optional[ShippingSnapshot]:
+    """
+    Get the saved shipping details of a session, using a short-lived cache.
+    
+    Args:
+        session_id: User session identifier
+        
+    Returns:
+        Shipping details, or None if the session has none
+    """
+    with _shipping_cache_lock:
+        cached = _shipping_cache.get(session_id, _NOT_CACHED)
+    if cached is not _NOT_CACHED:
+        return cached
+    
+    db = get_tool_db()
+    try:
+        row = db.execute(
+            select(ShippingInfo.full_name, ShippingInfo.address, ShippingInfo.city, ShippingInfo.zip_code)
+            .where(ShippingInfo.session_id == session_id)
+            .limit(1)
+        ).first()
+    finally:
+        release_tool_db(db)
+    
+    snapshot = ShippingSnapshot(*row) if row else None
+    with _shipping_cache_lock:
+        _shipping_cache[session_id] = snapshot
+    return snapshot
+
+
+def has_shipping_info(session_id: str) -> bool:
+    """
+    Check whether a session has saved shipping information, using a short-lived cache.
+    
+    Args:
+        session_id: User session identifier
+        
+    Returns:
+        True if shipping information exists for the session
+    """
+    return get_shipping_snapshot(session_id) is not None
+
+
+def _store_shipping_snapshot(session_id: str, details: Any):
+    """Record the shipping details (full_name, address, city, zip_code attributes) a session has just saved."""
+    snapshot = ShippingSnapshot(details.full_name, details.address, details.city, details.zip_code)
+    with _shipping_cache_lock:
+        _shipping_cache[session_id] = snapshot
+
+
+@lru_cache(maxsize=None)
 def get_add_to_cart_function() -> Dict[str, Any]:
     """
     Get OpenAI function definition for adding items to cart.
@@ -53,37 +199,33 @@ def execute_add_to_cart(session_id: str, product_id: int, quantity: int = 1) ->
     Returns:
         Result message
     """
-    db = SessionLocal()
-    try:
-        # Fetch product details
-        product = db.query(Product).filter(Product.id == product_id).first()
-        if not product:
-            return f"Error: Product with ID {product_id} not found."
-        
-        if not product.is_active:
-            return f"Error: Product '{product.name}' is not available for purchase."
-        
-        if product.stock_quantity < quantity:
-            return f"Error: Insufficient stock. Only {product.stock_quantity} available for '{product.name}'."
-        
-        # Add to cart
-        result = cart_manager.add_to_cart(
-            session_id=session_id,
-            product_id=product_id,
-            product_name=product.name,
-            quantity=quantity,
-            unit_price=float(product.price),
-            primary_image=product.primary_image
-        )
-        
-        if result["success"]:
-            return result["message"] + f" Cart total: ${result['cart_total']:.2f}"
-        else:
-            return result["message"]
-    finally:
-        db.close()
+    product = get_product_snapshot(product_id)
+    if not product:
+        return f"Error: Product with ID {product_id} not found."
+    
+    if not product.is_active:
+        return f"Error: Product '{product.name}' is not available for purchase."
+    
+    if product.stock_quantity < quantity:
+        return f"Error: Insufficient stock. Only {product.stock_quantity} available for '{product.name}'."
+    
+    # Add to cart
+    result = cart_manager.add_to_cart(
+        session_id=session_id,
+        product_id=product_id,
+        product_name=product.name,
+        quantity=quantity,
+        unit_price=product.price,
+        primary_image=product.primary_image
+    )
+    
+    if result["success"]:
+        return result["message"] + f" Cart total: ${result['cart_total']:.2f}"
+    else:
+        return result["message"]
 
 
+@lru_cache(maxsize=None)
 def get_edit_item_in_cart_function() -> Dict[str, Any]:
     """
     Get OpenAI function definition for editing item quantity in cart.
@@ -138,6 +280,7 @@ def execute_edit_item_in_cart(session_id: str, product_id: int, quantity: int) -
         return result["message"]
 
 
+@lru_cache(maxsize=None)
 def get_remove_from_cart_function() -> Dict[str, Any]:
     """
     Get OpenAI function definition for removing items from cart.
@@ -186,6 +329,7 @@ def execute_remove_from_cart(session_id: str, product_id: int) -> str:
         return result["message"]
 
 
+@lru_cache(maxsize=None)
 def get_view_cart_function() -> Dict[str, Any]:
     """
     Get OpenAI function definition for viewing cart.
@@ -224,19 +368,17 @@ def execute_view_cart(session_id: str) -> str:
     
     # Format cart display
     lines = ["Your Shopping Cart:", ""]
-    for item in summary["items"]:
-        lines.append(
-            f"• {item['product_name']} (ID: {item['product_id']})\n"
-            f"  Quantity: {item['quantity']} × ${item['unit_price']:.2f} = ${item['subtotal']:.2f}"
-        )
-    
-    lines.append("")
-    lines.append(f"Total: {summary['total_formatted']}")
-    lines.append(f"Items in cart: {summary['item_count']}")
+    lines.extend(
+        f"• {item['product_name']} (ID: {item['product_id']})\n"
+        f"  Quantity: {item['quantity']} × ${item['unit_price']:.2f} = ${item['subtotal']:.2f}"
+        for item in summary["items"]
+    )
+    lines.extend(("", f"Total: {summary['total_formatted']}", f"Items in cart: {summary['item_count']}"))
     
     return "\n".join(lines)
 
 
+@lru_cache(maxsize=None)
 def get_shipping_info_function() -> Dict[str, Any]:
     """
     Get OpenAI function definition for retrieving shipping information.
@@ -268,11 +410,8 @@ def execute_get_shipping_info(session_id: str) -> str:
     Returns:
         Shipping info result message
     """
-    db = SessionLocal()
     try:
-        shipping_info = db.query(ShippingInfo).filter(
-            ShippingInfo.session_id == session_id
-        ).first()
+        shipping_info = get_shipping_snapshot(session_id)
         
         if shipping_info:
             return (
@@ -290,10 +429,9 @@ def execute_get_shipping_info(session_id: str) -> str:
             )
     except Exception as e:
         return f"Error retrieving shipping information: {str(e)}"
-    finally:
-        db.close()
 
 
+@lru_cache(maxsize=None)
 def get_create_shipping_info_function() -> Dict[str, Any]:
     """
     Get OpenAI function definition for creating shipping information.
@@ -350,7 +488,7 @@ def execute_create_shipping_info(session_id: str, shipping_data: Dict[str, str])
     Returns:
         Creation result message
     """
-    db = SessionLocal()
+    db = get_tool_db()
     try:
         # Validate using Pydantic schema
         try:
@@ -388,6 +526,7 @@ def execute_create_shipping_info(session_id: str, shipping_data: Dict[str, str])
             message = "Shipping information saved successfully!"
         
         db.commit()
+        _store_shipping_snapshot(session_id, shipping_create)
         
         return (
             f"{message}\n"
@@ -401,9 +540,10 @@ def execute_create_shipping_info(session_id: str, shipping_data: Dict[str, str])
         db.rollback()
         return f"Error saving shipping information: {str(e)}"
     finally:
-        db.close()
+        release_tool_db(db)
 
 
+@lru_cache(maxsize=None)
 def get_edit_shipping_info_function() -> Dict[str, Any]:
     """
     Get OpenAI function definition for editing shipping information.
@@ -449,6 +589,28 @@ def get_edit_shipping_info_function() -> Dict[str, Any]:
     }
 
 
+def _shipping_update_error(error: ValidationError) -> str:
+    """
+    Describe the first invalid field of a ShippingInfoUpdate in one line.
+    
+    Args:
+        error: Validation error raised by ShippingInfoUpdate
+        
+    Returns:
+        Error message naming the field and the broken constraint
+    """
+    first = error.errors()[0]
+    label = SHIPPING_FIELD_LABELS.get(first["loc"][0] if first["loc"] else None)
+    if label is None:
+        return "Error: Invalid shipping information."
+    label = label.capitalize()
+    if first["type"] == "string_too_long":
+        return f"Error: {label} must be {first['ctx']['max_length']} characters or less."
+    if first["type"] == "string_type":
+        return f"Error: {label} must be text."
+    return f"Error: {label} cannot be empty."
+
+
 def execute_edit_shipping_info(session_id: str, shipping_data: Dict[str, str]) -> str:
     """
     Execute editing shipping information with partial updates.
@@ -460,7 +622,22 @@ def execute_edit_shipping_info(session_id: str, shipping_data: Dict[str, str]) -
     Returns:
         Update result message
     """
-    db = SessionLocal()
+    # Validate the provided fields up front (empty values mean "leave unchanged")
+    try:
+        shipping_update = ShippingInfoUpdate(
+            full_name=shipping_data.get("fullName") or None,
+            address=shipping_data.get("address") or None,
+            city=shipping_data.get("city") or None,
+            zip_code=shipping_data.get("zipCode") or None
+        )
+    except ValidationError as e:
+        return _shipping_update_error(e)
+    
+    updates = shipping_update.model_dump(exclude_none=True)
+    if not updates:
+        return "Error: No valid fields provided to update. Please specify at least one field: fullName, address, city, or zipCode."
+    
+    db = get_tool_db()
     try:
         # Check if shipping info exists
         existing = db.query(ShippingInfo).filter(
@@ -473,51 +650,14 @@ def execute_edit_shipping_info(session_id: str, shipping_data: Dict[str, str]) -
                 "Please use create_shipping_info first to create your shipping information."
             )
         
-        # Track which fields are being updated
-        updated_fields = []
-        
-        # Update only provided fields with validation
-        if "fullName" in shipping_data and shipping_data["fullName"]:
-            full_name = shipping_data["fullName"].strip()
-            if not full_name:
-                return "Error: Full name cannot be empty."
-            if len(full_name) > 255:
-                return "Error: Full name must be 255 characters or less."
-            existing.full_name = full_name
-            updated_fields.append("Full Name")
-        
-        if "address" in shipping_data and shipping_data["address"]:
-            address = shipping_data["address"].strip()
-            if not address:
-                return "Error: Address cannot be empty."
-            if len(address) > 500:
-                return "Error: Address must be 500 characters or less."
-            existing.address = address
-            updated_fields.append("Address")
-        
-        if "city" in shipping_data and shipping_data["city"]:
-            city = shipping_data["city"].strip()
-            if not city:
-                return "Error: City cannot be empty."
-            if len(city) > 100:
-                return "Error: City must be 100 characters or less."
-            existing.city = city
-            updated_fields.append("City")
-        
-        if "zipCode" in shipping_data and shipping_data["zipCode"]:
-            zip_code = shipping_data["zipCode"].strip()
-            if not zip_code:
-                return "Error: Zip code cannot be empty."
-            if len(zip_code) > 20:
-                return "Error: Zip code must be 20 characters or less."
-            existing.zip_code = zip_code
-            updated_fields.append("Zip Code")
-        
-        if not updated_fields:
-            return "Error: No valid fields provided to update. Please specify at least one field: fullName, address, city, or zipCode."
+        # Update only provided fields
+        for field, value in updates.items():
+            setattr(existing, field, value)
+        updated_fields = [SHIPPING_FIELD_LABELS[field] for field in updates]
         
         db.commit()
         db.refresh(existing)  # Refresh to ensure we have the latest data
+        _store_shipping_snapshot(session_id, existing)
         
         return (
             f"Shipping information updated successfully! Updated fields: {', '.join(updated_fields)}\n"
@@ -531,9 +671,53 @@ def execute_edit_shipping_info(session_id: str, shipping_data: Dict[str, str]) -
         db.rollback()
         return f"Error updating shipping information: {str(e)}"
     finally:
-        db.close()
+        release_tool_db(db)
+
 
+# One order/cart item as a summary line; accepts OrderItem rows and CartItems alike
+_format_item_line = "  • {0.product_name} (Qty: {0.quantity}) - ${0.subtotal:.2f}".format
 
+# Columns projected when displaying orders
+ORDER_DISPLAY_COLUMNS = (Order.id, Order.status, Order.total_amount, Order.voucher_code, Order.created_at)
+ORDER_ITEM_DISPLAY_COLUMNS = (
+    OrderItem.product_id, OrderItem.product_name, OrderItem.quantity, OrderItem.unit_price, OrderItem.subtotal
+)
+
+
+def _fetch_orders(db: Session, *criteria, limit: Optional[int] = None) -> list:
+    """
+    Fetch orders with their items as plain rows (no ORM objects), newest first, in one query.
+    
+    Args:
+        db: Database session
+        *criteria: WHERE conditions selecting the orders
+        limit: Maximum number of orders (items are not counted)
+        
+    Returns:
+        List of (order row, list of item rows) pairs
+    """
+    order_ids = select(Order.id).where(*criteria).order_by(Order.created_at.desc())
+    if limit is not None:
+        order_ids = order_ids.limit(limit)
+    order_ids = order_ids.subquery()
+    
+    rows = db.execute(
+        select(*ORDER_DISPLAY_COLUMNS, *ORDER_ITEM_DISPLAY_COLUMNS)
+        .join(order_ids, order_ids.c.id == Order.id)
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .order_by(Order.created_at.desc(), Order.id, OrderItem.id)
+    ).all()
+    
+    # Group the joined rows by order, keeping the query order
+    orders = {}
+    for row in rows:
+        _, items = orders.setdefault(row.id, (row, []))
+        if row.product_id is not None:
+            items.append(row)
+    return list(orders.values())
+
+
+@lru_cache(maxsize=None)
 def get_get_orders_function() -> Dict[str, Any]:
     """
     Get OpenAI function definition for retrieving orders.
@@ -571,74 +755,71 @@ def execute_get_orders(session_id: str, order_id: Optional[int] = None) -> str:
     Returns:
         Formatted orders information
     """
-    db = SessionLocal()
+    db = get_tool_db()
     try:
         if order_id:
-            # Get specific order with eager loading of items
-            order = db.query(Order).options(
-                joinedload(Order.items)
-            ).filter(
-                Order.id == order_id,
-                Order.session_id == session_id
-            ).first()
+            # Get specific order with its items
+            found = _fetch_orders(db, Order.id == order_id, Order.session_id == session_id)
             
-            if not order:
+            if not found:
                 return f"Error: Order ID {order_id} not found or does not belong to your session."
+            order, items = found[0]
             
             # Format order with items
             lines = [
                 f"Order #{order.id}",
                 f"Status: {order.status}",
-                f"Total: ${float(order.total_amount):.2f}",
+                f"Total: ${order.total_amount:.2f}",
                 f"Voucher Code: {order.voucher_code if order.voucher_code else 'None'}",
-                f"Created: {order.created_at.strftime('%Y-%m-%d %H:%M:%S')}",
+                f"Created: {_format_timestamp(order.created_at)}",
                 "",
                 "Items:"
             ]
             
-            for item in order.items:
-                lines.append(
-                    f"  • {item.product_name} (Product ID: {item.product_id})\n"
-                    f"    Quantity: {item.quantity} × ${float(item.unit_price):.2f} = ${float(item.subtotal):.2f}"
-                )
+            lines.extend(
+                f"  • {item.product_name} (Product ID: {item.product_id})\n"
+                f"    Quantity: {item.quantity} × ${item.unit_price:.2f} = ${item.subtotal:.2f}"
+                for item in items
+            )
             
             return "\n".join(lines)
         else:
-            # Get 5 most recent orders with eager loading of items to avoid N+1 queries
-            orders = db.query(Order).options(
-                joinedload(Order.items)
-            ).filter(
-                Order.session_id == session_id
-            ).order_by(Order.created_at.desc()).limit(5).all()
+            # Get 5 most recent orders with their items
+            orders = _fetch_orders(db, Order.session_id == session_id, limit=5)
             
             if not orders:
                 return "You have no orders yet. Start shopping to create your first order!"
             
             lines = [f"Your {len(orders)} Most Recent Orders:", ""]
             
-            for order in orders:
+            for order, items in orders:
                 lines.append(
                     f"Order #{order.id} - {order.status.upper()}\n"
-                    f"Total: ${float(order.total_amount):.2f}\n"
+                    f"Total: ${order.total_amount:.2f}\n"
                     f"Voucher: {order.voucher_code if order.voucher_code else 'None'}\n"
-                    f"Date: {order.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
-                    f"Items ({len(order.items)}):"
+                    f"Date: {_format_timestamp(order.created_at)}\n"
+                    f"Items ({len(items)}):"
                 )
                 
-                for item in order.items:
-                    lines.append(
-                        f"  • {item.product_name} (Qty: {item.quantity}) - ${float(item.subtotal):.2f}"
-                    )
-                
+                lines.extend(map(_format_item_line, items))
                 lines.append("")
             
             return "\n".join(lines)
     except Exception as e:
         return f"Error retrieving orders: {str(e)}"
     finally:
-        db.close()
+        release_tool_db(db)
+
 
+def _already_placed_message(db: Session, voucher_code: str) -> Optional[str]:
+    """Return the idempotent confirmation if an order was already placed with the voucher."""
+    order_id = db.scalar(select(Order.id).where(Order.voucher_code == voucher_code))
+    if order_id is None:
+        return None
+    return f"✅ Your purchase has already been placed. Order ID: {order_id}"
 
+
+@lru_cache(maxsize=None)
 def get_purchase_function() -> Dict[str, Any]:
     """
     Get OpenAI function definition for completing purchase.
@@ -676,17 +857,15 @@ def execute_purchase(session_id: str, voucher_code: str) -> str:
     Returns:
         Purchase result message
     """
-    db = SessionLocal()
+    db = get_tool_db()
     try:
         # Get cart
         cart = cart_manager.get_cart(session_id)
         if not cart:
             return "Error: Your cart is empty. Add items to your cart before purchasing."
         
-        # Check for shipping information
-        shipping_info = db.query(ShippingInfo).filter(
-            ShippingInfo.session_id == session_id
-        ).first()
+        # Check for shipping information (cached per session, shared with get_shipping_info)
+        shipping_info = get_shipping_snapshot(session_id)
         
         if not shipping_info:
             return (
@@ -696,34 +875,57 @@ def execute_purchase(session_id: str, voucher_code: str) -> str:
         
         cart_total = cart_manager.get_cart_total(session_id)
         
-        # Validate voucher
-        voucher = db.query(Voucher).filter(Voucher.code == voucher_code).first()
+        # Codes that recently did not exist are rejected without a query (e.g. repeated typos)
+        with _missing_vouchers_lock:
+            known_missing = voucher_code in _missing_vouchers
+        if known_missing:
+            return f"Error: Invalid voucher code '{voucher_code}'. Please check and try again."
+        
+        # Validate voucher and look up any order already placed with it in one round trip
+        voucher, existing_order_id = db.execute(
+            select(Voucher, Order.id)
+            .outerjoin(Order, Order.voucher_code == Voucher.code)
+            .where(Voucher.code == voucher_code)
+            .limit(1)
+        ).first() or (None, None)
         if not voucher:
+            with _missing_vouchers_lock:
+                _missing_vouchers[voucher_code] = True
             return f"Error: Invalid voucher code '{voucher_code}'. Please check and try again."
         
-        # IDEMPOTENCY CHECK: First check if an order already exists for this voucher_code
+        # IDEMPOTENCY CHECK: an order already exists for this voucher_code
         # This handles the case where purchase is called multiple times
-        existing_order = db.query(Order).filter(
-            Order.voucher_code == voucher_code
-        ).first()
-        
-        if existing_order:
+        if existing_order_id is not None:
             # Purchase already completed - return simple message (idempotent behavior)
-            return f"✅ Your purchase has already been placed. Order ID: {existing_order.id}"
+            return f"✅ Your purchase has already been placed. Order ID: {existing_order_id}"
         
         # If no existing order, check if voucher is marked as used (shouldn't happen if order exists)
         if voucher.is_used:
             return f"Error: Voucher '{voucher_code}' has already been used."
         
         # Check if voucher amount is sufficient
-        if float(voucher.amount) < cart_total:
+        if voucher.amount < cart_total:
             return (
                 f"Error: Insufficient voucher balance. "
-                f"Your cart total is ${cart_total:.2f}, but your voucher is worth ${float(voucher.amount):.2f}. "
+                f"Your cart total is ${cart_total:.2f}, but your voucher is worth ${voucher.amount:.2f}. "
                 f"Please remove some items or use a voucher with sufficient balance."
             )
         
-        # Create order
+        # Claim the voucher atomically (once used, it cannot be reused even if order is less
+        # than voucher amount); a concurrent purchase that claimed it first leaves no row
+        claimed = db.execute(
+            update(Voucher)
+            .where(Voucher.code == voucher_code, Voucher.is_used.is_(False))
+            .values(is_used=True, used_by_session=session_id, used_at=func.now())
+            .returning(Voucher.id)
+        ).first()
+        if claimed is None:
+            # Lost a race with a concurrent purchase; it may have placed the order already
+            db.rollback()
+            return _already_placed_message(db, voucher_code) or f"Error: Voucher '{voucher_code}' has already been used."
+        
+        # Create order; the unique index on orders.voucher_code rejects a second order for
+        # the same voucher
         order = Order(
             session_id=session_id,
             voucher_code=voucher_code,
@@ -731,59 +933,86 @@ def execute_purchase(session_id: str, voucher_code: str) -> str:
             status="completed"
         )
         db.add(order)
-        db.flush()  # Get order ID
-        
-        # Create order items
-        for cart_item in cart:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=cart_item.product_id,
-                product_name=cart_item.product_name,
-                quantity=cart_item.quantity,
-                unit_price=cart_item.unit_price,
-                subtotal=cart_item.subtotal
-            )
-            db.add(order_item)
-        
-        # Mark voucher as used (once used, it cannot be reused even if order is less than voucher amount)
-        voucher.is_used = True
-        voucher.used_by_session = session_id
-        voucher.used_at = datetime.now()
-        
-        # Commit transaction
-        db.commit()
-        
-        # Refresh order to ensure items are loaded
-        db.refresh(order)
-        # Explicitly load items relationship
-        order = db.query(Order).options(joinedload(Order.items)).filter(Order.id == order.id).first()
-        
-        # Clear cart
-        cart_manager.clear_cart(session_id)
+        try:
+            db.flush()  # Get order ID
+        except IntegrityError:
+            db.rollback()
+            return _already_placed_message(db, voucher_code) or f"Error: Voucher '{voucher_code}' has already been used."
+        
+        # Create order items with a single bulk INSERT
+        db.execute(
+            insert(OrderItem),
+            [
+                {
+                    "order_id": order.id,
+                    "product_id": cart_item.product_id,
+                    "product_name": cart_item.product_name,
+                    "quantity": cart_item.quantity,
+                    "unit_price": cart_item.unit_price,
+                    "subtotal": cart_item.subtotal
+                }
+                for cart_item in cart
+            ]
+        )
         
-        # Build detailed success message
-        items_summary = []
-        for item in order.items:
-            items_summary.append(f"  • {item.product_name} (Qty: {item.quantity}) - ${float(item.subtotal):.2f}")
+        # Build detailed success message from the cart and the flushed rows; after commit
+        # their attributes are expired and reading them would cost extra SELECTs
+        items_summary = "\n".join(map(_format_item_line, cart))
         
-        return (
+        message = (
             f"✅ Purchase completed successfully! Your order has been placed and saved.\n\n"
             f"Order Details:\n"
             f"  Order ID: {order.id}\n"
             f"  Status: {order.status}\n"
             f"  Total Amount: ${cart_total:.2f}\n"
             f"  Voucher Code Used: {voucher_code}\n"
-            f"  Remaining Voucher Balance: ${float(voucher.amount) - cart_total:.2f}\n"
-            f"\nOrder Items:\n" + "\n".join(items_summary) + "\n"
+            f"  Remaining Voucher Balance: ${voucher.amount - cart_total:.2f}\n"
+            f"\nOrder Items:\n{items_summary}\n"
             f"\nShipping Address:\n"
             f"  {shipping_info.full_name}\n"
             f"  {shipping_info.address}\n"
             f"  {shipping_info.city}, {shipping_info.zip_code}\n"
-            f"\nOrder Date: {order.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"\nOrder Date: {_format_timestamp(order.created_at)}\n"
             f"\nThank you for your purchase! Your order is confirmed and will be processed shortly."
         )
+        
+        # Purchases count as catalog writes: cached product listings are revalidated
+        bump_catalog_version(db)
+        
+        # Commit transaction
+        db.commit()
+        
+        # Cached snapshots of the purchased products may hold stock from before the order
+        for cart_item in cart:
+            invalidate_product_cache(cart_item.product_id)
+        
+        # Clear cart
+        cart_manager.clear_cart(session_id)
+        
+        return message
     except Exception as e:
         db.rollback()
         return f"Error processing purchase: {str(e)}"
     finally:
-        db.close()
+        release_tool_db(db)
+
+
+@lru_cache(maxsize=None)
+def get_order_tool_definitions() -> tuple:
+    """
+    Get the OpenAI function definitions of all order tools, in the order offered to the model.
+    
+    Returns:
+        Tuple of OpenAI function definitions (built once and shared)
+    """
+    return (
+        get_add_to_cart_function(),
+        get_edit_item_in_cart_function(),
+        get_remove_from_cart_function(),
+        get_view_cart_function(),
+        get_shipping_info_function(),
+        get_create_shipping_info_function(),
+        get_edit_shipping_info_function(),
+        get_get_orders_function(),
+        get_purchase_function()
+    )
@@ -1,11 +1,43 @@
 """Retrieval tools for agents using OpenAI function calling."""
-from typing import List, Dict, Any
+import threading
+from functools import lru_cache
+from typing import List, Dict, Any, Optional
 from langchain_core.documents import Document
 from src.indexing.embeddings import EmbeddingStore
 from src.config import settings
 from src.utils.similarity import filter_by_similarity_threshold
 
+# Per-document templates for serialized tool output
+_HANDBOOK_ENTRY = "Source: {}\nSection: {} {}\nContent: {}".format
+_PRODUCT_ENTRY = "Product ID: {}\nBrand: {}\nCategory: {}\nPrice: ${}\nContent: {}".format
 
+# Serializes the first open of each collection; tools run in worker threads
+_vectorstore_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _open_vectorstore(collection_name: str):
+    """
+    Open a persisted Chroma collection once and reuse the handle.
+
+    Keeps the Chroma client, collection and embedding function warm across calls when
+    no vectorstore is passed in.
+
+    Args:
+        collection_name: Name of the collection in data/vector_store
+
+    Returns:
+        Vectorstore for the collection
+    """
+    with _vectorstore_lock:
+        return EmbeddingStore(
+            persist_directory="data/vector_store",
+            collection_name=collection_name,
+            clear_existing=False
+        ).get_vectorstore()
+
+
+@lru_cache(maxsize=None)
 def get_handbook_retrieval_function(min_similarity: float = 0.75) -> Dict[str, Any]:
     """
     Get OpenAI function definition for handbook retrieval.
@@ -44,7 +76,8 @@ def execute_handbook_retrieval(
     query: str, 
     k: int = 3, 
     min_similarity: float = 0.75,
-    vectorstore=None
+    vectorstore=None,
+    embedding: Optional[List[float]] = None
 ) -> tuple[str, List[Document]]:
     """
     Execute handbook retrieval.
@@ -54,42 +87,40 @@ def execute_handbook_retrieval(
         k: Number of results
         min_similarity: Minimum similarity threshold
         vectorstore: Optional pre-initialized vectorstore (for performance)
+        embedding: Optional precomputed query embedding (skips embedding the query again)
         
     Returns:
         Tuple of (serialized content, list of documents with metadata)
     """
     # Use provided vectorstore or initialize new one
     if vectorstore is None:
-        handbook_store = EmbeddingStore(
-            persist_directory="data/vector_store",
-            collection_name="general_handbook",
-            clear_existing=False
-        )
-        vectorstore = handbook_store.get_vectorstore()
+        vectorstore = _open_vectorstore("general_handbook")
     
-    # Use similarity_search_with_score to get scores
-    results_with_scores = vectorstore.similarity_search_with_score(query, k)
+    # Both calls return (document, distance) pairs
+    if embedding is not None:
+        results_with_scores = vectorstore.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+    else:
+        results_with_scores = vectorstore.similarity_search_with_score(query, k)
     
     # Filter by similarity threshold using utility function
     filtered_docs_with_scores = filter_by_similarity_threshold(results_with_scores, min_similarity, k)
     
-    # Extract just the documents for serialization
-    filtered_docs = [doc for doc, _ in filtered_docs_with_scores]
-    
-    # Serialize documents for the model
-    serialized = "\n\n".join(
-        (
-            f"Source: {doc.metadata.get('handbook_name', 'Handbook')}\n"
-            f"Section: {doc.metadata.get('Header 1', '')} {doc.metadata.get('Header 2', '')}\n"
-            f"Content: {doc.page_content}"
+    # Serialize documents for the model (join builds a list anyway, so hand it one)
+    serialized = "\n\n".join([
+        _HANDBOOK_ENTRY(
+            (meta := doc.metadata).get('handbook_name', 'Handbook'),
+            meta.get('Header 1', ''),
+            meta.get('Header 2', ''),
+            doc.page_content,
         )
-        for doc in filtered_docs
-    )
+        for doc, _ in filtered_docs_with_scores
+    ])
     
     # Return (serialized content, list of (doc, similarity) tuples)
     return (serialized if serialized else "No relevant information found.", filtered_docs_with_scores)
 
 
+@lru_cache(maxsize=None)
 def get_product_search_function(min_similarity: float = 0.75) -> Dict[str, Any]:
     """
     Get OpenAI function definition for product search.
@@ -157,6 +188,54 @@ def get_product_search_function(min_similarity: float = 0.75) -> Dict[str, Any]:
     }
 
 
+@lru_cache(maxsize=256)
+def _build_product_filter(
+    category: Optional[str],
+    brand: Optional[str],
+    is_featured: Optional[bool],
+    min_price: Optional[float],
+    max_price: Optional[float]
+) -> Optional[Dict[str, Any]]:
+    """
+    Build the ChromaDB metadata filter for a product search.
+
+    Cached because agents repeat the same few filter combinations; the returned dict is
+    shared and must not be mutated.
+
+    Args:
+        category: Optional category filter
+        brand: Optional brand filter
+        is_featured: Optional featured filter
+        min_price: Optional minimum price
+        max_price: Optional maximum price
+
+    Returns:
+        ChromaDB where clause, or None when no filter applies
+    """
+    # ChromaDB requires $and operator when multiple conditions are present
+    filter_conditions = []
+    if category:
+        filter_conditions.append({"category": category})
+    if brand:
+        filter_conditions.append({"brand": brand})
+    if is_featured is not None:
+        filter_conditions.append({"is_featured": is_featured})
+    # Prices are indexed as floats, so the range is applied inside the search instead of
+    # over-fetching and filtering afterwards
+    if min_price is not None:
+        filter_conditions.append({"price": {"$gte": min_price}})
+    if max_price is not None:
+        filter_conditions.append({"price": {"$lte": max_price}})
+    
+    # Single condition: {"category": "laptops"}
+    # Multiple conditions: {"$and": [{"category": "laptops"}, {"price": {"$lte": 100.0}}]}
+    if len(filter_conditions) == 1:
+        return filter_conditions[0]
+    if filter_conditions:
+        return {"$and": filter_conditions}
+    return None
+
+
 def execute_product_search(
     query: str,
     k: int = 3,
@@ -166,7 +245,8 @@ def execute_product_search(
     max_price: float = None,
     is_featured: bool = None,
     min_similarity: float = 0.75,
-    vectorstore=None
+    vectorstore=None,
+    embedding: Optional[List[float]] = None
 ) -> tuple[str, List[Document]]:
     """
     Execute product search with optional filters.
@@ -181,95 +261,53 @@ def execute_product_search(
         is_featured: Optional featured filter (True for featured products)
         min_similarity: Minimum similarity threshold
         vectorstore: Optional pre-initialized vectorstore (for performance)
+        embedding: Optional precomputed query embedding (skips embedding the query again)
 
     Returns:
         Tuple of (serialized content, list of documents with metadata)
     """
     # Use provided vectorstore or initialize new one
     if vectorstore is None:
-        products_store = EmbeddingStore(
-            persist_directory="data/vector_store",
-            collection_name="products",
-            clear_existing=False
-        )
-        vectorstore = products_store.get_vectorstore()
+        vectorstore = _open_vectorstore("products")
     
-    # Build filter for exact matches (category, brand, is_featured) - ChromaDB supports these
-    # ChromaDB requires $and operator when multiple conditions are present
-    filter_conditions = []
-    if category:
-        filter_conditions.append({"category": category})
-    if brand:
-        filter_conditions.append({"brand": brand})
-    if is_featured is not None:
-        filter_conditions.append({"is_featured": is_featured})
-    
-    # Construct ChromaDB filter format
-    # Single condition: {"category": "laptops"}
-    # Multiple conditions: {"$and": [{"category": "laptops"}, {"brand": "Apple"}]}
-    chroma_filter = None
-    if len(filter_conditions) == 1:
-        chroma_filter = filter_conditions[0]
-    elif len(filter_conditions) > 1:
-        chroma_filter = {"$and": filter_conditions}
-    
-    # Use similarity_search_with_score to get scores
-    # Fetch more results initially to account for post-filtering (price)
-    has_post_filters = (min_price is not None or max_price is not None)
-    fetch_k = k * 3 if has_post_filters else k
+    chroma_filter = _build_product_filter(
+        category or None,
+        brand or None,
+        is_featured,
+        None if min_price is None else float(min_price),
+        None if max_price is None else float(max_price),
+    )
     
-    if chroma_filter:
+    # Both calls return (document, distance) pairs
+    if embedding is not None:
+        results_with_scores = vectorstore.similarity_search_by_vector_with_relevance_scores(
+            embedding,
+            k=k,
+            filter=chroma_filter
+        )
+    elif chroma_filter:
         results_with_scores = vectorstore.similarity_search_with_score(
             query,
-            k=fetch_k,
+            k=k,
             filter=chroma_filter
         )
     else:
-        results_with_scores = vectorstore.similarity_search_with_score(query, k=fetch_k)
+        results_with_scores = vectorstore.similarity_search_with_score(query, k=k)
     
     # Filter by similarity threshold using utility function
-    filtered_docs_with_scores = filter_by_similarity_threshold(results_with_scores, min_similarity, fetch_k)
-    
-    # Apply post-filters (price) - ChromaDB doesn't support range queries, so filter in Python
-    if min_price is not None or max_price is not None:
-        post_filtered = []
-        for doc, similarity in filtered_docs_with_scores:
-            # Price filtering
-            price = doc.metadata.get("price")
-            if price is not None:
-                try:
-                    price_float = float(price)
-                    # Check price range
-                    if min_price is not None and price_float < min_price:
-                        continue
-                    if max_price is not None and price_float > max_price:
-                        continue
-                except (ValueError, TypeError):
-                    # If price can't be converted, skip price filtering for this item
-                    pass
-            elif min_price is not None:
-                # If min_price is set but product has no price, exclude it
-                continue
-            
-            post_filtered.append((doc, similarity))
-        
-        # Limit to k results after post-filtering
-        filtered_docs_with_scores = post_filtered[:k]
-    
-    # Extract just the documents for serialization
-    filtered_docs = [doc for doc, _ in filtered_docs_with_scores]
+    filtered_docs_with_scores = filter_by_similarity_threshold(results_with_scores, min_similarity, k)
     
-    # Serialize documents for the model
-    serialized = "\n\n".join(
-        (
-            f"Product ID: {doc.metadata.get('product_id', 'N/A')}\n"
-            f"Brand: {doc.metadata.get('brand', 'N/A')}\n"
-            f"Category: {doc.metadata.get('category', 'N/A')}\n"
-            f"Price: ${doc.metadata.get('price', 'N/A')}\n"
-            f"Content: {doc.page_content}"
+    # Serialize documents for the model (join builds a list anyway, so hand it one)
+    serialized = "\n\n".join([
+        _PRODUCT_ENTRY(
+            (meta := doc.metadata).get('product_id', 'N/A'),
+            meta.get('brand', 'N/A'),
+            meta.get('category', 'N/A'),
+            meta.get('price', 'N/A'),
+            doc.page_content,
         )
-        for doc in filtered_docs
-    )
+        for doc, _ in filtered_docs_with_scores
+    ])
     
     # Return (serialized content, list of (doc, similarity) tuples)
     return (serialized if serialized else "No products found matching your criteria.", filtered_docs_with_scores)
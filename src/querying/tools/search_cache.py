@@ -0,0 +1,104 @@
+"""Similarity cache for product search results."""
+import time
+from typing import Any, List, Optional, Tuple
+import numpy as np
+from cachetools import TTLCache
+from src.config import settings
+
+
+class SearchCache:
+    """
+    Caches search results keyed by query embedding and filters.
+
+    A lookup hits when a cached query embedding is nearly identical (cosine similarity at or
+    above the threshold) to the incoming one and was searched with the same filters, so
+    rephrasings like "cheap headphones" / "affordable headphones" skip the vectorstore.
+    Embeddings live in a preallocated ring-buffer matrix and are compared by brute force,
+    which is cheap at this size.
+    """
+
+    def __init__(self, max_entries: int = 512, similarity_threshold: float = 0.97, ttl_seconds: float = 300.0):
+        """
+        Initialize the search cache.
+
+        Args:
+            max_entries: Maximum number of cached searches (oldest are overwritten first)
+            similarity_threshold: Minimum cosine similarity between query embeddings for a hit
+            ttl_seconds: How long a cached result stays valid
+        """
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        # (max_entries, dim) matrix of unit-length query embeddings; allocated on first insert
+        self._matrix: Optional[np.ndarray] = None
+        # slot -> (filter_key, expires_at, result)
+        self._entries: List[Optional[Tuple[tuple, float, Any]]] = [None] * max_entries
+        self._next_slot = 0
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        """Convert an embedding to a unit-length float32 vector."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding: List[float], filter_key: tuple, force_refresh: bool = False) -> Optional[Any]:
+        """
+        Look up a cached result for a query embedding.
+
+        Args:
+            embedding: Query embedding
+            filter_key: Hashable tuple of the search filters
+            force_refresh: Skip the cache (the caller will store a fresh result)
+
+        Returns:
+            Cached result, or None on a miss
+        """
+        if force_refresh or self._matrix is None or len(embedding) != self._matrix.shape[1]:
+            return None
+
+        # Empty slots are zero rows and never reach the threshold
+        similarities = self._matrix @ self._unit(embedding)
+        candidates = np.flatnonzero(similarities >= self.similarity_threshold)
+        now = time.monotonic()
+        for slot in candidates[np.argsort(similarities[candidates])[::-1]]:
+            entry = self._entries[slot]
+            if entry is not None and entry[0] == filter_key and entry[1] > now:
+                return entry[2]
+        return None
+
+    def put(self, embedding: List[float], filter_key: tuple, result: Any):
+        """
+        Store a search result.
+
+        Args:
+            embedding: Query embedding
+            filter_key: Hashable tuple of the search filters
+            result: Result to return on later hits
+        """
+        if self._matrix is None or len(embedding) != self._matrix.shape[1]:
+            # First insert, or the embedding model changed: start over
+            self._matrix = np.zeros((self.max_entries, len(embedding)), dtype=np.float32)
+            self._entries = [None] * self.max_entries
+            self._next_slot = 0
+
+        slot = self._next_slot
+        self._matrix[slot] = self._unit(embedding)
+        self._entries[slot] = (filter_key, time.monotonic() + self.ttl_seconds, result)
+        self._next_slot = (slot + 1) % self.max_entries
+
+    def clear(self):
+        """Drop all cached results (e.g. after rebuilding the index)."""
+        self._matrix = None
+        self._entries = [None] * self.max_entries
+        self._next_slot = 0
+
+
+# Global product search cache instances: exact (normalized query + filters) lookups are
+# tried first, then near-duplicate queries by embedding similarity
+exact_search_cache: TTLCache = TTLCache(maxsize=1024, ttl=60)
+product_search_cache = SearchCache(similarity_threshold=settings.search_cache_similarity)
+
+# Handbook retrieval caches (same two tiers); handbook content only changes on re-indexing
+exact_handbook_cache: TTLCache = TTLCache(maxsize=512, ttl=300)
+handbook_search_cache = SearchCache(similarity_threshold=settings.search_cache_similarity)
@@ -1,13 +1,27 @@
 """Admin routes for product management."""
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from data.database.connection import get_db
 from data.database.product_model import Product
 from data.database.product_schema import ProductCreate, ProductUpdate, ProductResponse
+from src.querying.tools.order import invalidate_product_cache
+from src.utils.catalog_version import bump_catalog_version
+from src.utils.http_cache import not_modified
 
 router = APIRouter(prefix="/admin/products", tags=["admin"])
 
+# Rows per INSERT statement in bulk creates (keeps bind parameters well under PostgreSQL's limit)
+BULK_INSERT_CHUNK_SIZE = 1000
+
+
+def _product_etag(product: Product) -> str:
+    """Weak ETag for a single product; changes whenever the row is updated."""
+    return f'W/"{product.id}-{product.updated_at.timestamp():.6f}"'
+
 
 @router.post(
     "/",
@@ -21,30 +35,63 @@ def create_product(
     db: Session = Depends(get_db)
 ):
     """Create a new product."""
-    # Check if SKU already exists
-    existing_product = db.query(Product).filter(Product.sku == product.sku).first()
-    if existing_product:
+    # Create new product; the unique index on sku rejects duplicates atomically
+    db_product = Product(**product.model_dump())
+    db.add(db_product)
+    bump_catalog_version(db)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Product with SKU '{product.sku}' already exists"
         )
-    
-    # Create new product
-    db_product = Product(**product.model_dump())
-    db.add(db_product)
-    db.commit()
     db.refresh(db_product)
     
     return db_product
 
 
+@router.post(
+    "/bulk",
+    status_code=status.HTTP_201_CREATED,
+    summary="Create products in bulk",
+    description="Create many products at once; products whose SKU already exists are skipped"
+)
+def bulk_create_products(
+    products: List[ProductCreate],
+    db: Session = Depends(get_db)
+):
+    """Create products in bulk with multi-row INSERT ... ON CONFLICT (sku) DO NOTHING."""
+    inserted = set()
+    rows = [product.model_dump() for product in products]
+    for start in range(0, len(rows), BULK_INSERT_CHUNK_SIZE):
+        inserted.update(db.scalars(
+            insert(Product)
+            .values(rows[start:start + BULK_INSERT_CHUNK_SIZE])
+            .on_conflict_do_nothing(index_elements=[Product.sku])
+            .returning(Product.sku)
+        ))
+    if inserted:
+        bump_catalog_version(db)
+    db.commit()
+    
+    return {
+        "inserted": len(inserted),
+        "skipped_skus": [row["sku"] for row in rows if row["sku"] not in inserted]
+    }
+
+
 @router.get(
     "/",
     response_model=List[ProductResponse],
     summary="Get all products",
-    description="Retrieve all products with optional filtering"
+    description="Retrieve all products with optional filtering. The total number of matching "
+                "products is returned in the X-Total-Count header."
 )
 def get_products(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     is_active: Optional[bool] = None,
@@ -53,18 +100,33 @@ def get_products(
     db: Session = Depends(get_db)
 ):
     """Get all products with optional filters."""
-    query = db.query(Product)
-    
     # Apply filters
+    criteria = []
     if is_active is not None:
-        query = query.filter(Product.is_active == is_active)
+        criteria.append(Product.is_active == is_active)
     if category:
-        query = query.filter(Product.category == category)
+        criteria.append(Product.category == category)
     if brand:
-        query = query.filter(Product.brand == brand)
+        criteria.append(Product.brand == brand)
     
-    products = query.offset(skip).limit(limit).all()
-    return products
+    # One aggregate over the filtered rows gives the total and decides whether the listing changed
+    latest_update, match_count = db.execute(
+        select(func.max(Product.updated_at), func.count()).where(*criteria)
+    ).one()
+    stamp = latest_update.timestamp() if latest_update else 0
+    etag = f'W/"{match_count}-{stamp:.6f}"'
+    if not_modified(request, response, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    
+    # The aggregate already counted the matches, so the page query needs no count of its own
+    response.headers["X-Total-Count"] = str(match_count)
+    return db.scalars(
+        select(Product)
+        .where(*criteria)
+        .order_by(Product.id)
+        .offset(skip)
+        .limit(limit)
+    ).all()
 
 
 @router.get(
@@ -75,15 +137,21 @@ def get_products(
 )
 def get_product(
     product_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """Get a product by ID."""
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = db.get(Product, product_id)
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Product with ID {product_id} not found"
         )
+    
+    etag = _product_etag(product)
+    if not_modified(request, response, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
     return product
 
 
@@ -95,15 +163,21 @@ def get_product(
 )
 def get_product_by_sku(
     sku: str,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """Get a product by SKU."""
-    product = db.query(Product).filter(Product.sku == sku).first()
+    product = db.execute(select(Product).where(Product.sku == sku)).scalar_one_or_none()
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Product with SKU '{sku}' not found"
         )
+    
+    etag = _product_etag(product)
+    if not_modified(request, response, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
     return product
 
 
@@ -119,31 +193,7 @@ def update_product(
     db: Session = Depends(get_db)
 ):
     """Update a product."""
-    db_product = db.query(Product).filter(Product.id == product_id).first()
-    if not db_product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Product with ID {product_id} not found"
-        )
-    
-    # Check if SKU is being updated and if it conflicts
-    if product_update.sku and product_update.sku != db_product.sku:
-        existing_product = db.query(Product).filter(Product.sku == product_update.sku).first()
-        if existing_product:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Product with SKU '{product_update.sku}' already exists"
-            )
-    
-    # Update only provided fields
-    update_data = product_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_product, field, value)
-    
-    db.commit()
-    db.refresh(db_product)
-    
-    return db_product
+    return _apply_product_update(db, product_id, product_update)
 
 
 @router.patch(
@@ -158,5 +208,58 @@ def patch_product(
     db: Session = Depends(get_db)
 ):
     """Partially update a product (same as PUT)."""
-    return update_product(product_id, product_update, db)
+    return _apply_product_update(db, product_id, product_update)
+
+
+def _apply_product_update(db: Session, product_id: int, product_update: ProductUpdate) -> Product:
+    """
+    Apply the provided fields of a product update.
+
+    Runs as a single UPDATE ... RETURNING instead of loading the product, flushing the
+    changes and refreshing it afterwards.
+
+    Args:
+        db: Database session
+        product_id: ID of the product to update
+        product_update: Fields to change (unset fields are left alone)
+
+    Returns:
+        The updated product
+
+    Raises:
+        HTTPException: 404 if the product does not exist, 400 if the new SKU is taken
+    """
+    # Update only provided fields
+    update_data = product_update.model_dump(exclude_unset=True)
+    if update_data:
+        # A changed SKU that is already taken fails on the unique index
+        try:
+            db_product = db.scalars(
+                update(Product)
+                .where(Product.id == product_id)
+                .values(**update_data)
+                .returning(Product)
+            ).one_or_none()
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Product with SKU '{product_update.sku}' already exists"
+            )
+    else:
+        db_product = db.get(Product, product_id)
+
+    if not db_product:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Product with ID {product_id} not found"
+        )
+
+    if update_data:
+        # Detach so the commit does not expire the returned values (no refresh needed)
+        db.expunge(db_product)
+        bump_catalog_version(db)
+        db.commit()
+        invalidate_product_cache(product_id)
+    return db_product
 
@@ -1,72 +1,34 @@
 """User routes for querying and voucher management."""
+import base64
+import binascii
 import hashlib
 import secrets
+import threading
 import time
-from fastapi import APIRouter, HTTPException, Request, Depends, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
-from typing import Optional, List, Dict, Any
-from pydantic import BaseModel, Field
-from src.querying.service import QueryService
+from datetime import datetime
+from cachetools import TTLCache
+import orjson
+from fastapi import APIRouter, HTTPException, Request, Response, Depends, status, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import or_, and_, func, tuple_
+from sqlalchemy.dialects.postgresql import array
+from typing import AsyncIterator, Optional, List, Dict, Any, Tuple
+from pydantic import BaseModel, Field, TypeAdapter
 from src.config import settings
 from data.database.connection import get_db
 from data.database.order_models import Voucher, Order, OrderItem, ShippingInfo
 from data.database.product_model import Product
 from data.database.product_schema import ProductResponse
 from src.utils.cart import cart_manager
+from src.utils.catalog_version import get_catalog_version
+from src.utils.http_cache import not_modified
+from src.utils.rate_limit import limiter, QUERY_RATE_LIMIT, VOUCHER_RATE_LIMIT
+from src.utils.session import get_session_id
 
 router = APIRouter(prefix="/user", tags=["user"])
 
-# Query service will be initialized with vector stores from app state
-query_service = None
-
-
-def get_client_ip(request: Request) -> str:
-    """
-    Extract client IP address from request.
-    Handles proxies and forwarded headers.
-    
-    Args:
-        request: FastAPI request object
-        
-    Returns:
-        Client IP address as string
-    """
-    # Check for forwarded IP (when behind proxy/load balancer)
-    forwarded_for = request.headers.get("X-Forwarded-For")
-    if forwarded_for:
-        # X-Forwarded-For can contain multiple IPs, take the first one
-        ip = forwarded_for.split(",")[0].strip()
-        return ip
-    
-    # Check for real IP header
-    real_ip = request.headers.get("X-Real-IP")
-    if real_ip:
-        return real_ip.strip()
-    
-    # Fallback to direct client IP
-    if request.client:
-        return request.client.host
-    
-    return "unknown"
-
-
-def generate_session_id(ip_address: str) -> str:
-    """
-    Generate a consistent session_id from IP address.
-    Uses hash to ensure consistent ID for same IP.
-    
-    Args:
-        ip_address: Client IP address
-        
-    Returns:
-        Session ID based on IP address
-    """
-    # Hash the IP address to create a consistent session_id
-    # This ensures same IP always gets same session_id
-    hash_obj = hashlib.md5(ip_address.encode())
-    return f"session_{hash_obj.hexdigest()[:16]}"
-
 
 class QueryRequest(BaseModel):
     """Request model for query endpoint."""
@@ -99,7 +61,8 @@ class QueryResponse(BaseModel):
 
 
 @router.post("/query", response_model=QueryResponse)
-async def query(request: QueryRequest, http_request: Request):
+@limiter.limit(QUERY_RATE_LIMIT)
+async def query(query_request: QueryRequest, request: Request):
     """
     Process a user query through the multi-agent system.
     
@@ -111,64 +74,30 @@ async def query(request: QueryRequest, http_request: Request):
     Users from the same IP will have their conversation history preserved.
     
     Args:
-        request: Query request with user query
-        http_request: FastAPI request object (for IP extraction)
+        query_request: Query request with user query
+        request: FastAPI request object (for session and rate limiting)
         
     Returns:
         Query response with agent's answer
     """
-    global query_service
-    
     # TEMP: Start timing
     start_time = time.time()
     
     try:
-        # Initialize query service with vector stores from app state (lazy initialization)
-        if query_service is None:
-            from src.querying.service import QueryService
-            query_service = QueryService(
-                handbook_vectorstore=http_request.app.state.handbook_vectorstore,
-                products_vectorstore=http_request.app.state.products_vectorstore
-            )
+        # Query service is built once at startup (see lifespan in main.py)
+        query_service = request.app.state.query_service
         
-        # Extract IP address and generate session_id
-        client_ip = get_client_ip(http_request)
-        session_id = generate_session_id(client_ip)
+        # Session_id derived from the IP address (already resolved by the rate limiter)
+        session_id = get_session_id(request)
         
         # Process query with auto-generated session_id and min_similarity
         result = await query_service.query(
-            user_query=request.query,
+            user_query=query_request.query,
             session_id=session_id,
-            min_similarity=request.min_similarity
+            min_similarity=query_request.min_similarity
         )
         
-        # TEMP: Log query time
-        elapsed = time.time() - start_time
-        print(f"[TIMING] Query completed in {elapsed:.2f}s: {request.query[:50]}...")
-        
-        # Format sources (sources are always (doc, similarity) tuples)
-        sources = []
-        for doc, similarity in result.get("sources", []):
-            sources.append({
-                "content": doc.page_content,
-                "metadata": doc.metadata.copy(),
-                "similarity": float(similarity)
-            })
-        
-        # Get query_params, or use user's query if empty
-        query_params = result.get("query_params", {})
-        if not query_params:
-            query_params = {"query": request.query}
-        
-        return QueryResponse(
-            input=query_params,
-            answer=result["response"],
-            agents_used=result.get("agents_used", []),
-            routing_mode=result.get("routing_mode", "single"),
-            sources=sources,
-            session_id=session_id,
-            elapsed_time_seconds=round(elapsed, 2)
-        )
+        return _build_query_response(query_request, result, session_id, start_time)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -176,6 +105,96 @@ async def query(request: QueryRequest, http_request: Request):
         )
 
 
+@router.post("/query/stream", summary="Process a query, streaming the answer")
+@limiter.limit(QUERY_RATE_LIMIT)
+async def query_stream(query_request: QueryRequest, request: Request):
+    """
+    Process a user query like /query, streaming the answer as it is generated.
+    
+    The body is newline-delimited JSON, one event per line:
+    - {"type": "token", "text": ...}: next piece of the answer
+    - {"type": "discard"}: drop the answer text received so far (it was not the answer)
+    - {"type": "done", ...}: the complete QueryResponse, sent last
+    - {"type": "error", "detail": ...}: processing failed, sent last
+    
+    Args:
+        query_request: Query request with user query
+        request: FastAPI request object (for session and rate limiting)
+        
+    Returns:
+        Streaming response of answer events
+    """
+    start_time = time.time()
+    query_service = request.app.state.query_service
+    session_id = get_session_id(request)
+    
+    async def events() -> AsyncIterator[bytes]:
+        try:
+            async for event in query_service.query_stream(
+                user_query=query_request.query,
+                session_id=session_id,
+                min_similarity=query_request.min_similarity
+            ):
+                if event[0] == "token":
+                    yield orjson.dumps({"type": "token", "text": event[1]}) + b"\n"
+                elif event[0] == "discard":
+                    yield orjson.dumps({"type": "discard"}) + b"\n"
+                else:
+                    response = _build_query_response(query_request, event[1], session_id, start_time)
+                    yield orjson.dumps({"type": "done", **response.model_dump()}) + b"\n"
+        except Exception as e:
+            # Headers are already sent, so the failure is reported in the stream
+            yield orjson.dumps({"type": "error", "detail": f"Error processing query: {str(e)}"}) + b"\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+def _build_query_response(
+    query_request: QueryRequest, result: Dict[str, Any], session_id: str, start_time: float
+) -> QueryResponse:
+    """
+    Build the query response from an orchestrator result.
+    
+    Args:
+        query_request: Query request with user query
+        result: Result dictionary of the orchestrator
+        session_id: User session identifier
+        start_time: time.time() when the request started
+        
+    Returns:
+        Query response with agent's answer
+    """
+    # TEMP: Log query time
+    elapsed = time.time() - start_time
+    print(f"[TIMING] Query completed in {elapsed:.2f}s: {query_request.query[:50]}...")
+    
+    # Format sources (sources are always (doc, similarity) tuples); metadata is passed as is,
+    # since validating the response model already builds a new dict from it
+    sources = [
+        {
+            "content": doc.page_content,
+            "metadata": doc.metadata,
+            "similarity": float(similarity)
+        }
+        for doc, similarity in result.get("sources", [])
+    ]
+    
+    # Get query_params, or use user's query if empty
+    query_params = result.get("query_params", {})
+    if not query_params:
+        query_params = {"query": query_request.query}
+    
+    return QueryResponse(
+        input=query_params,
+        answer=result["response"],
+        agents_used=result.get("agents_used", []),
+        routing_mode=result.get("routing_mode", "single"),
+        sources=sources,
+        session_id=session_id,
+        elapsed_time_seconds=round(elapsed, 2)
+    )
+
+
 # Voucher endpoints
 class VoucherResponse(BaseModel):
     """Voucher response model."""
@@ -195,11 +214,11 @@ class VoucherResponse(BaseModel):
     summary="Generate a new voucher",
     description="Generate a new $2000 USD voucher code. Returns existing unused voucher if user already has one."
 )
-def generate_voucher(http_request: Request, db: Session = Depends(get_db)):
+@limiter.limit(VOUCHER_RATE_LIMIT)
+def generate_voucher(request: Request, db: Session = Depends(get_db)):
     """Generate a new $2000 USD voucher or return existing unused one."""
     # Get session_id for the user
-    client_ip = get_client_ip(http_request)
-    session_id = generate_session_id(client_ip)
+    session_id = get_session_id(request)
     
     # Check if user already has an unused voucher
     existing_unused = db.query(Voucher).filter(
@@ -211,23 +230,25 @@ def generate_voucher(http_request: Request, db: Session = Depends(get_db)):
     if existing_unused:
         return existing_unused
     
-    # Generate a unique voucher code
+    # Create voucher with $2000 value under a random code; the unique index on code
+    # rejects the (practically impossible) collision, in which case a new code is drawn
     while True:
-        code = f"VOUCHER-{secrets.token_hex(8).upper()}"
-        existing = db.query(Voucher).filter(Voucher.code == code).first()
-        if not existing:
+        voucher = Voucher(
+            code=f"VOUCHER-{secrets.token_hex(8).upper()}",
+            amount=2000.00,
+            is_used=False,
+            generated_by_session=session_id
+        )
+        db.add(voucher)
+        try:
+            db.flush()  # INSERT ... RETURNING id
             break
-    
-    # Create voucher with $2000 value
-    voucher = Voucher(
-        code=code,
-        amount=2000.00,
-        is_used=False,
-        generated_by_session=session_id
-    )
-    db.add(voucher)
+        except IntegrityError:
+            db.rollback()
+    # Every response field is known after the INSERT; detach so the commit does not expire
+    # them and force a reload (refresh) before serialization
+    db.expunge(voucher)
     db.commit()
-    db.refresh(voucher)
     
     return voucher
 
@@ -262,8 +283,7 @@ def get_cart(http_request: Request):
     Returns:
         Cart response with items and total
     """
-    client_ip = get_client_ip(http_request)
-    session_id = generate_session_id(client_ip)
+    session_id = get_session_id(http_request)
     
     summary = cart_manager.get_cart_summary(session_id)
     
@@ -315,6 +335,15 @@ class OrderResponse(BaseModel):
         from_attributes = True
 
 
+# List validators built once; each validates a whole list of ORM objects or rows in one call
+_order_items_adapter = TypeAdapter(List[OrderItemResponse])
+_product_list_adapter = TypeAdapter(List[ProductResponse])
+
+# Product listings select plain column rows: no ORM objects or identity-map entries for
+# read-only pages (attribute names match column names, so rows validate like entities)
+PRODUCT_COLUMNS = tuple(getattr(Product, column.key) for column in Product.__table__.columns)
+
+
 @router.get("/orders", response_model=List[OrderResponse], summary="Get user's orders")
 def get_orders(http_request: Request, db: Session = Depends(get_db)):
     """
@@ -326,35 +355,20 @@ def get_orders(http_request: Request, db: Session = Depends(get_db)):
     Returns:
         List of order responses
     """
-    client_ip = get_client_ip(http_request)
-    session_id = generate_session_id(client_ip)
+    session_id = get_session_id(http_request)
     
-    # Query orders for this session, ordered by creation date (newest first)
-    orders = db.query(Order).filter(
+    # Query orders for this session, ordered by creation date (newest first);
+    # items for all orders are loaded with one extra IN query instead of one per order
+    orders = db.query(Order).options(selectinload(Order.items)).filter(
         Order.session_id == session_id
     ).order_by(Order.created_at.desc()).all()
     
-    # Build response with order items and shipping address
-    order_responses = []
-    for order in orders:
-        order_items = [
-            OrderItemResponse(
-                id=item.id,
-                product_id=item.product_id,
-                product_name=item.product_name,
-                quantity=item.quantity,
-                unit_price=float(item.unit_price),
-                subtotal=float(item.subtotal)
-            )
-            for item in order.items
-        ]
-        
-        # Get shipping address for this session
+    # Shipping address is per session, so every order shares it
+    shipping_address = None
+    if orders:
         shipping_info = db.query(ShippingInfo).filter(
-            ShippingInfo.session_id == order.session_id
+            ShippingInfo.session_id == session_id
         ).order_by(ShippingInfo.updated_at.desc()).first()
-        
-        shipping_address = None
         if shipping_info:
             shipping_address = ShippingAddressResponse(
                 full_name=shipping_info.full_name,
@@ -362,12 +376,17 @@ def get_orders(http_request: Request, db: Session = Depends(get_db)):
                 city=shipping_info.city,
                 zip_code=shipping_info.zip_code
             )
+    
+    # Build response with order items and shipping address
+    order_responses = []
+    for order in orders:
+        order_items = _order_items_adapter.validate_python(order.items, from_attributes=True)
         
         order_responses.append(OrderResponse(
             id=order.id,
             session_id=order.session_id,
             voucher_code=order.voucher_code,
-            total_amount=float(order.total_amount),
+            total_amount=order.total_amount,
             status=order.status,
             created_at=order.created_at.isoformat(),
             items=order_items,
@@ -384,11 +403,47 @@ class ProductListResponse(BaseModel):
     total: int
     page: int
     page_size: int
+    next_cursor: Optional[str] = Field(None, description="Pass as cursor to fetch the next page (None on the last page)")
+
+
+def _encode_product_cursor(created_at: datetime, product_id: int) -> str:
+    """Encode the position after a product in the catalog order as an opaque cursor."""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{product_id}".encode()).decode()
+
+
+def _decode_product_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a cursor produced by _encode_product_cursor.
+    
+    Args:
+        cursor: Cursor from a previous response's next_cursor
+        
+    Returns:
+        Tuple of (created_at, product_id) of the last product already returned
+        
+    Raises:
+        HTTPException: 400 if the cursor is malformed
+    """
+    try:
+        created_at, product_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(product_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# Cache-Control of catalog pages: not stored by shared caches, always revalidated by ETag
+PRODUCT_LIST_CACHE_CONTROL = "private, no-cache"
+
+# Rendered catalog pages keyed by ETag (filters + catalog version), so repeated browsing
+# of an unchanged catalog skips the listing queries
+_product_list_cache: TTLCache = TTLCache(maxsize=512, ttl=300)
+_product_list_cache_lock = threading.Lock()
 
 
 @router.get("/products", response_model=ProductListResponse, summary="Get products with search and filters")
 def get_products(
     http_request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     search: Optional[str] = Query(None, description="Search query for product name, description, or SKU"),
     category: Optional[str] = Query(None, description="Filter by category"),
@@ -399,7 +454,8 @@ def get_products(
     is_featured: Optional[bool] = Query(None, description="Filter by featured status"),
     is_active: Optional[bool] = Query(True, description="Filter by active status (default: True)"),
     page: int = Query(1, ge=1, description="Page number (1-indexed)"),
-    page_size: int = Query(20, ge=1, le=100, description="Number of items per page")
+    page_size: int = Query(20, ge=1, le=100, description="Number of items per page"),
+    cursor: Optional[str] = Query(None, description="Cursor from next_cursor; continues after the previous page (page is then ignored)")
 ):
     """
     Get products with search and filtering capabilities.
@@ -407,7 +463,7 @@ def get_products(
     Supports:
     - Text search across product name, description, and SKU
     - Filtering by category, brand, price range, tags, featured status, and active status
-    - Pagination with configurable page size
+    - Pagination with configurable page size, by page number or by cursor (constant cost at any depth)
     
     Args:
         search: Search query (searches in name, description, SKU)
@@ -420,10 +476,33 @@ def get_products(
         is_active: Filter by active status (default: True)
         page: Page number (default: 1)
         page_size: Items per page (default: 20, max: 100)
+        cursor: next_cursor of the previous page (keyset pagination)
     
     Returns:
         Paginated list of products matching the criteria
     """
+    # The catalog version (bumped by every product write) identifies the listing; reading it
+    # is a primary-key lookup, so unchanged pages cost no listing queries
+    version = hashlib.blake2b(
+        repr((
+            search, category, brand, min_price, max_price, tags, is_featured, is_active, page, page_size, cursor,
+            get_catalog_version(db)
+        )).encode(),
+        digest_size=16
+    ).hexdigest()
+    etag = f'W/"{version}"'
+    # Pages carry stock and prices: clients may keep them but must revalidate before reuse
+    response.headers["Cache-Control"] = PRODUCT_LIST_CACHE_CONTROL
+    if not_modified(http_request, response, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": etag, "Cache-Control": PRODUCT_LIST_CACHE_CONTROL}
+        )
+    with _product_list_cache_lock:
+        cached = _product_list_cache.get(etag)
+    if cached is not None:
+        return cached
+    
     # Start with base query
     query = db.query(Product)
     
@@ -460,44 +539,43 @@ def get_products(
     if is_featured is not None:
         query = query.filter(Product.is_featured == is_featured)
     
-    # Apply tags filter (product must have at least one of the specified tags)
-    # Note: Tags filtering is done in Python after applying other filters
-    # for compatibility with PostgreSQL JSON columns. This could be optimized
-    # later with JSONB queries for better performance.
-    apply_tags_filter = False
-    tag_list = []
-    if tags:
-        tag_list = [tag.strip().lower() for tag in tags.split(",") if tag.strip()]
-        apply_tags_filter = len(tag_list) > 0
-    
-    # If tags filter is needed, fetch all matching products (after other filters)
-    # then filter by tags in Python, then paginate
-    if apply_tags_filter:
-        # Apply all other filters first, then filter tags in Python
-        all_matching_products = query.order_by(Product.created_at.desc()).all()
-        # Filter by tags (case-insensitive match)
-        filtered_products = [
-            p for p in all_matching_products
-            if p.tags and isinstance(p.tags, list) and
-            any(requested_tag in [t.lower() for t in p.tags] for requested_tag in tag_list)
-        ]
-        total = len(filtered_products)
-        
-        # Apply pagination to filtered results
-        offset = (page - 1) * page_size
-        products = filtered_products[offset:offset + page_size]
+    # Apply tags filter (product must have at least one of the specified tags);
+    # tags are stored lowercased, and the JSONB ?| operator is served by the GIN index
+    tag_list = [tag.strip().lower() for tag in tags.split(",") if tag.strip()] if tags else []
+    if tag_list:
+        query = query.filter(Product.tags.has_any(array(tag_list)))
+    
+    page_query = query.with_entities(*PRODUCT_COLUMNS).order_by(Product.created_at.desc(), Product.id.desc())
+    if cursor:
+        # Keyset pagination: seek past the last product returned instead of skipping OFFSET rows
+        page_query = page_query.filter(tuple_(Product.created_at, Product.id) < _decode_product_cursor(cursor))
+    else:
+        page_query = page_query.offset((page - 1) * page_size)
+    
+    if not cursor:
+        # The window count is computed before OFFSET/LIMIT, so one query returns the page and the total
+        products = page_query.add_columns(func.count().over().label("total")).limit(page_size).all()
+        # A page past the end has no rows to carry the total: count separately
+        total = products[0].total if products else query.count()
     else:
-        # No tags filter, use normal pagination
+        # The keyset condition would shrink a window count, so count the filtered rows separately
         total = query.count()
-        offset = (page - 1) * page_size
-        products = query.order_by(Product.created_at.desc()).offset(offset).limit(page_size).all()
+        products = page_query.limit(page_size).all()
     
-    return ProductListResponse(
-        products=[ProductResponse.model_validate(product) for product in products],
+    next_cursor = None
+    if len(products) == page_size:
+        next_cursor = _encode_product_cursor(products[-1].created_at, products[-1].id)
+    
+    result = ProductListResponse(
+        products=_product_list_adapter.validate_python(products, from_attributes=True),
         total=total,
         page=page,
-        page_size=page_size
+        page_size=page_size,
+        next_cursor=next_cursor
     )
+    with _product_list_cache_lock:
+        _product_list_cache[etag] = result
+    return result
 
 
 @router.get("/products/featured", response_model=List[ProductResponse], summary="Get featured products")
@@ -510,12 +588,12 @@ def get_featured_products(
     
     Returns active products marked as featured, ordered by creation date.
     """
-    products = db.query(Product).filter(
+    products = db.query(*PRODUCT_COLUMNS).filter(
         Product.is_active == True,
         Product.is_featured == True
     ).order_by(Product.created_at.desc()).limit(limit).all()
     
-    return [ProductResponse.model_validate(product) for product in products]
+    return _product_list_adapter.validate_python(products, from_attributes=True)
 
 
 @router.get("/products/{product_id}", response_model=ProductResponse, summary="Get product by ID")
@@ -528,12 +606,9 @@ def get_product_by_id(
     
     Returns the product details if found and active.
     """
-    product = db.query(Product).filter(
-        Product.id == product_id,
-        Product.is_active == True
-    ).first()
+    product = db.get(Product, product_id)
     
-    if not product:
+    if not product or not product.is_active:
         raise HTTPException(
             status_code=404,
             detail=f"Product with ID {product_id} not found"
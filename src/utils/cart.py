@@ -1,10 +1,14 @@
 """Cart state management for user sessions."""
+import time
+from operator import itemgetter
 from typing import Dict, List, Optional
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
 from collections import defaultdict
+import orjson
+from src.config import settings
 
 
-@dataclass
+@dataclass(slots=True)
 class CartItem:
     """Represents an item in the cart."""
     product_id: int
@@ -24,8 +28,21 @@ class CartManager:
     
     def __init__(self):
         """Initialize cart manager with empty carts."""
-        # session_id -> List[CartItem]
-        self._carts: Dict[str, List[CartItem]] = defaultdict(list)
+        # session_id -> {product_id: CartItem}, in the order items were added
+        self._carts: Dict[str, Dict[int, CartItem]] = defaultdict(dict)
+    
+    def _load_cart(self, session_id: str) -> Dict[int, CartItem]:
+        """Load the items of a cart by product ID (storage hook; in-process carts return the live dict)."""
+        return self._carts.get(session_id, {})
+    
+    def _save_cart(self, session_id: str, cart: Dict[int, CartItem]):
+        """Persist a cart after it was changed (storage hook)."""
+        self._carts[session_id] = cart
+    
+    @staticmethod
+    def _total(cart: Dict[int, CartItem]) -> float:
+        """Sum the subtotals of already loaded cart items."""
+        return sum(item.subtotal for item in cart.values())
     
     def add_to_cart(
         self,
@@ -50,32 +67,31 @@ class CartManager:
         Returns:
             Dictionary with cart status and message
         """
-        cart = self._carts[session_id]
+        cart = self._load_cart(session_id)
         
         # Check if product already in cart
-        for item in cart:
-            if item.product_id == product_id:
-                return {
-                    "success": False,
-                    "message": f"{product_name} is already in your cart. Use edit_item_in_cart to update the quantity.",
-                    "cart_total": self.get_cart_total(session_id),
-                    "item_count": len(cart)
-                }
+        if product_id in cart:
+            return {
+                "success": False,
+                "message": f"{product_name} is already in your cart. Use edit_item_in_cart to update the quantity.",
+                "cart_total": self.get_cart_total(session_id),
+                "item_count": len(cart)
+            }
         
         # Add new item
-        cart_item = CartItem(
+        cart[product_id] = CartItem(
             product_id=product_id,
             product_name=product_name,
             quantity=quantity,
             unit_price=unit_price,
             primary_image=primary_image
         )
-        cart.append(cart_item)
+        self._save_cart(session_id, cart)
         
         return {
             "success": True,
             "message": f"Added {quantity}x {product_name} to cart",
-            "cart_total": self.get_cart_total(session_id),
+            "cart_total": self._total(cart),
             "item_count": len(cart)
         }
     
@@ -96,7 +112,7 @@ class CartManager:
         Returns:
             Dictionary with cart status and message
         """
-        cart = self._carts.get(session_id, [])
+        cart = self._load_cart(session_id)
         
         if quantity <= 0:
             return {
@@ -107,15 +123,16 @@ class CartManager:
             }
         
         # Find item in cart
-        for item in cart:
-            if item.product_id == product_id:
-                item.quantity = quantity
-                return {
-                    "success": True,
-                    "message": f"Updated {item.product_name} quantity to {quantity}",
-                    "cart_total": self.get_cart_total(session_id),
-                    "item_count": len(cart)
-                }
+        item = cart.get(product_id)
+        if item is not None:
+            item.quantity = quantity
+            self._save_cart(session_id, cart)
+            return {
+                "success": True,
+                "message": f"Updated {item.product_name} quantity to {quantity}",
+                "cart_total": self._total(cart),
+                "item_count": len(cart)
+            }
         
         return {
             "success": False,
@@ -139,19 +156,18 @@ class CartManager:
         Returns:
             Dictionary with cart status and message
         """
-        cart = self._carts.get(session_id, [])
+        cart = self._load_cart(session_id)
         
         # Find and remove item
-        for i, item in enumerate(cart):
-            if item.product_id == product_id:
-                product_name = item.product_name
-                cart.pop(i)
-                return {
-                    "success": True,
-                    "message": f"Removed {product_name} from cart",
-                    "cart_total": self.get_cart_total(session_id),
-                    "item_count": len(cart)
-                }
+        item = cart.pop(product_id, None)
+        if item is not None:
+            self._save_cart(session_id, cart)
+            return {
+                "success": True,
+                "message": f"Removed {item.product_name} from cart",
+                "cart_total": self._total(cart),
+                "item_count": len(cart)
+            }
         
         return {
             "success": False,
@@ -168,9 +184,9 @@ class CartManager:
             session_id: User session identifier
             
         Returns:
-            List of cart items
+            List of cart items, in the order they were added
         """
-        return self._carts.get(session_id, [])
+        return list(self._load_cart(session_id).values())
     
     def get_cart_total(self, session_id: str) -> float:
         """
@@ -182,8 +198,7 @@ class CartManager:
         Returns:
             Total cart amount
         """
-        cart = self._carts.get(session_id, [])
-        return sum(item.subtotal for item in cart)
+        return self._total(self._load_cart(session_id))
     
     def clear_cart(self, session_id: str):
         """
@@ -192,8 +207,7 @@ class CartManager:
         Args:
             session_id: User session identifier
         """
-        if session_id in self._carts:
-            self._carts[session_id] = []
+        self._carts.pop(session_id, None)
     
     def get_cart_summary(self, session_id: str) -> Dict[str, any]:
         """
@@ -206,7 +220,6 @@ class CartManager:
             Dictionary with cart summary
         """
         cart = self.get_cart(session_id)
-        total = self.get_cart_total(session_id)
         
         items = [
             {
@@ -214,11 +227,13 @@ class CartManager:
                 "product_name": item.product_name,
                 "quantity": item.quantity,
                 "unit_price": float(item.unit_price),
-                "subtotal": float(item.subtotal),
+                "subtotal": item.subtotal,
                 "primary_image": item.primary_image
             }
             for item in cart
         ]
+        # Sum the subtotals computed above instead of walking the cart a second time
+        total = sum(item["subtotal"] for item in items)
         
         return {
             "items": items,
@@ -228,6 +243,206 @@ class CartManager:
         }
 
 
-# Global cart manager instance
-cart_manager = CartManager()
+
+class RedisCartManager(CartManager):
+    """
+    Cart manager storing carts in Redis so every worker process sees the same cart.
+    
+    Each cart is a hash at cart:{session_id} mapping product_id to the JSON-encoded item,
+    so items are added, updated and removed field by field. Carts expire after a day
+    without changes. Every mutator writes Redis directly; the in-process _save_cart hook
+    is not used.
+    """
+    
+    # Seconds an untouched cart is kept
+    CART_TTL_SECONDS = 86400
+    
+    def __init__(self, redis_url: str):
+        """
+        Initialize the Redis-backed cart manager.
+        
+        Args:
+            redis_url: Redis connection URL (e.g. redis://localhost:6379/0)
+        """
+        # Optional dependency: only needed when REDIS_URL is configured
+        import redis
+        
+        super().__init__()
+        self._redis = redis.Redis.from_url(redis_url)
+        self._watch_error = redis.WatchError
+    
+    @staticmethod
+    def _key(session_id: str) -> str:
+        """Redis key of a session's cart."""
+        return f"cart:{session_id}"
+    
+    @staticmethod
+    def _encode(item: CartItem, position: int) -> bytes:
+        """Encode a cart item with its position (cart order) for storage."""
+        return orjson.dumps({**asdict(item), "position": position})
+    
+    @staticmethod
+    def _decode(payloads: List[bytes]) -> Dict[int, CartItem]:
+        """Decode stored items by product ID, in the order they were added."""
+        positioned = []
+        for payload in payloads:
+            entry = orjson.loads(payload)
+            position = entry.pop("position")
+            positioned.append((position, CartItem(**entry)))
+        positioned.sort(key=itemgetter(0))
+        return {item.product_id: item for _, item in positioned}
+    
+    def _result(self, success: bool, message: str, cart: Dict[int, CartItem]) -> Dict[str, any]:
+        """Build the status dictionary returned by cart operations."""
+        return {
+            "success": success,
+            "message": message,
+            "cart_total": self._total(cart),
+            "item_count": len(cart)
+        }
+    
+    def _load_cart(self, session_id: str) -> Dict[int, CartItem]:
+        """Load a cart from its Redis hash."""
+        return self._decode(self._redis.hvals(self._key(session_id)))
+    
+    def add_to_cart(
+        self,
+        session_id: str,
+        product_id: int,
+        product_name: str,
+        quantity: int,
+        unit_price: float,
+        primary_image: Optional[str] = None
+    ) -> Dict[str, any]:
+        """
+        Add a product to the cart. Only adds if item doesn't already exist.
+        
+        HSETNX makes the "already in cart" check and the insert one atomic step.
+        
+        Args:
+            session_id: User session identifier
+            product_id: Product ID to add
+            product_name: Product name
+            quantity: Quantity to add
+            unit_price: Price per unit
+            primary_image: Optional product image URL
+            
+        Returns:
+            Dictionary with cart status and message
+        """
+        key = self._key(session_id)
+        item = CartItem(
+            product_id=product_id,
+            product_name=product_name,
+            quantity=quantity,
+            unit_price=unit_price,
+            primary_image=primary_image
+        )
+        with self._redis.pipeline() as pipe:
+            pipe.hsetnx(key, str(product_id), self._encode(item, time.time_ns()))
+            pipe.expire(key, self.CART_TTL_SECONDS)
+            pipe.hvals(key)
+            added, _, payloads = pipe.execute()
+        cart = self._decode(payloads)
+        
+        if not added:
+            return self._result(
+                False,
+                f"{product_name} is already in your cart. Use edit_item_in_cart to update the quantity.",
+                cart
+            )
+        return self._result(True, f"Added {quantity}x {product_name} to cart", cart)
+    
+    def edit_item_in_cart(
+        self,
+        session_id: str,
+        product_id: int,
+        quantity: int
+    ) -> Dict[str, any]:
+        """
+        Update the quantity of an item in the cart.
+        
+        The item is read and rewritten in one WATCH/MULTI transaction, so an item removed
+        concurrently is never written back (the transaction retries and finds it gone).
+        
+        Args:
+            session_id: User session identifier
+            product_id: Product ID to update
+            quantity: New quantity (must be > 0)
+            
+        Returns:
+            Dictionary with cart status and message
+        """
+        if quantity <= 0:
+            return self._result(
+                False,
+                "Quantity must be greater than 0. Use remove_from_cart to remove items.",
+                self._load_cart(session_id)
+            )
+        
+        key = self._key(session_id)
+        field = str(product_id)
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    payload = pipe.hget(key, field)
+                    if payload is None:
+                        return self._result(
+                            False, f"Product with ID {product_id} not found in cart.", self._decode(pipe.hvals(key))
+                        )
+                    
+                    # Rewrite only this item's field, keeping its position in the cart
+                    entry = orjson.loads(payload)
+                    entry["quantity"] = quantity
+                    pipe.multi()
+                    pipe.hset(key, field, orjson.dumps(entry))
+                    pipe.expire(key, self.CART_TTL_SECONDS)
+                    pipe.hvals(key)
+                    _, _, payloads = pipe.execute()
+                    break
+                except self._watch_error:
+                    # The cart changed between the read and the write; read it again
+                    continue
+        return self._result(True, f"Updated {entry['product_name']} quantity to {quantity}", self._decode(payloads))
+    
+    def remove_from_cart(
+        self,
+        session_id: str,
+        product_id: int
+    ) -> Dict[str, any]:
+        """
+        Remove an item from the cart.
+        
+        Args:
+            session_id: User session identifier
+            product_id: Product ID to remove
+            
+        Returns:
+            Dictionary with cart status and message
+        """
+        key = self._key(session_id)
+        with self._redis.pipeline() as pipe:
+            pipe.hget(key, str(product_id))
+            pipe.hdel(key, str(product_id))
+            pipe.hvals(key)
+            payload, removed, payloads = pipe.execute()
+        cart = self._decode(payloads)
+        
+        if not removed:
+            return self._result(False, f"Product with ID {product_id} not found in cart.", cart)
+        return self._result(True, f"Removed {orjson.loads(payload)['product_name']} from cart", cart)
+    
+    def clear_cart(self, session_id: str):
+        """
+        Clear all items from cart.
+        
+        Args:
+            session_id: User session identifier
+        """
+        self._redis.delete(self._key(session_id))
+
+
+# Global cart manager instance (shared through Redis when REDIS_URL is set)
+cart_manager = RedisCartManager(settings.redis_url) if settings.redis_url else CartManager()
 
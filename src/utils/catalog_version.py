@@ -0,0 +1,42 @@
+"""Catalog version counter shared by all workers through the database."""
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from data.database.product_model import CatalogVersion
+
+# Primary key of the single catalog_version row
+CATALOG_VERSION_ID = 1
+
+
+def get_catalog_version(db: Session) -> int:
+    """
+    Read the current catalog version (a primary-key lookup).
+    
+    Args:
+        db: Database session
+        
+    Returns:
+        Catalog version (0 before the first product write)
+    """
+    version = db.scalar(select(CatalogVersion.version).where(CatalogVersion.id == CATALOG_VERSION_ID))
+    return version or 0
+
+
+def bump_catalog_version(db: Session):
+    """
+    Increment the catalog version in the caller's transaction.
+    
+    Call before committing any write to product data, so cached product listings
+    (and the ETags clients revalidate with) change in every worker once it commits.
+    
+    Args:
+        db: Database session
+    """
+    db.execute(
+        insert(CatalogVersion)
+        .values(id=CATALOG_VERSION_ID, version=1)
+        .on_conflict_do_update(
+            index_elements=[CatalogVersion.id],
+            set_={"version": CatalogVersion.version + 1}
+        )
+    )
@@ -0,0 +1,149 @@
+"""Per-turn database session shared by agent tool executions."""
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
+from sqlalchemy.orm import Session
+from data.database.connection import SessionLocal
+
+
+class _TurnSession:
+    """
+    A turn's Session plus the worker threads currently using it.
+
+    An operation that times out keeps running in its worker thread, so the session is
+    retired rather than closed: no new operation receives it, and it is closed by whoever
+    finishes last (the turn, or the last thread still using it).
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self._lock = threading.Lock()
+        self._users = 0
+        self._retired = False
+        self._closed = False
+
+    def acquire(self) -> bool:
+        """Start using the session from a worker thread; False once it is retired."""
+        with self._lock:
+            if self._retired:
+                return False
+            self._users += 1
+            return True
+
+    def release(self):
+        """Stop using the session; closes it if it was retired meanwhile and nobody else holds it."""
+        with self._lock:
+            self._users -= 1
+            close = self._retired and self._users == 0 and not self._closed
+            self._closed = self._closed or close
+        if close:
+            self.db.close()
+
+    def abandon(self):
+        """Stop handing out the session; the last thread releasing it (or the turn) closes it."""
+        with self._lock:
+            self._retired = True
+
+    def retire(self) -> bool:
+        """
+        Stop handing out the session at the end of the turn.
+
+        Returns:
+            True if the caller must close it now (no thread is using it)
+        """
+        with self._lock:
+            self._retired = True
+            close = self._users == 0 and not self._closed
+            self._closed = self._closed or close
+        return close
+
+
+# Session opened for the current agent turn (None outside a turn)
+_turn_db: ContextVar[Optional[_TurnSession]] = ContextVar("turn_db", default=None)
+
+
+@asynccontextmanager
+async def turn_db_session() -> AsyncIterator[Session]:
+    """
+    Open one database session and share it with every tool executed in the block.
+
+    Tool executors run in worker threads via run_db_operation_with_timeout, which copies
+    the current context, so they see the session through current_db().
+
+    Yields:
+        The shared session
+    """
+    turn = _TurnSession(SessionLocal())
+    token = _turn_db.set(turn)
+    try:
+        yield turn.db
+    finally:
+        _turn_db.reset(token)
+        # A timed-out operation may still be using the session; it then closes it when done.
+        # Closing may roll back an open transaction; keep that round trip off the event loop
+        if turn.retire():
+            await asyncio.to_thread(turn.db.close)
+
+
+def current_db() -> Optional[Session]:
+    """Return the session of the current turn, if any."""
+    turn = _turn_db.get()
+    return turn.db if turn is not None else None
+
+
+def leave_turn_db_session():
+    """
+    Stop using the turn session in the current context.
+
+    Call at the start of a task that runs tools concurrently with other tasks: a Session
+    must not be used from several threads at once, so such a task falls back to
+    short-lived sessions of its own. Only the calling task's context is affected.
+    """
+    _turn_db.set(None)
+
+
+def abandon_turn_db_session():
+    """
+    Stop using the turn session after an operation on it timed out.
+
+    The timed-out operation may still be running on the session in its worker thread, so
+    the session is retired (it is closed once that thread releases it) and the rest of the
+    turn falls back to short-lived sessions.
+    """
+    turn = _turn_db.get()
+    if turn is not None:
+        turn.abandon()
+        _turn_db.set(None)
+
+
+def get_tool_db() -> Session:
+    """
+    Get a session for a tool executor.
+
+    Returns:
+        The turn session if one is active, otherwise a new session
+        (release it with release_tool_db)
+    """
+    turn = _turn_db.get()
+    if turn is not None and turn.acquire():
+        return turn.db
+    return SessionLocal()
+
+
+def release_tool_db(db: Session):
+    """
+    Release a session obtained from get_tool_db.
+
+    The turn session is left open; it is closed when the turn ends (or, if it was
+    abandoned after a timeout, by the last thread releasing it).
+
+    Args:
+        db: Session returned by get_tool_db
+    """
+    turn = _turn_db.get()
+    if turn is not None and db is turn.db:
+        turn.release()
+    else:
+        db.close()
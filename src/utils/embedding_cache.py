@@ -0,0 +1,190 @@
+"""Query embedding cache shared by retrieval tools."""
+import asyncio
+import os
+import sqlite3
+from array import array
+from collections import OrderedDict
+from contextlib import closing
+from typing import Any, List, Optional, Union
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query so trivially different spellings share one embedding.
+
+    Args:
+        query: Raw search query
+
+    Returns:
+        Lowercased query with collapsed whitespace
+    """
+    return " ".join(query.strip().lower().split())
+
+
+class EmbeddingCache:
+    """
+    Caches query embeddings keyed by normalized query text.
+
+    Entries are either a finished embedding or the asyncio.Task still computing it, so a
+    speculative embedding started early in a turn is reused by the search that needs it.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        """
+        Initialize the embedding cache.
+
+        Args:
+            max_entries: Maximum number of cached queries (oldest are evicted first)
+        """
+        self.max_entries = max_entries
+        # normalized query -> embedding vector or in-flight asyncio.Task
+        self._entries: "OrderedDict[str, Union[List[float], asyncio.Task]]" = OrderedDict()
+
+    def prefetch(self, query: str, embedder: Any) -> Union[List[float], asyncio.Task]:
+        """
+        Start embedding a query in the background unless it is already cached.
+
+        Must be called from a running event loop.
+
+        Args:
+            query: Search query
+            embedder: LangChain embeddings instance (e.g. OpenAIEmbeddings)
+
+        Returns:
+            Cached embedding, or the task computing it
+        """
+        key = normalize_query(query)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._start(key, embedder.aembed_query(key))
+        return entry
+
+    def prefetch_many(self, queries: List[str], embedder: Any):
+        """
+        Start embedding several queries with a single embeddings request.
+
+        Queries that are already cached (or in flight) are skipped.
+        Must be called from a running event loop.
+
+        Args:
+            queries: Search queries
+            embedder: LangChain embeddings instance (e.g. OpenAIEmbeddings)
+        """
+        keys = [key for key in dict.fromkeys(normalize_query(q) for q in queries) if key not in self._entries]
+        if len(keys) == 1:
+            self._start(keys[0], embedder.aembed_query(keys[0]))
+        elif keys:
+            batch = asyncio.ensure_future(embedder.aembed_documents(keys))
+            for i, key in enumerate(keys):
+                self._start(key, self._pick(batch, i))
+
+    @staticmethod
+    async def _pick(batch: asyncio.Future, index: int) -> List[float]:
+        """Await a batch embedding request and return one of its vectors."""
+        return (await batch)[index]
+
+    def _start(self, key: str, coro: Any) -> asyncio.Task:
+        """Schedule an embedding computation and cache its task under key."""
+        task = asyncio.create_task(coro)
+        task.add_done_callback(lambda done, key=key: self._resolve(key, done))
+        self._entries[key] = task
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return task
+
+    async def get_or_embed_async(self, query: str, embedder: Any) -> List[float]:
+        """
+        Get the embedding for a query, awaiting an in-flight computation if there is one.
+
+        Args:
+            query: Search query
+            embedder: LangChain embeddings instance (e.g. OpenAIEmbeddings)
+
+        Returns:
+            Query embedding
+        """
+        entry = self.prefetch(query, embedder)
+        if isinstance(entry, asyncio.Task):
+            # Shield so a caller timing out does not cancel the shared computation
+            return await asyncio.shield(entry)
+        return entry
+
+    def get(self, query: str) -> Optional[List[float]]:
+        """
+        Get a finished embedding for a query without computing it.
+
+        Args:
+            query: Search query
+
+        Returns:
+            Query embedding, or None if not cached (or still being computed)
+        """
+        entry = self._entries.get(normalize_query(query))
+        return None if isinstance(entry, asyncio.Task) else entry
+
+    def save(self, path: str, model: str):
+        """
+        Snapshot finished embeddings to a SQLite file so the next process starts warm.
+
+        In-flight computations are skipped. The previous snapshot is replaced.
+
+        Args:
+            path: SQLite database file
+            model: Embedding model name (snapshots from another model are never loaded)
+        """
+        rows = [
+            (key, model, array("f", entry).tobytes())
+            for key, entry in self._entries.items()
+            if not isinstance(entry, asyncio.Task)
+        ]
+        with closing(sqlite3.connect(path)) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings "
+                "(query TEXT PRIMARY KEY, model TEXT NOT NULL, embedding BLOB NOT NULL)"
+            )
+            conn.execute("DELETE FROM query_embeddings")
+            # Inserted oldest first, so rowid order is the LRU order
+            conn.executemany("INSERT INTO query_embeddings VALUES (?, ?, ?)", rows)
+
+    def load(self, path: str, model: str) -> int:
+        """
+        Fill the cache from a snapshot written by save().
+
+        Args:
+            path: SQLite database file (a missing file is ignored)
+            model: Embedding model name the snapshot must match
+
+        Returns:
+            Number of embeddings loaded
+        """
+        if not os.path.exists(path):
+            return 0
+        with closing(sqlite3.connect(path)) as conn:
+            rows = conn.execute(
+                "SELECT query, embedding FROM query_embeddings WHERE model = ? "
+                "ORDER BY rowid DESC LIMIT ?",
+                (model, self.max_entries)
+            ).fetchall()
+        for key, blob in reversed(rows):
+            if key not in self._entries:
+                vector = array("f")
+                vector.frombytes(blob)
+                self._entries[key] = vector.tolist()
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return len(rows)
+
+    def _resolve(self, key: str, task: asyncio.Task):
+        """Replace a finished task with its embedding, or drop it if it failed."""
+        # Always retrieve the exception so failed speculative embeddings are not logged as unhandled
+        failed = task.cancelled() or task.exception() is not None
+        if self._entries.get(key) is not task:
+            return
+        if failed:
+            del self._entries[key]
+        else:
+            self._entries[key] = task.result()
+
+
+# Global embedding cache instance
+embedding_cache = EmbeddingCache()
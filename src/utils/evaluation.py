@@ -4,11 +4,17 @@ LLM-as-a-Judge Evaluation Service for Quality Scoring.
 Evaluates chatbot responses across multiple quality dimensions using an LLM judge.
 Scores are submitted to Langfuse for tracking and analytics.
 """
-import json
 import asyncio
+import hashlib
+import random
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
+import httpx
+import orjson
+from cachetools import TTLCache
 from langfuse import get_client
-from langfuse.openai import AsyncOpenAI
+from src.utils.llm import get_async_http_client, get_openai_client
 from src.config import settings
 
 
@@ -21,20 +27,12 @@ QUALITY_DIMENSIONS = [
     "helpfulness"     # How helpful is the response in achieving the user's goal?
 ]
 
+# (dimension, Langfuse score name) pairs
+DIMENSION_SCORE_NAMES = tuple((dimension, f"quality_{dimension}") for dimension in QUALITY_DIMENSIONS)
 
-EVALUATION_PROMPT = """You are an expert evaluator for an e-commerce chatbot called Shoplytic.
-Your task is to evaluate the quality of the chatbot's response to a user query.
-
-**User Query:**
-{query}
-
-**Chatbot Response:**
-{response}
-
-**Agents Used:**
-{agents_used}
 
-Evaluate the response on the following dimensions, scoring each from 1 to 10:
+# Scoring rubric shared by single and batch evaluations
+EVALUATION_RUBRIC = """Evaluate the response on the following dimensions, scoring each from 1 to 10:
 
 1. **Relevance** (1-10): How relevant is the response to the user's query?
    - 1-3: Completely off-topic or irrelevant
@@ -66,26 +64,270 @@ Evaluate the response on the following dimensions, scoring each from 1 to 10:
    - 7-9: Very helpful, guides user effectively
    - 10: Extremely helpful, exceeds expectations
 
+Keep each reasoning under 20 words."""
+
+# JSON fields of one evaluation
+EVALUATION_FIELDS = """    "overall_quality": <1-10>,
+    "relevance": {"score": <1-10>, "reasoning": "<brief explanation>"},
+    "accuracy": {"score": <1-10>, "reasoning": "<brief explanation>"},
+    "completeness": {"score": <1-10>, "reasoning": "<brief explanation>"},
+    "clarity": {"score": <1-10>, "reasoning": "<brief explanation>"},
+    "helpfulness": {"score": <1-10>, "reasoning": "<brief explanation>"},
+    "overall_reasoning": "<brief overall assessment>"
+"""
+
+# Static rubric, sent as the system message: it is the same on every call, so the provider
+# can serve it from its prompt cache and only the user turn below varies
+EVALUATION_SYSTEM_PROMPT = f"""You are an expert evaluator for an e-commerce chatbot called Shoplytic.
+Your task is to evaluate the quality of the chatbot's response to a user query.
+The user message contains the user query, the chatbot response and the agents used.
+
+{EVALUATION_RUBRIC}
+
 Respond with a JSON object in this exact format:
 {{
-    "overall_quality": <1-10>,
-    "relevance": {{"score": <1-10>, "reasoning": "<brief explanation>"}},
-    "accuracy": {{"score": <1-10>, "reasoning": "<brief explanation>"}},
-    "completeness": {{"score": <1-10>, "reasoning": "<brief explanation>"}},
-    "clarity": {{"score": <1-10>, "reasoning": "<brief explanation>"}},
-    "helpfulness": {{"score": <1-10>, "reasoning": "<brief explanation>"}},
-    "overall_reasoning": "<brief overall assessment>"
+{EVALUATION_FIELDS}}}
+
+Return ONLY the JSON object, no other text."""
+
+# System prompt for scoring several responses in one call
+EVALUATION_BATCH_SYSTEM_PROMPT = f"""You are an expert evaluator for an e-commerce chatbot called Shoplytic.
+Your task is to evaluate the quality of several chatbot responses, each to its own user query.
+The user message is a JSON array of items with an id, the user query, the chatbot response and
+the agents used. Evaluate every item independently.
+
+{EVALUATION_RUBRIC}
+
+Respond with a JSON object in this exact format, with one result per item:
+{{
+  "results": [
+    {{
+    "id": <item id>,
+{EVALUATION_FIELDS}    }}
+  ]
 }}
 
 Return ONLY the JSON object, no other text."""
 
+# System message sent with every evaluation request
+EVALUATOR_SYSTEM_MESSAGE = {"role": "system", "content": EVALUATION_SYSTEM_PROMPT}
+EVALUATOR_BATCH_SYSTEM_MESSAGE = {"role": "system", "content": EVALUATION_BATCH_SYSTEM_PROMPT}
+
+# Per-call part of the evaluation request
+EVALUATION_USER_TEMPLATE = """**User Query:**
+{query}
+
+**Chatbot Response:**
+{response}
+
+**Agents Used:**
+{agents_used}"""
+
+# Longest response prefix shown to the judge (characters)
+MAX_EVALUATED_RESPONSE_CHARS = 2000
+
+# Judge results of recently evaluated responses; reruns of the same golden dataset cases often
+# produce identical responses, which then only need their scores attached to the new trace
+_judge_result_cache: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+
+# HTTP statuses worth retrying when calling the judge without the OpenAI SDK
+JUDGE_RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+# Langfuse client, bound on first evaluation (after main.py has configured Langfuse)
+_langfuse = None
+
+
+@dataclass(frozen=True)
+class EvalItem:
+    """A chatbot response waiting to be evaluated."""
+    query: str
+    response: str
+    trace_id: str
+    agents_used: list[str]
+    session_id: Optional[str] = None
+
+
+def _truncate_response(response: str) -> str:
+    """Cut a response to the length shown to the judge (short responses are not copied)."""
+    return response if len(response) <= MAX_EVALUATED_RESPONSE_CHARS else response[:MAX_EVALUATED_RESPONSE_CHARS]
+
+
+def _judge_cache_key(query: str, response: str, agents: str) -> tuple:
+    """
+    Build the judge result cache key for a (truncated) response.
+    
+    Args:
+        query: The user's original query
+        response: The chatbot's response, as shown to the judge
+        agents: Comma-separated agents used
+        
+    Returns:
+        Hashable key holding a digest of the response instead of the response itself
+    """
+    return (query, agents, hashlib.blake2b(response.encode(), digest_size=16).digest())
+
+
+@lru_cache(maxsize=None)
+def _get_judge_client():
+    """
+    Get the OpenAI client used for judge calls.
+    
+    Same connection pool as the agents, but with more retries: the SDK retries rate limits
+    (429), connection errors and 5xx with exponential backoff and jitter, honoring
+    Retry-After, so bursts of evaluations are delayed rather than dropped.
+    """
+    return get_openai_client().with_options(max_retries=settings.judge_max_retries)
+
+
+def _get_langfuse():
+    """Return the Langfuse client, looking it up on first use."""
+    global _langfuse
+    return _langfuse or (_langfuse := get_client())
+
+
+def _build_scores(eval_result: dict) -> list[tuple[str, float, str]]:
+    """
+    Turn a judge result into Langfuse score payloads.
+    
+    Args:
+        eval_result: Parsed judge JSON for one response
+        
+    Returns:
+        (name, value, comment) tuples: overall quality first, then each dimension
+    """
+    scores = [(
+        "overall_quality",
+        float(eval_result.get("overall_quality", 5)),
+        eval_result.get("overall_reasoning", "")
+    )]
+    for dimension, score_name in DIMENSION_SCORE_NAMES:
+        dim_data = eval_result.get(dimension, {})
+        if isinstance(dim_data, dict):
+            score = dim_data.get("score", 5)
+            reasoning = dim_data.get("reasoning", "")
+        else:
+            score = dim_data if isinstance(dim_data, (int, float)) else 5
+            reasoning = ""
+        scores.append((score_name, float(score), reasoning))
+    return scores
+
+
+def _submit_scores(langfuse, trace_scores: list[tuple[str, list[tuple[str, float, str]]]], flush: bool = True):
+    """
+    Enqueue scores on their traces and optionally flush them to Langfuse.
+    
+    Args:
+        langfuse: Langfuse client
+        trace_scores: (trace_id, scores) pairs, scores being (name, value, comment) tuples
+        flush: Send the scores now; otherwise they go out with the SDK's next export batch
+    """
+    for trace_id, scores in trace_scores:
+        for name, value, comment in scores:
+            langfuse.create_score(
+                trace_id=trace_id,
+                name=name,
+                value=value,
+                data_type="NUMERIC",
+                comment=comment
+            )
+    
+    if flush:
+        langfuse.flush()
+
+
+async def _send_scores(trace_scores: list[tuple[str, list[tuple[str, float, str]]]], flush: bool):
+    """Submit scores; a flush blocks on HTTP, so it is kept off the event loop."""
+    if flush:
+        await asyncio.to_thread(_submit_scores, _get_langfuse(), trace_scores)
+    else:
+        # Only enqueues on the SDK's background exporter
+        _submit_scores(_get_langfuse(), trace_scores, flush=False)
+
+
+async def _call_judge(system_message: dict, user_content: str, item_count: int = 1) -> dict:
+    """
+    Send one request to the LLM judge and parse its JSON answer.
+    
+    Args:
+        system_message: Rubric system message
+        user_content: Responses to evaluate
+        item_count: Number of responses in user_content (scales the output token cap)
+        
+    Returns:
+        Parsed judge JSON
+        
+    Raises:
+        orjson.JSONDecodeError: If the judge did not return valid JSON
+    """
+    request_body = {
+        "model": "gpt-4o-mini",  # Use a cost-effective model for evaluation
+        "messages": [
+            system_message,
+            {"role": "user", "content": user_content}
+        ],
+        "response_format": {"type": "json_object"},
+        "max_tokens": settings.judge_max_tokens * item_count,
+        # Deterministic scoring, independent of the sampling settings of the user-facing agents
+        "temperature": 0.0
+    }
+    if settings.eval_trace_judge:
+        eval_response = await _get_judge_client().chat.completions.create(**request_body)
+        content = eval_response.choices[0].message.content
+    else:
+        content = await _post_judge_request(request_body)
+    return orjson.loads(content)
+
+
+async def _post_judge_request(request_body: dict) -> str:
+    """
+    Call the chat completions endpoint directly, without the traced OpenAI client.
+    
+    Retries like the SDK does: rate limits, timeouts, connection errors and 5xx responses
+    are retried with exponential backoff and jitter, honoring Retry-After.
+    
+    Args:
+        request_body: Chat completion request
+        
+    Returns:
+        Content of the judge's answer
+        
+    Raises:
+        httpx.HTTPError: If the request still fails after the retries
+    """
+    url = f"{(settings.openai_api_base or 'https://api.openai.com/v1').rstrip('/')}/chat/completions"
+    headers = {"Authorization": f"Bearer {settings.openai_api_key}", "Content-Type": "application/json"}
+    body = orjson.dumps(request_body)
+    client = get_async_http_client()
+    
+    for attempt in range(settings.judge_max_retries + 1):
+        last_attempt = attempt == settings.judge_max_retries
+        retry_after = None
+        try:
+            response = await client.post(url, content=body, headers=headers)
+        except httpx.TransportError:
+            if last_attempt:
+                raise
+        else:
+            if response.status_code not in JUDGE_RETRY_STATUSES or last_attempt:
+                response.raise_for_status()
+                return orjson.loads(response.content)["choices"][0]["message"]["content"]
+            try:
+                retry_after = float(response.headers.get("retry-after", ""))
+            except ValueError:
+                pass
+        
+        if retry_after is None or not 0 <= retry_after <= 60:
+            retry_after = min(0.5 * 2 ** attempt, 8.0) * random.uniform(0.75, 1.0)
+        await asyncio.sleep(retry_after)
+
 
 async def evaluate_response(
     query: str,
     response: str,
     trace_id: str,
     agents_used: list[str],
-    session_id: Optional[str] = None
+    session_id: Optional[str] = None,
+    flush: bool = True
 ) -> Optional[dict]:
     """
     Evaluate a chatbot response using LLM-as-a-Judge.
@@ -96,76 +338,30 @@ async def evaluate_response(
         trace_id: Langfuse trace ID to attach scores to
         agents_used: List of agents that handled the query
         session_id: Optional session ID for context
+        flush: Send the scores to Langfuse right away (background evaluations leave them
+            to the SDK's batched export)
         
     Returns:
         Dictionary with evaluation scores, or None if evaluation failed
     """
-    langfuse = get_client()
-    
-    # Initialize OpenAI client for evaluation
-    client_kwargs = {"api_key": settings.openai_api_key}
-    if settings.openai_api_base:
-        client_kwargs["base_url"] = settings.openai_api_base
-    client = AsyncOpenAI(**client_kwargs)
-    
-    # Format the evaluation prompt
-    eval_prompt = EVALUATION_PROMPT.format(
-        query=query,
-        response=response[:2000],  # Truncate long responses
-        agents_used=", ".join(agents_used) if agents_used else "none"
-    )
+    response = _truncate_response(response)
+    agents = ", ".join(agents_used) if agents_used else "none"
+    cache_key = _judge_cache_key(query, response, agents)
     
     try:
-        # Call the LLM judge
-        eval_response = await client.chat.completions.create(
-            model="gpt-4o-mini",  # Use a cost-effective model for evaluation
-            messages=[
-                {"role": "system", "content": "You are an expert evaluator. Always respond with valid JSON only."},
-                {"role": "user", "content": eval_prompt}
-            ],
-            response_format={"type": "json_object"},
-            temperature=settings.llm_temperature,
-            top_p=settings.llm_top_p
-        )
-        
-        # Parse the evaluation result
-        eval_content = eval_response.choices[0].message.content
-        eval_result = json.loads(eval_content)
+        eval_result = _judge_result_cache.get(cache_key)
+        if eval_result is None:
+            # Format the evaluation prompt and call the LLM judge
+            eval_prompt = EVALUATION_USER_TEMPLATE.format(query=query, response=response, agents_used=agents)
+            eval_result = await _call_judge(EVALUATOR_SYSTEM_MESSAGE, eval_prompt)
+            _judge_result_cache[cache_key] = eval_result
         
         # Submit scores to Langfuse
-        # 1. Overall quality score
-        langfuse.create_score(
-            trace_id=trace_id,
-            name="overall_quality",
-            value=float(eval_result.get("overall_quality", 5)),
-            data_type="NUMERIC",
-            comment=eval_result.get("overall_reasoning", "")
-        )
-        
-        # 2. Individual dimension scores
-        for dimension in QUALITY_DIMENSIONS:
-            dim_data = eval_result.get(dimension, {})
-            if isinstance(dim_data, dict):
-                score = dim_data.get("score", 5)
-                reasoning = dim_data.get("reasoning", "")
-            else:
-                score = dim_data if isinstance(dim_data, (int, float)) else 5
-                reasoning = ""
-            
-            langfuse.create_score(
-                trace_id=trace_id,
-                name=f"quality_{dimension}",
-                value=float(score),
-                data_type="NUMERIC",
-                comment=reasoning
-            )
-        
-        # Flush to ensure scores are sent
-        langfuse.flush()
+        await _send_scores([(trace_id, _build_scores(eval_result))], flush)
         
         return eval_result
         
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         print(f"[EVALUATION] Failed to parse evaluation JSON: {e}")
         return None
     except Exception as e:
@@ -173,6 +369,167 @@ async def evaluate_response(
         return None
 
 
+async def _evaluate_items(items: list[EvalItem], flush: bool) -> list[Optional[dict]]:
+    """Evaluate items with one judge call each."""
+    return list(await asyncio.gather(*(
+        evaluate_response(
+            query=item.query,
+            response=item.response,
+            trace_id=item.trace_id,
+            agents_used=item.agents_used,
+            session_id=item.session_id,
+            flush=flush
+        )
+        for item in items
+    )))
+
+
+async def evaluate_batch(items: list[EvalItem], flush: bool = True) -> list[Optional[dict]]:
+    """
+    Evaluate several chatbot responses with a single LLM judge call.
+    
+    Responses judged recently are answered from the judge result cache. Items the judge
+    leaves out of its answer are evaluated one by one, as are all items if the batch answer
+    cannot be parsed.
+    
+    Args:
+        items: Responses to evaluate
+        flush: Send the scores to Langfuse right away
+        
+    Returns:
+        Evaluation result (or None if evaluation failed) for each item, in order
+    """
+    if len(items) < 2:
+        return await _evaluate_items(items, flush)
+    
+    prompts = [
+        {
+            "id": i,
+            "query": item.query,
+            "response": _truncate_response(item.response),
+            "agents_used": ", ".join(item.agents_used) if item.agents_used else "none"
+        }
+        for i, item in enumerate(items)
+    ]
+    cache_keys = [_judge_cache_key(p["query"], p["response"], p["agents_used"]) for p in prompts]
+    results: list[Optional[dict]] = [_judge_result_cache.get(key) for key in cache_keys]
+    to_judge = [prompt for prompt, result in zip(prompts, results) if result is None]
+    
+    judge_failed = False
+    if len(to_judge) >= 2:
+        try:
+            batch_result = await _call_judge(
+                EVALUATOR_BATCH_SYSTEM_MESSAGE,
+                orjson.dumps(to_judge).decode(),
+                item_count=len(to_judge)
+            )
+        except orjson.JSONDecodeError as e:
+            print(f"[EVALUATION] Failed to parse batch evaluation JSON, evaluating one by one: {e}")
+            batch_result = {}
+        except Exception as e:
+            print(f"[EVALUATION] Batch evaluation failed: {e}")
+            batch_result, judge_failed = {}, True
+        for result in batch_result.get("results", []) if isinstance(batch_result, dict) else []:
+            if not isinstance(result, dict):
+                continue
+            i = result.pop("id", None)
+            if isinstance(i, int) and 0 <= i < len(items) and results[i] is None:
+                results[i] = _judge_result_cache[cache_keys[i]] = result
+    
+    trace_scores = [
+        (item.trace_id, _build_scores(result))
+        for item, result in zip(items, results)
+        if result is not None
+    ]
+    try:
+        if trace_scores:
+            await _send_scores(trace_scores, flush)
+    except Exception as e:
+        print(f"[EVALUATION] Failed to submit batch scores: {e}")
+    
+    missing = [] if judge_failed else [i for i, result in enumerate(results) if result is None]
+    if missing:
+        for i, result in zip(missing, await _evaluate_items([items[i] for i in missing], flush)):
+            results[i] = result
+    return results
+
+
+class EvaluationBatcher:
+    """
+    Collects responses to evaluate and sends them to the judge in batches.
+    
+    A batch is sent once max_size items are waiting, or max_wait seconds after its first
+    item arrived, whichever comes first.
+    """
+    
+    def __init__(self, max_size: int = 5, max_wait: float = 2.0):
+        """
+        Initialize the batcher.
+        
+        Args:
+            max_size: Maximum number of responses per judge call
+            max_wait: Maximum seconds an item waits for the batch to fill
+        """
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._pending: list[tuple[EvalItem, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Running batch tasks (kept referenced until done)
+        self._tasks: set[asyncio.Task] = set()
+    
+    def submit(self, item: EvalItem) -> asyncio.Future:
+        """
+        Queue a response for evaluation.
+        
+        Must be called from a running event loop.
+        
+        Args:
+            item: Response to evaluate
+            
+        Returns:
+            Future resolving to the evaluation result (None if evaluation failed)
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return future
+    
+    def _flush(self):
+        """Send the waiting items to the judge."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    @staticmethod
+    async def _run(batch: list[tuple[EvalItem, asyncio.Future]]):
+        """Evaluate one batch and resolve its futures."""
+        try:
+            # Scores go out with the SDK's batched export instead of one flush per batch
+            results = await evaluate_batch([item for item, _ in batch], flush=False)
+        except Exception as e:
+            print(f"[EVALUATION] Batch evaluation error: {e}")
+            results = [None] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+# Global evaluation batcher instance
+evaluation_batcher = EvaluationBatcher(
+    max_size=settings.evaluation_batch_size,
+    max_wait=settings.evaluation_batch_wait
+)
+
+
 async def evaluate_response_async(
     query: str,
     response: str,
@@ -183,6 +540,7 @@ async def evaluate_response_async(
     """
     Fire-and-forget async evaluation.
     Runs evaluation in background without blocking the main response.
+    Responses arriving close together are scored in one judge call (see EvaluationBatcher).
     
     Args:
         query: The user's original query
@@ -192,13 +550,13 @@ async def evaluate_response_async(
         session_id: Optional session ID for context
     """
     try:
-        await evaluate_response(
+        await evaluation_batcher.submit(EvalItem(
             query=query,
             response=response,
             trace_id=trace_id,
             agents_used=agents_used,
             session_id=session_id
-        )
+        ))
     except Exception as e:
         # Don't let evaluation errors affect the main flow
         print(f"[EVALUATION] Background evaluation error: {e}")
@@ -0,0 +1,21 @@
+"""HTTP conditional request helpers (ETag / If-None-Match)."""
+from fastapi import Request, Response
+
+
+def not_modified(request: Request, response: Response, etag: str) -> bool:
+    """
+    Attach an ETag to the response and check it against the request's If-None-Match.
+
+    Args:
+        request: Incoming request
+        response: Response whose headers receive the ETag
+        etag: Current ETag of the resource
+
+    Returns:
+        True if the client's cached copy is current (answer with 304)
+    """
+    response.headers["ETag"] = etag
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
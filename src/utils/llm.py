@@ -1,13 +1,76 @@
 """Utility functions for LLM operations."""
 import asyncio
-from typing import Any, Callable, Dict, Optional
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+import httpx
 from langfuse.openai import AsyncOpenAI
 from src.config import settings
+from src.utils.db_context import abandon_turn_db_session
 
 # Database operation timeout (5 seconds - should be much faster)
 DB_TIMEOUT = 5.0
 
 
+def _http_client_kwargs() -> Dict[str, Any]:
+    """Connection pool and timeout settings shared by the OpenAI HTTP clients."""
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.openai_max_connections,
+            max_keepalive_connections=settings.openai_max_keepalive_connections
+        ),
+        "timeout": httpx.Timeout(settings.llm_timeout, connect=5.0),
+        "follow_redirects": True
+    }
+
+
+@lru_cache(maxsize=None)
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Get the process-wide async HTTP client for OpenAI API calls.
+    
+    Chat completions and query embeddings go to the same API host, so sharing one
+    connection pool lets either reuse connections opened by the other.
+    
+    Returns:
+        Shared httpx.AsyncClient instance
+    """
+    return httpx.AsyncClient(**_http_client_kwargs())
+
+
+@lru_cache(maxsize=None)
+def get_sync_http_client() -> httpx.Client:
+    """
+    Get the process-wide sync HTTP client for OpenAI API calls (e.g. embeddings made
+    by the vector store's synchronous search methods).
+    
+    Returns:
+        Shared httpx.Client instance
+    """
+    return httpx.Client(**_http_client_kwargs())
+
+
+@lru_cache(maxsize=None)
+def get_openai_client() -> AsyncOpenAI:
+    """
+    Get the process-wide AsyncOpenAI client.
+    
+    All agents and the evaluator share one client so its HTTP connection pool is reused
+    across requests instead of paying a new TCP/TLS handshake per client.
+    
+    Returns:
+        Shared AsyncOpenAI client instance
+    """
+    client_kwargs = {
+        "api_key": settings.openai_api_key,
+        "http_client": get_async_http_client()
+    }
+    if settings.openai_api_base:
+        client_kwargs["base_url"] = settings.openai_api_base
+    return AsyncOpenAI(**client_kwargs)
+
+
 async def create_chat_completion_with_timeout(
     client: AsyncOpenAI,
     model: str,
@@ -52,6 +115,58 @@ async def create_chat_completion_with_timeout(
     )
 
 
+async def iterate_stream_with_timeout(stream: Any, timeout: Optional[float] = None) -> AsyncIterator[Any]:
+    """
+    Iterate a streaming chat completion, bounding the time taken by the whole stream.
+    
+    Args:
+        stream: Async iterable returned by chat.completions.create(stream=True)
+        timeout: Overall timeout in seconds (defaults to settings.llm_timeout)
+        
+    Yields:
+        Stream chunks as they arrive
+        
+    Raises:
+        asyncio.TimeoutError: If the stream does not finish within the timeout
+    """
+    if timeout is None:
+        timeout = settings.llm_timeout
+    
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    iterator = stream.__aiter__()
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), timeout=remaining)
+            except StopAsyncIteration:
+                return
+            yield chunk
+    except asyncio.TimeoutError:
+        # Release the underlying HTTP connection instead of leaving it to garbage collection
+        close = getattr(stream, "close", None)
+        if close is not None:
+            await close()
+        raise
+
+
+@lru_cache(maxsize=None)
+def get_db_executor() -> ThreadPoolExecutor:
+    """
+    Get the thread pool that runs blocking database operations for the agents.
+    
+    It has as many threads as the connection pool has connections, so a burst of tool
+    calls queues here instead of piling up threads that all wait for a connection.
+    
+    Returns:
+        Shared ThreadPoolExecutor instance
+    """
+    return ThreadPoolExecutor(max_workers=settings.db_pool_size, thread_name_prefix="db")
+
+
 async def run_db_operation_with_timeout(
     func: Callable,
     timeout: float = DB_TIMEOUT,
@@ -60,7 +175,11 @@ async def run_db_operation_with_timeout(
     **kwargs
 ) -> Any:
     """
-    Run a blocking database operation in a thread pool with timeout.
+    Run a blocking database operation in the database thread pool with timeout.
+    
+    Like asyncio.to_thread, the operation runs in a copy of the current context, so it
+    sees the agent turn's database session (see src.utils.db_context). If it times out,
+    the turn session is abandoned, since the operation may still be using it.
     
     Args:
         func: The blocking function to execute
@@ -75,12 +194,17 @@ async def run_db_operation_with_timeout(
     Raises:
         asyncio.TimeoutError: If the operation exceeds the timeout (with error message)
     """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
     try:
         return await asyncio.wait_for(
-            asyncio.to_thread(func, *args, **kwargs),
+            loop.run_in_executor(get_db_executor(), partial(context.run, func, *args, **kwargs)),
             timeout=timeout
         )
     except asyncio.TimeoutError:
+        # The operation keeps running in its worker thread, possibly on the turn session,
+        # so later operations of the turn must not share that session with it
+        abandon_turn_db_session()
         # Create a new TimeoutError with the custom message
         error = asyncio.TimeoutError()
         error.args = (timeout_error_message,)
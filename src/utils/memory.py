@@ -1,6 +1,68 @@
 """Memory management for conversation context."""
-from typing import List, Dict, Any
 from collections import deque
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+from langchain_core.documents import Document
+
+
+@dataclass(slots=True, frozen=True)
+class ProductRef:
+    """Product fields from a search source that are kept in conversation history."""
+    product_id: Any
+    brand: Any
+    category: Any
+    price: Any
+
+
+def _product_refs(sources: List[Any]) -> Tuple[ProductRef, ...]:
+    """
+    Extract the product fields of search sources, dropping the documents themselves.
+    
+    Args:
+        sources: Source documents or (document, similarity) tuples
+        
+    Returns:
+        A ProductRef for each source that carries a product_id
+    """
+    refs = []
+    for source in sources:
+        doc = source[0] if isinstance(source, tuple) else source
+        if isinstance(doc, Document):
+            metadata = doc.metadata
+            product_id = metadata.get("product_id")
+            if product_id:
+                refs.append(ProductRef(
+                    product_id=product_id,
+                    brand=metadata.get("brand", "N/A"),
+                    category=metadata.get("category", "N/A"),
+                    price=metadata.get("price", "N/A")
+                ))
+    return tuple(refs)
+
+
+def _render_response(response: str, products: Tuple[ProductRef, ...]) -> str:
+    """
+    Append product information to an assistant response.
+    
+    This makes product_ids available for future queries.
+    
+    Args:
+        response: Agent response
+        products: Products from the response's search sources
+        
+    Returns:
+        Response with product information appended, or the response itself if there
+        are no products
+    """
+    if not products:
+        return response
+    return response + "\n\n[Previous search results with product_ids:]\n" + "\n\n---\n\n".join(
+        f"Product ID: {ref.product_id}\n"
+        f"Brand: {ref.brand}\n"
+        f"Category: {ref.category}\n"
+        f"Price: ${ref.price}"
+        for ref in products
+    )
 
 
 class ConversationMemory:
@@ -29,10 +91,14 @@ class ConversationMemory:
         if session_id not in self.sessions:
             self.sessions[session_id] = deque(maxlen=self.max_queries)
         
+        # Only the product fields used in the context are kept, not the source documents
+        products = _product_refs(sources or [])
         self.sessions[session_id].append({
             "query": query,
             "response": response,
-            "sources": sources or []
+            "products": products,
+            # History entries never change, so the assistant message is rendered once here
+            "rendered": _render_response(response, products)
         })
     
     def get_history(self, session_id: str) -> List[Dict[str, str]]:
@@ -57,41 +123,11 @@ class ConversationMemory:
         Returns:
             List of messages in OpenAI format, with product information included in assistant responses
         """
-        history = self.get_history(session_id)
-        messages = []
-        for item in history:
-            messages.append({"role": "user", "content": item["query"]})
-            
-            # Include assistant response, and append product information from sources if available
-            response_content = item["response"]
-            sources = item.get("sources", [])
-            
-            # If there are sources with product information, append it to the response
-            # This makes product_ids available for future queries
-            if sources:
-                from langchain_core.documents import Document
-                product_info_parts = []
-                for source in sources:
-                    if isinstance(source, tuple):
-                        doc, similarity = source
-                    else:
-                        doc = source
-                    
-                    if isinstance(doc, Document):
-                        product_id = doc.metadata.get("product_id")
-                        if product_id:
-                            product_info_parts.append(
-                                f"Product ID: {product_id}\n"
-                                f"Brand: {doc.metadata.get('brand', 'N/A')}\n"
-                                f"Category: {doc.metadata.get('category', 'N/A')}\n"
-                                f"Price: ${doc.metadata.get('price', 'N/A')}"
-                            )
-                
-                if product_info_parts:
-                    # Append product information to the response so it's visible in conversation context
-                    response_content += "\n\n[Previous search results with product_ids:]\n" + "\n\n---\n\n".join(product_info_parts)
-            
-            messages.append({"role": "assistant", "content": response_content})
-        
-        return messages
-
+        return [
+            message
+            for item in self.sessions.get(session_id, ())
+            for message in (
+                {"role": "user", "content": item["query"]},
+                {"role": "assistant", "content": item["rendered"]}
+            )
+        ]
@@ -0,0 +1,13 @@
+"""Shared rate limiter for API routes."""
+from slowapi import Limiter
+from src.config import settings
+from src.utils.session import get_session_id
+
+# Limits are tracked per session (derived from the client IP, as for carts and orders)
+limiter = Limiter(key_func=get_session_id, enabled=settings.rate_limit_enabled)
+
+# Limit for the LLM-backed query endpoint
+QUERY_RATE_LIMIT = f"{settings.rate_limit_per_minute}/minute"
+
+# Limit for voucher generation
+VOUCHER_RATE_LIMIT = f"{settings.voucher_rate_limit_per_minute}/minute"
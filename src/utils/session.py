@@ -0,0 +1,85 @@
+"""Session identification for anonymous (IP-based) users."""
+import hashlib
+from functools import lru_cache
+from fastapi import Request
+
+
+def get_client_ip(request: Request) -> str:
+    """
+    Extract client IP address from request.
+    Handles proxies and forwarded headers.
+    
+    Args:
+        request: FastAPI request object
+        
+    Returns:
+        Client IP address as string
+    """
+    # Resolved once per request; later calls reuse it
+    client_ip = getattr(request.state, "client_ip", None)
+    if client_ip is not None:
+        return client_ip
+    
+    # One pass over the raw ASGI headers (names are lowercase bytes) picks up both proxy headers,
+    # instead of two case-insensitive lookups that each scan the header list
+    forwarded_for = real_ip = None
+    for name, value in request.scope["headers"]:
+        if name == b"x-forwarded-for" and forwarded_for is None:
+            forwarded_for = value
+        elif name == b"x-real-ip" and real_ip is None:
+            real_ip = value
+    
+    if forwarded_for:
+        # Check for forwarded IP (when behind proxy/load balancer)
+        # X-Forwarded-For can contain multiple IPs, take the first one
+        client_ip = forwarded_for.decode("latin-1").split(",")[0].strip()
+    elif real_ip:
+        # Check for real IP header
+        client_ip = real_ip.decode("latin-1").strip()
+    elif request.client:
+        # Fallback to direct client IP
+        client_ip = request.client.host
+    else:
+        client_ip = "unknown"
+    
+    request.state.client_ip = client_ip
+    return client_ip
+
+
+@lru_cache(maxsize=4096)
+def generate_session_id(ip_address: str) -> str:
+    """
+    Generate a consistent session_id from IP address.
+    Uses hash to ensure consistent ID for same IP.
+    
+    Args:
+        ip_address: Client IP address
+        
+    Returns:
+        Session ID based on IP address
+    """
+    # Hash the IP address to create a consistent session_id
+    # This ensures same IP always gets same session_id. The hash is only an identifier
+    # (stored orders, vouchers and shipping info are keyed by it), so it must not change.
+    hash_obj = hashlib.md5(ip_address.encode(), usedforsecurity=False)
+    return f"session_{hash_obj.hexdigest()[:16]}"
+
+
+def get_session_id(request: Request) -> str:
+    """
+    Get the session_id of the client making a request.
+
+    Resolved once per request and kept on request.state, so the rate limiter key and the
+    route handler share one computation.
+
+    Args:
+        request: FastAPI request object
+
+    Returns:
+        Session ID based on the client IP address
+    """
+    session_id = getattr(request.state, "session_id", None)
+    if session_id is None:
+        session_id = generate_session_id(get_client_ip(request))
+        request.state.session_id = session_id
+    return session_id
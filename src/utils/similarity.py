@@ -12,7 +12,9 @@ def filter_by_similarity_threshold(
     Filter search results by similarity threshold.
     
     Converts ChromaDB distance scores to similarity scores and filters
-    documents that meet the minimum similarity threshold.
+    documents that meet the minimum similarity threshold. ChromaDB returns
+    results ordered by ascending distance, so scanning stops at the first
+    result below the threshold.
     
     Args:
         results_with_scores: List of (Document, distance_score) tuples from vector store
@@ -22,13 +24,13 @@ def filter_by_similarity_threshold(
     Returns:
         List of (Document, similarity_score) tuples that meet the similarity threshold
     """
+    # Compare distances directly: similarity >= min_similarity <=> distance <= 1 - min_similarity
+    max_distance = 1 - min_similarity
     filtered_docs = []
-    for doc, distance in results_with_scores:
-        similarity = 1 - distance  # Convert distance to similarity score
-        if similarity >= min_similarity:
-            filtered_docs.append((doc, similarity))
-        if len(filtered_docs) >= k:  # Stop once we have k results
+    for doc, distance in results_with_scores[:k]:
+        if distance > max_distance:  # Every later result is further away
             break
+        filtered_docs.append((doc, 1 - distance))  # Convert distance to similarity score
     
     return filtered_docs
 
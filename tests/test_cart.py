@@ -0,0 +1,80 @@
+"""Tests for the in-process cart manager (src.utils.cart)."""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.utils.cart import CartManager
+
+SESSION = "session_cart"
+
+
+@pytest.fixture
+def manager():
+    return CartManager()
+
+
+def test_totals_follow_add_edit_and_remove(manager):
+    assert manager.add_to_cart(SESSION, 1, "Mouse", 2, 19.99)["cart_total"] == pytest.approx(39.98)
+    assert manager.add_to_cart(SESSION, 2, "Keyboard", 1, 49.5)["cart_total"] == pytest.approx(89.48)
+
+    result = manager.edit_item_in_cart(SESSION, 1, 3)
+    assert result["success"]
+    assert result["cart_total"] == pytest.approx(109.47)
+
+    result = manager.remove_from_cart(SESSION, 2)
+    assert result["success"]
+    assert result["cart_total"] == pytest.approx(59.97)
+    assert manager.get_cart_total(SESSION) == pytest.approx(59.97)
+
+    assert manager.remove_from_cart(SESSION, 1)["cart_total"] == 0
+    assert manager.get_cart_total(SESSION) == 0
+
+
+def test_rejected_changes_keep_the_total(manager):
+    manager.add_to_cart(SESSION, 1, "Mouse", 2, 10.0)
+
+    assert not manager.add_to_cart(SESSION, 1, "Mouse", 5, 10.0)["success"]
+    assert not manager.edit_item_in_cart(SESSION, 1, 0)["success"]
+    assert not manager.edit_item_in_cart(SESSION, 99, 1)["success"]
+    assert not manager.remove_from_cart(SESSION, 99)["success"]
+
+    assert manager.get_cart_total(SESSION) == pytest.approx(20.0)
+    assert [item.quantity for item in manager.get_cart(SESSION)] == [2]
+
+
+def test_clear_cart_resets_total(manager):
+    manager.add_to_cart(SESSION, 1, "Mouse", 1, 10.0)
+    manager.clear_cart(SESSION)
+
+    assert manager.get_cart(SESSION) == []
+    assert manager.get_cart_total(SESSION) == 0
+    assert manager.add_to_cart(SESSION, 2, "Keyboard", 1, 5.0)["cart_total"] == pytest.approx(5.0)
+
+
+def test_summary_matches_total(manager):
+    manager.add_to_cart(SESSION, 1, "Mouse", 2, 10.0)
+    manager.add_to_cart(SESSION, 2, "Keyboard", 1, 5.25)
+
+    summary = manager.get_cart_summary(SESSION)
+
+    assert [item["product_id"] for item in summary["items"]] == [1, 2]
+    assert summary["total"] == pytest.approx(manager.get_cart_total(SESSION))
+    assert summary["total_formatted"] == "$25.25"
+
+
+def test_concurrent_changes_leave_a_consistent_total(manager):
+    # Tools run in worker threads, so one session's cart can change from several at once
+    def churn(product_id: int):
+        manager.add_to_cart(SESSION, product_id, f"Product {product_id}", 1, 1.25)
+        for quantity in range(2, 6):
+            manager.edit_item_in_cart(SESSION, product_id, quantity)
+        if product_id % 2:
+            manager.remove_from_cart(SESSION, product_id)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(churn, range(64)))
+
+    cart = manager.get_cart(SESSION)
+    assert len(cart) == 32
+    assert manager.get_cart_total(SESSION) == pytest.approx(sum(item.subtotal for item in cart))
+    assert manager.get_cart_total(SESSION) == pytest.approx(32 * 5 * 1.25)
@@ -0,0 +1,76 @@
+"""Tests for the per-turn database session (src.utils.db_context)."""
+import asyncio
+import time
+
+import pytest
+
+from src.utils import db_context
+from src.utils.llm import run_db_operation_with_timeout
+
+
+class FakeSession:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fake_sessions(monkeypatch):
+    """Replace SessionLocal with a factory that records every session it creates."""
+    sessions = []
+
+    def factory():
+        session = FakeSession()
+        sessions.append(session)
+        return session
+
+    monkeypatch.setattr(db_context, "SessionLocal", factory)
+    return sessions
+
+
+@pytest.mark.asyncio
+async def test_turn_session_is_shared_and_closed_at_turn_end(fake_sessions):
+    async with db_context.turn_db_session() as turn_db:
+        db = db_context.get_tool_db()
+        assert db is turn_db
+        db_context.release_tool_db(db)
+        assert not turn_db.closed
+
+    assert turn_db.closed
+    assert len(fake_sessions) == 1
+
+
+@pytest.mark.asyncio
+async def test_timed_out_operation_keeps_turn_session_until_it_finishes(fake_sessions):
+    seen = {}
+
+    def slow_tool():
+        db = db_context.get_tool_db()
+        try:
+            time.sleep(0.3)
+            seen["closed_while_running"] = db.closed
+        finally:
+            db_context.release_tool_db(db)
+
+    def fast_tool():
+        db = db_context.get_tool_db()
+        try:
+            seen["fast_db"] = db
+        finally:
+            db_context.release_tool_db(db)
+
+    async with db_context.turn_db_session() as turn_db:
+        with pytest.raises(asyncio.TimeoutError):
+            await run_db_operation_with_timeout(slow_tool, timeout=0.05)
+        # The rest of the turn no longer shares the session with the running thread
+        await run_db_operation_with_timeout(fast_tool, timeout=1)
+        assert seen["fast_db"] is not turn_db
+        assert seen["fast_db"].closed
+
+    # The turn ended while the thread still held the session, so it stays open
+    assert not turn_db.closed
+    await asyncio.sleep(0.5)
+    assert seen["closed_while_running"] is False
+    assert turn_db.closed
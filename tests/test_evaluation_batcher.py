@@ -0,0 +1,66 @@
+"""Tests for batching responses sent to the LLM judge (EvaluationBatcher)."""
+import asyncio
+import os
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from src.utils import evaluation
+from src.utils.evaluation import EvalItem, EvaluationBatcher
+
+
+def _item(n: int) -> EvalItem:
+    return EvalItem(query=f"query {n}", response=f"response {n}", trace_id=f"trace-{n}", agents_used=["order"])
+
+
+@pytest.fixture
+def judge_calls(monkeypatch):
+    """Replace the judge with one that scores each item by its trace id."""
+    calls = []
+
+    async def fake_evaluate_batch(items, flush=True):
+        calls.append([item.trace_id for item in items])
+        return [{"trace_id": item.trace_id} for item in items]
+
+    monkeypatch.setattr(evaluation, "evaluate_batch", fake_evaluate_batch)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_sent_at_once(judge_calls):
+    batcher = EvaluationBatcher(max_size=3, max_wait=60)
+
+    futures = [batcher.submit(_item(n)) for n in range(3)]
+    results = await asyncio.wait_for(asyncio.gather(*futures), timeout=1)
+
+    assert judge_calls == [["trace-0", "trace-1", "trace-2"]]
+    assert [result["trace_id"] for result in results] == ["trace-0", "trace-1", "trace-2"]
+
+
+@pytest.mark.asyncio
+async def test_partial_batch_is_sent_after_max_wait(judge_calls):
+    batcher = EvaluationBatcher(max_size=5, max_wait=0.05)
+
+    futures = [batcher.submit(_item(n)) for n in range(2)]
+    await asyncio.sleep(0.01)
+    assert judge_calls == []
+
+    results = await asyncio.wait_for(asyncio.gather(*futures), timeout=1)
+    assert judge_calls == [["trace-0", "trace-1"]]
+    assert len(results) == 2
+
+
+@pytest.mark.asyncio
+async def test_judge_failure_resolves_the_batch_with_none(monkeypatch):
+    async def failing_evaluate_batch(items, flush=True):
+        raise RuntimeError("judge unavailable")
+
+    monkeypatch.setattr(evaluation, "evaluate_batch", failing_evaluate_batch)
+    batcher = EvaluationBatcher(max_size=2, max_wait=60)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(batcher.submit(_item(0)), batcher.submit(_item(1))), timeout=1
+    )
+
+    assert results == [None, None]
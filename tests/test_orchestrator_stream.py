@@ -0,0 +1,106 @@
+"""Tests for OrchestratorAgent answer streaming (invoke_stream)."""
+import os
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from src.querying.agents import orchestrator as orchestrator_module
+from src.querying.agents.orchestrator import OrchestratorAgent
+
+
+class FakeSpan:
+    def update(self, **kwargs):
+        pass
+
+
+class FakeLangfuse:
+    @contextmanager
+    def start_as_current_observation(self, **kwargs):
+        yield FakeSpan()
+
+    def get_current_trace_id(self):
+        return None
+
+
+class FakeMemory:
+    def __init__(self):
+        self.saved = []
+
+    def get_messages(self, session_id):
+        return []
+
+    def add_query(self, session_id, query, response, sources):
+        self.saved.append(response)
+
+
+class FakeOrderAgent:
+    """Order agent that streams a preamble, retracts it, then streams the answer."""
+
+    def __init__(self, *args):
+        pass
+
+    async def invoke_stream(self, query, session_id, conversation_history=None):
+        yield ("token", "Checking... ")
+        yield ("discard",)
+        yield ("token", "Your cart ")
+        yield ("token", "is empty.")
+        yield ("done", [], {"query": "cart"})
+
+
+def _routing_response(*function_names: str):
+    """Orchestrator completion routing the query to the given functions."""
+    tool_calls = [
+        SimpleNamespace(id=f"call_{i}", function=SimpleNamespace(name=name, arguments='{"query": "my cart"}'))
+        for i, name in enumerate(function_names)
+    ]
+    message = SimpleNamespace(content=None, tool_calls=tool_calls or None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def orchestrator(monkeypatch):
+    monkeypatch.setattr(orchestrator_module, "get_client", lambda: FakeLangfuse())
+    monkeypatch.setattr(orchestrator_module, "get_openai_client", lambda: None)
+    monkeypatch.setattr(orchestrator_module, "OrderAgent", FakeOrderAgent)
+
+    def build(routing_response) -> OrchestratorAgent:
+        async def fake_completion(**kwargs):
+            return routing_response
+
+        monkeypatch.setattr(orchestrator_module, "create_chat_completion_with_timeout", fake_completion)
+        return OrchestratorAgent(FakeMemory())
+
+    return build
+
+
+@pytest.mark.asyncio
+async def test_single_order_call_relays_agent_tokens(orchestrator):
+    agent = orchestrator(_routing_response("query_order_agent"))
+
+    events = [event async for event in agent.invoke_stream("what is in my cart?", "session_test")]
+
+    assert events[:-1] == [
+        ("token", "Checking... "), ("discard",), ("token", "Your cart "), ("token", "is empty.")
+    ]
+    done, result = events[-1]
+    assert done == "done"
+    assert result["response"] == "Your cart is empty."
+    assert result["agents_used"] == ["order"]
+    assert result["query_params"] == {"query": "cart"}
+    assert agent.memory.saved == ["Your cart is empty."]
+
+
+@pytest.mark.asyncio
+async def test_direct_reply_arrives_as_one_token(orchestrator):
+    routing = _routing_response()
+    routing.choices[0].message.content = "Hello! How can I help?"
+    agent = orchestrator(routing)
+
+    events = [event async for event in agent.invoke_stream("hi", "session_test")]
+
+    assert events[0] == ("token", "Hello! How can I help?")
+    assert events[-1][1]["routing_mode"] == "direct"
+    assert (await agent.invoke("hi", "session_test"))["response"] == "Hello! How can I help?"
@@ -0,0 +1,153 @@
+"""Tests for OrderAgent answer streaming (invoke_stream / collect)."""
+import os
+from contextlib import asynccontextmanager, contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from src.querying.agents import order as order_module
+from src.querying.agents.order import OrderAgent, collect
+
+
+def _content_chunk(text: str):
+    """Stream chunk carrying answer text."""
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text, tool_calls=None))])
+
+
+def _tool_call_chunk(index: int, call_id: str, name: str, arguments: str):
+    """Stream chunk carrying a complete tool call."""
+    tool_call = SimpleNamespace(
+        index=index,
+        id=call_id,
+        function=SimpleNamespace(name=name, arguments=arguments)
+    )
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None, tool_calls=[tool_call]))])
+
+
+class FakeCompletions:
+    """Returns one scripted stream per chat completion request."""
+
+    def __init__(self, steps: list):
+        self.steps = list(steps)
+        self.requests = []
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        chunks = self.steps.pop(0)
+
+        async def stream():
+            for chunk in chunks:
+                yield chunk
+
+        return stream()
+
+
+class FakeSpan:
+    def update(self, **kwargs):
+        pass
+
+
+class FakeLangfuse:
+    @contextmanager
+    def start_as_current_observation(self, **kwargs):
+        yield FakeSpan()
+
+
+@asynccontextmanager
+async def fake_turn_db_session():
+    yield None
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    """OrderAgent whose tools, tracing and database session are faked."""
+    monkeypatch.setattr(order_module, "get_client", lambda: FakeLangfuse())
+    monkeypatch.setattr(order_module, "turn_db_session", fake_turn_db_session)
+
+    async def fake_execute_tool(self, function_name, function_args, session_id, query):
+        return ("Your cart is empty.", [])
+
+    monkeypatch.setattr(OrderAgent, "_execute_tool", fake_execute_tool)
+
+    def build(steps: list) -> OrderAgent:
+        client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(steps)))
+        return OrderAgent(client=client)
+
+    return build
+
+
+@pytest.mark.asyncio
+async def test_preamble_before_tool_call_is_not_part_of_answer(agent):
+    order_agent = agent([
+        [
+            _content_chunk("Let me look that up. "),
+            _tool_call_chunk(0, "call_1", "view_cart", "{}"),
+        ],
+        [
+            _content_chunk("Your cart "),
+            _content_chunk("is empty."),
+        ],
+    ])
+
+    events = [event async for event in order_agent.invoke_stream("what is in my cart?", "session_test")]
+
+    # The preamble is streamed, then retracted once the tool call shows up
+    assert events[:2] == [("token", "Let me look that up. "), ("discard",)]
+    assert events[-1][0] == "done"
+
+    async def replay():
+        for event in events:
+            yield event
+
+    response, sources, query_params = await collect(replay())
+    assert response == "Your cart is empty."
+    assert sources == []
+    assert query_params == {}
+
+
+@pytest.mark.asyncio
+async def test_invoke_returns_only_final_step_text(agent):
+    order_agent = agent([
+        [
+            _content_chunk("Checking your cart..."),
+            _tool_call_chunk(0, "call_1", "view_cart", "{}"),
+        ],
+        [
+            _content_chunk("Nothing in your cart yet."),
+        ],
+    ])
+
+    response, _, _ = await order_agent.invoke("what is in my cart?", "session_test")
+
+    assert response == "Nothing in your cart yet."
+
+
+@pytest.mark.asyncio
+async def test_streamed_steps_request_token_usage(agent):
+    order_agent = agent([
+        [_tool_call_chunk(0, "call_1", "view_cart", "{}")],
+        [_content_chunk("Your cart is empty.")],
+    ])
+
+    await order_agent.invoke("what is in my cart?", "session_test")
+
+    requests = order_agent.client.chat.completions.requests
+    assert len(requests) == 2
+    for request in requests:
+        assert request["stream"] is True
+        assert request["stream_options"] == {"include_usage": True}
+
+
+@pytest.mark.asyncio
+async def test_collect_drops_text_before_discard():
+    async def events():
+        yield ("token", "partial ")
+        yield ("discard",)
+        yield ("token", "I apologize, but the request took too long to process. Please try again.")
+        yield ("done", [], {})
+
+    response, _, _ = await collect(events())
+
+    assert response == "I apologize, but the request took too long to process. Please try again."
@@ -0,0 +1,211 @@
+"""Tests for the catalog listing (GET /user/products): ETags, page cache and cursor pagination."""
+import os
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException, Response
+from starlette.requests import Request
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from data.database.product_schema import ProductUpdate
+from src.routes import admin as admin_routes
+from src.routes import user as user_routes
+
+
+class FakeQuery:
+    """Listing query returning fixed rows and recording its filters and OFFSET."""
+
+    def __init__(self, rows=(), count=0):
+        self.rows = list(rows)
+        self.total = count
+        self.criteria = []
+        self.offset_value = None
+
+    def __getattr__(self, name):
+        # with_entities / order_by / add_columns / limit chain
+        return lambda *args, **kwargs: self
+
+    def filter(self, *criteria):
+        self.criteria.extend(str(criterion) for criterion in criteria)
+        return self
+
+    def offset(self, value):
+        self.offset_value = value
+        return self
+
+    def all(self):
+        return self.rows
+
+    def count(self):
+        return self.total
+
+
+class FakeListingDb:
+    """Session exposing the catalog version and counting listing queries."""
+
+    def __init__(self, listing=None):
+        self.catalog_version = 1
+        self.listing_queries = 0
+        self.listing = listing or FakeQuery()
+
+    def scalar(self, statement):
+        return self.catalog_version
+
+    def query(self, *entities):
+        self.listing_queries += 1
+        return self.listing
+
+
+CREATED = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _product_row(product_id: int, total: int = 0):
+    """Listing row of a product created product_id minutes before CREATED."""
+    created_at = CREATED - timedelta(minutes=product_id)
+    return SimpleNamespace(
+        id=product_id, name=f"Product {product_id}", sku=f"SKU-{product_id}",
+        description="A product used in listing tests", price=Decimal("9.99"), cost_price=None,
+        stock_quantity=3, low_stock_threshold=10, weight=None, dimensions=None, category="audio",
+        tags=["audio"], images=None, primary_image=None, is_active=True, is_featured=False,
+        brand=None, created_at=created_at, updated_at=created_at, total=total
+    )
+
+
+def _request(etag=None) -> Request:
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    return Request({"type": "http", "method": "GET", "path": "/user/products", "headers": headers})
+
+
+def list_products(db, etag=None, **params):
+    """Call the route like FastAPI would, with the defaults of every query parameter."""
+    arguments = dict(
+        search=None, category=None, brand=None, min_price=None, max_price=None, tags=None,
+        is_featured=None, is_active=True, page=1, page_size=20, cursor=None
+    )
+    arguments.update(params)
+    response = Response()
+    result = user_routes.get_products(_request(etag), response, db=db, **arguments)
+    return result, response
+
+
+@pytest.fixture(autouse=True)
+def empty_page_cache():
+    user_routes._product_list_cache.clear()
+    yield
+    user_routes._product_list_cache.clear()
+
+
+def test_matching_etag_gets_304_without_listing_queries():
+    db = FakeListingDb()
+
+    result, response = list_products(db)
+    etag = response.headers["ETag"]
+    assert result.total == 0
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    assert db.listing_queries == 1
+
+    result, _ = list_products(db, etag=etag)
+    assert result.status_code == 304
+    assert result.headers["ETag"] == etag
+    assert result.headers["Cache-Control"] == "private, no-cache"
+    assert db.listing_queries == 1
+
+
+def test_unchanged_catalog_is_served_from_the_page_cache():
+    db = FakeListingDb()
+
+    first, _ = list_products(db, category="audio")
+    second, _ = list_products(db, category="audio")
+
+    assert second is first
+    assert db.listing_queries == 1
+
+
+def test_catalog_write_invalidates_etag_and_page_cache():
+    db = FakeListingDb()
+    _, response = list_products(db)
+    old_etag = response.headers["ETag"]
+
+    db.catalog_version += 1
+    result, response = list_products(db, etag=old_etag)
+
+    assert not isinstance(result, Response)
+    assert response.headers["ETag"] != old_etag
+    assert db.listing_queries == 2
+
+
+class FakeAdminDb:
+    """Session recording the statements of a product update."""
+
+    def __init__(self):
+        self.calls = []
+
+    def scalars(self, statement):
+        self.calls.append("update")
+        return SimpleNamespace(one_or_none=lambda: SimpleNamespace(id=7, name="Renamed"))
+
+    def expunge(self, instance):
+        self.calls.append("expunge")
+
+    def execute(self, statement):
+        self.calls.append(str(statement).split()[0].lower())
+
+    def commit(self):
+        self.calls.append("commit")
+
+
+def test_admin_update_bumps_catalog_version_in_its_transaction(monkeypatch):
+    invalidated = []
+    monkeypatch.setattr(admin_routes, "invalidate_product_cache", invalidated.append)
+    db = FakeAdminDb()
+
+    admin_routes._apply_product_update(db, 7, ProductUpdate(name="Renamed"))
+
+    # The version bump (INSERT ... ON CONFLICT DO UPDATE) commits together with the update
+    assert db.calls == ["update", "expunge", "insert", "commit"]
+    assert invalidated == [7]
+
+
+def test_full_page_returns_cursor_after_its_last_product():
+    listing = FakeQuery(rows=[_product_row(1, total=5), _product_row(2, total=5)])
+
+    result, _ = list_products(FakeListingDb(listing), page=2, page_size=2)
+
+    assert [product.id for product in result.products] == [1, 2]
+    # The window count carried by the rows is the total of all matches
+    assert result.total == 5
+    assert listing.offset_value == 2
+    assert user_routes._decode_product_cursor(result.next_cursor) == (CREATED - timedelta(minutes=2), 2)
+
+
+def test_cursor_page_seeks_past_the_cursor_instead_of_skipping_rows():
+    cursor = user_routes._encode_product_cursor(CREATED - timedelta(minutes=2), 2)
+    listing = FakeQuery(rows=[_product_row(3)], count=3)
+
+    result, _ = list_products(FakeListingDb(listing), page_size=2, cursor=cursor)
+
+    assert listing.offset_value is None
+    assert any("(products.created_at, products.id) <" in criterion for criterion in listing.criteria)
+    assert result.total == 3
+    # A short page is the last one
+    assert result.next_cursor is None
+
+
+def test_page_past_the_end_counts_matches_separately():
+    listing = FakeQuery(rows=[], count=4)
+
+    result, _ = list_products(FakeListingDb(listing), page=9)
+
+    assert result.products == []
+    assert result.total == 4
+    assert result.next_cursor is None
+
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        list_products(FakeListingDb(), cursor="not-a-cursor")
+
+    assert error.value.status_code == 400
@@ -0,0 +1,157 @@
+"""Tests for the purchase tool (execute_purchase)."""
+import os
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from src.querying.tools import order as order_tools
+from src.utils.cart import CartManager
+
+SESSION = "session_purchase"
+VOUCHER = "VOUCHER-1"
+
+
+def _result(row):
+    return SimpleNamespace(first=lambda: row)
+
+
+class FakePurchaseDb:
+    """
+    Session scripted for one purchase.
+
+    Args:
+        claim: Whether the voucher claim (UPDATE ... RETURNING) finds the unused voucher
+        flush_error: Whether inserting the order hits the unique index on orders.voucher_code
+        placed_order_id: Order already placed with the voucher (seen after a lost race)
+    """
+
+    def __init__(self, claim=True, flush_error=False, placed_order_id=None):
+        self.voucher = SimpleNamespace(amount=100.0, is_used=False)
+        self.claim = claim
+        self.flush_error = flush_error
+        self.placed_order_id = placed_order_id
+        self.added = []
+        self.committed = False
+        self.rolled_back = False
+
+    def execute(self, statement, params=None):
+        if statement.is_select:
+            # Voucher lookup joined with any order already placed with it
+            return _result((self.voucher, None))
+        if statement.is_update:
+            return _result((1,) if self.claim else None)
+        return _result(None)
+
+    def add(self, instance):
+        self.added.append(instance)
+
+    def flush(self):
+        if self.flush_error:
+            raise order_tools.IntegrityError("INSERT INTO orders", {}, Exception("duplicate key value"))
+        order = self.added[-1]
+        order.id = 42
+        order.created_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def scalar(self, statement):
+        return self.placed_order_id
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+@pytest.fixture
+def cart(monkeypatch):
+    """Fresh cart holding two products, with shipping details on file."""
+    manager = CartManager()
+    manager.add_to_cart(SESSION, 1, "Mouse", 2, 10.0)
+    manager.add_to_cart(SESSION, 2, "Keyboard", 1, 30.0)
+    monkeypatch.setattr(order_tools, "cart_manager", manager)
+    monkeypatch.setattr(
+        order_tools, "get_shipping_snapshot",
+        lambda session_id: SimpleNamespace(full_name="Ada Lovelace", address="1 Main St", city="London", zip_code="N1")
+    )
+    with order_tools._missing_vouchers_lock:
+        order_tools._missing_vouchers.clear()
+    return manager
+
+
+def purchase(monkeypatch, db) -> str:
+    monkeypatch.setattr(order_tools, "get_tool_db", lambda: db)
+    monkeypatch.setattr(order_tools, "release_tool_db", lambda session: None)
+    return order_tools.execute_purchase(SESSION, VOUCHER)
+
+
+def test_purchase_places_order_for_cart_total(monkeypatch, cart):
+    db = FakePurchaseDb()
+
+    message = purchase(monkeypatch, db)
+
+    assert message.startswith("✅ Purchase completed successfully!")
+    assert "Order ID: 42" in message
+    assert db.committed
+    assert db.added[0].total_amount == pytest.approx(50.0)
+    assert cart.get_cart(SESSION) == []
+
+
+def test_purchase_drops_cached_snapshots_of_purchased_products(monkeypatch, cart):
+    snapshot = order_tools.ProductSnapshot("Product", 10.0, True, 5, None)
+    with order_tools._product_cache_lock:
+        order_tools._product_cache.update({1: snapshot, 2: snapshot, 3: snapshot})
+
+    purchase(monkeypatch, FakePurchaseDb())
+
+    with order_tools._product_cache_lock:
+        assert 1 not in order_tools._product_cache
+        assert 2 not in order_tools._product_cache
+        assert order_tools._product_cache.pop(3) == snapshot
+
+
+def test_lost_voucher_claim_reports_the_order_placed_by_the_winner(monkeypatch, cart):
+    db = FakePurchaseDb(claim=False, placed_order_id=41)
+
+    message = purchase(monkeypatch, db)
+
+    assert message == "✅ Your purchase has already been placed. Order ID: 41"
+    assert db.rolled_back
+    assert not db.committed
+    assert db.added == []
+    assert len(cart.get_cart(SESSION)) == 2
+
+
+def test_lost_voucher_claim_without_an_order_reports_used_voucher(monkeypatch, cart):
+    db = FakePurchaseDb(claim=False)
+
+    message = purchase(monkeypatch, db)
+
+    assert message == f"Error: Voucher '{VOUCHER}' has already been used."
+    assert db.rolled_back
+    assert not db.committed
+
+
+def test_duplicate_order_on_unique_index_reports_the_placed_order(monkeypatch, cart):
+    # The claim succeeded, but a concurrent purchase inserted the order for this voucher first
+    db = FakePurchaseDb(flush_error=True, placed_order_id=41)
+
+    message = purchase(monkeypatch, db)
+
+    assert message == "✅ Your purchase has already been placed. Order ID: 41"
+    assert db.rolled_back
+    assert not db.committed
+    assert len(cart.get_cart(SESSION)) == 2
+
+
+def test_insufficient_voucher_balance_places_no_order(monkeypatch, cart):
+    db = FakePurchaseDb()
+    db.voucher.amount = 20.0
+
+    message = purchase(monkeypatch, db)
+
+    assert message.startswith("Error: Insufficient voucher balance.")
+    assert db.added == []
+    assert not db.committed
@@ -0,0 +1,95 @@
+"""Tests for the Redis cart manager (src.utils.cart.RedisCartManager)."""
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+redis = pytest.importorskip("redis")
+
+from src.utils.cart import RedisCartManager
+
+SESSION = "session_redis"
+KEY = f"cart:{SESSION}"
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def manager(monkeypatch, server):
+    monkeypatch.setattr(redis.Redis, "from_url", classmethod(lambda cls, url: fakeredis.FakeRedis(server=server)))
+    return RedisCartManager("redis://test")
+
+
+class RacingPipeline:
+    """Pipeline that runs another client's command right after its first HGET."""
+
+    def __init__(self, pipe, on_read):
+        self._pipe = pipe
+        self._on_read = on_read
+
+    def __getattr__(self, name):
+        return getattr(self._pipe, name)
+
+    def __enter__(self):
+        self._pipe.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._pipe.__exit__(*exc_info)
+
+    def hget(self, *args):
+        value = self._pipe.hget(*args)
+        if self._on_read is not None:
+            on_read, self._on_read = self._on_read, None
+            on_read()
+        return value
+
+
+def test_cart_keeps_insertion_order_and_totals(manager):
+    manager.add_to_cart(SESSION, 3, "Cable", 1, 5.0)
+    manager.add_to_cart(SESSION, 1, "Mouse", 2, 10.0)
+    manager.add_to_cart(SESSION, 2, "Keyboard", 1, 30.0)
+
+    result = manager.edit_item_in_cart(SESSION, 1, 3)
+
+    assert result["success"]
+    assert result["cart_total"] == pytest.approx(65.0)
+    assert [item.product_id for item in manager.get_cart(SESSION)] == [3, 1, 2]
+    assert manager.remove_from_cart(SESSION, 3)["cart_total"] == pytest.approx(60.0)
+    assert manager.get_cart_total(SESSION) == pytest.approx(60.0)
+
+
+def test_add_is_rejected_for_an_item_already_in_cart(manager):
+    manager.add_to_cart(SESSION, 1, "Mouse", 2, 10.0)
+
+    result = manager.add_to_cart(SESSION, 1, "Mouse", 5, 10.0)
+
+    assert not result["success"]
+    assert [item.quantity for item in manager.get_cart(SESSION)] == [2]
+
+
+def test_edit_does_not_resurrect_an_item_removed_concurrently(manager, server):
+    manager.add_to_cart(SESSION, 1, "Mouse", 2, 10.0)
+    manager.add_to_cart(SESSION, 2, "Keyboard", 1, 30.0)
+    other_worker = fakeredis.FakeRedis(server=server)
+    pipeline = manager._redis.pipeline
+    manager._redis.pipeline = lambda: RacingPipeline(pipeline(), lambda: other_worker.hdel(KEY, "1"))
+
+    result = manager.edit_item_in_cart(SESSION, 1, 5)
+
+    assert not result["success"]
+    assert [item.product_id for item in manager.get_cart(SESSION)] == [2]
+    assert manager.get_cart_total(SESSION) == pytest.approx(30.0)
+
+
+def test_edit_retries_after_a_concurrent_change(manager, server):
+    manager.add_to_cart(SESSION, 1, "Mouse", 2, 10.0)
+    other_worker = fakeredis.FakeRedis(server=server)
+    pipeline = manager._redis.pipeline
+    manager._redis.pipeline = lambda: RacingPipeline(pipeline(), lambda: other_worker.expire(KEY, 60))
+
+    result = manager.edit_item_in_cart(SESSION, 1, 4)
+
+    assert result["success"]
+    assert [item.quantity for item in manager.get_cart(SESSION)] == [4]
@@ -9,19 +9,35 @@ Usage:
     python -m tests.test_runner --category cart    # Run specific category
     python -m tests.test_runner --id product_search_001  # Run single test
     python -m tests.test_runner --report           # Generate detailed report
+    python -m tests.test_runner --concurrency 2    # Limit stateless tests in flight (default: 4)
+
+All test queries share one API session. Stateful categories (cart, checkout,
+shipping, orders, voucher, compound queries) build on each other's cart and
+order state, so they run one at a time in that order; only stateless categories
+run concurrently. Keep --concurrency times the query rate under the API's
+RATE_LIMIT_PER_MINUTE; a 429 response is retried after its Retry-After delay.
 """
-import json
 import asyncio
 import argparse
 import time
+from collections import Counter, defaultdict
 from pathlib import Path
 from datetime import datetime
 from typing import Optional
 import httpx
+import orjson
 
 
 # Configuration
 API_BASE_URL = "http://localhost:8000"
+# Kept well below RATE_LIMIT_PER_MINUTE (60/min per session) at typical LLM latencies
+DEFAULT_CONCURRENCY = 4
+# Categories that read or change the session's cart/orders, in the order they must run
+STATEFUL_CATEGORIES = ("cart_operations", "checkout", "shipping", "orders", "voucher", "compound_query")
+# Attempts per query when the API answers 429 Too Many Requests
+MAX_RATE_LIMIT_RETRIES = 3
+# Wait (seconds) before retrying a 429 that carries no Retry-After header
+DEFAULT_RETRY_AFTER = 10.0
 GOLDEN_DATA_PATH = Path(__file__).parent.parent / "data" / "golden_data" / "test_cases.json"
 RESULTS_PATH = Path(__file__).parent.parent / "data" / "golden_data" / "results"
 
@@ -29,15 +45,15 @@ RESULTS_PATH = Path(__file__).parent.parent / "data" / "golden_data" / "results"
 class TestRunner:
     """Runs golden dataset tests against the chatbot API."""
     
-    def __init__(self, base_url: str = API_BASE_URL):
+    def __init__(self, base_url: str = API_BASE_URL, concurrency: int = DEFAULT_CONCURRENCY):
         self.base_url = base_url
+        self.concurrency = concurrency
         self.session_id = f"test_session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         self.results = []
         
     def load_test_cases(self, category: Optional[str] = None, test_id: Optional[str] = None) -> list:
         """Load test cases from golden dataset."""
-        with open(GOLDEN_DATA_PATH, "r") as f:
-            data = json.load(f)
+        data = orjson.loads(GOLDEN_DATA_PATH.read_bytes())
         
         test_cases = data["test_cases"]
         
@@ -50,6 +66,26 @@ class TestRunner:
         
         return test_cases
     
+    async def _post_query(self, query: str, client: httpx.AsyncClient) -> httpx.Response:
+        """Post a query, waiting out 429 responses so rate limiting is not reported as an error."""
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            response = await client.post(
+                "/user/query",
+                json={
+                    "query": query,
+                    "session_id": self.session_id
+                }
+            )
+            if response.status_code != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                return response
+            try:
+                retry_after = float(response.headers.get("Retry-After", DEFAULT_RETRY_AFTER))
+            except ValueError:
+                retry_after = DEFAULT_RETRY_AFTER
+            print(f"  Rate limited; retrying in {retry_after:.0f}s")
+            await asyncio.sleep(retry_after)
+        return response
+    
     async def run_single_test(self, test_case: dict, client: httpx.AsyncClient) -> dict:
         """Run a single test case and return results."""
         test_id = test_case["id"]
@@ -64,14 +100,7 @@ class TestRunner:
         
         try:
             # Send query to the API
-            response = await client.post(
-                f"{self.base_url}/user/query",
-                json={
-                    "query": query,
-                    "session_id": self.session_id
-                },
-                timeout=60.0
-            )
+            response = await self._post_query(query, client)
             
             elapsed_time = time.time() - start_time
             
@@ -162,15 +191,37 @@ class TestRunner:
         print(f"# Session ID: {self.session_id}")
         print(f"# Test cases: {len(test_cases)}")
         print(f"# API: {self.base_url}")
+        print(f"# Concurrency: {self.concurrency}")
         print(f"{'#'*60}")
         
-        async with httpx.AsyncClient() as client:
-            for test_case in test_cases:
-                result = await self.run_single_test(test_case, client)
-                self.results.append(result)
-                # Small delay between tests to avoid overwhelming the API
-                await asyncio.sleep(0.5)
+        # Stateful tests share the session's cart and orders, so run them one at a time,
+        # category by category; sorted() is stable, keeping dataset order within a category
+        stateful = sorted(
+            (tc for tc in test_cases if tc["category"] in STATEFUL_CATEGORIES),
+            key=lambda tc: STATEFUL_CATEGORIES.index(tc["category"])
+        )
+        stateless = [tc for tc in test_cases if tc["category"] not in STATEFUL_CATEGORIES]
+        
+        # Stateless tests wait on LLM latency, so overlap them; the semaphore bounds the load on the API
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def run_guarded(test_case: dict, client: httpx.AsyncClient) -> dict:
+            async with semaphore:
+                return await self.run_single_test(test_case, client)
+        
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=limits,
+            timeout=httpx.Timeout(60.0, connect=5.0)
+        ) as client:
+            results = [await self.run_single_test(test_case, client) for test_case in stateful]
+            # gather keeps results in test case order
+            results.extend(await asyncio.gather(
+                *(run_guarded(test_case, client) for test_case in stateless)
+            ))
         
+        self.results = results
         return self.results
     
     def generate_report(self) -> dict:
@@ -178,26 +229,36 @@ class TestRunner:
         if not self.results:
             return {"error": "No results to report"}
         
+        # Single pass over the results
+        status_counts = Counter()
+        category_counts = defaultdict(Counter)
+        total_response_time = 0.0
+        failed_tests = []
+        for r in self.results:
+            status = r["status"]
+            status_counts[status] += 1
+            category_counts[r["category"]][status] += 1
+            total_response_time += r["response_time_seconds"]
+            if status != "passed":
+                failed_tests.append(r)
+        
         total = len(self.results)
-        passed = sum(1 for r in self.results if r["status"] == "passed")
-        failed = sum(1 for r in self.results if r["status"] == "failed")
-        errors = sum(1 for r in self.results if r["status"] == "error")
+        passed = status_counts["passed"]
+        failed = status_counts["failed"]
+        errors = status_counts["error"]
         
-        avg_response_time = sum(r["response_time_seconds"] for r in self.results) / total
+        avg_response_time = total_response_time / total
         
         # Category breakdown
         categories = {}
-        for r in self.results:
-            cat = r["category"]
-            if cat not in categories:
-                categories[cat] = {"total": 0, "passed": 0, "failed": 0, "errors": 0}
-            categories[cat]["total"] += 1
-            if r["status"] == "passed":
-                categories[cat]["passed"] += 1
-            elif r["status"] == "failed":
-                categories[cat]["failed"] += 1
-            else:
-                categories[cat]["errors"] += 1
+        for cat, counts in category_counts.items():
+            cat_total = sum(counts.values())
+            categories[cat] = {
+                "total": cat_total,
+                "passed": counts["passed"],
+                "failed": counts["failed"],
+                "errors": cat_total - counts["passed"] - counts["failed"]
+            }
         
         report = {
             "session_id": self.session_id,
@@ -211,7 +272,7 @@ class TestRunner:
                 "avg_response_time_seconds": round(avg_response_time, 2)
             },
             "by_category": categories,
-            "failed_tests": [r for r in self.results if r["status"] != "passed"],
+            "failed_tests": failed_tests,
             "all_results": self.results
         }
         
@@ -257,8 +318,7 @@ class TestRunner:
         filename = f"results_{self.session_id}.json"
         filepath = RESULTS_PATH / filename
         
-        with open(filepath, "w") as f:
-            json.dump(report, f, indent=2)
+        filepath.write_bytes(orjson.dumps(report, option=orjson.OPT_INDENT_2))
         
         print(f"Results saved to: {filepath}")
 
@@ -270,10 +330,11 @@ async def main():
     parser.add_argument("--url", default=API_BASE_URL, help="API base URL")
     parser.add_argument("--save", "-s", action="store_true", help="Save results to file")
     parser.add_argument("--report", "-r", action="store_true", help="Generate detailed report")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Maximum stateless tests in flight")
     
     args = parser.parse_args()
     
-    runner = TestRunner(base_url=args.url)
+    runner = TestRunner(base_url=args.url, concurrency=max(1, args.concurrency))
     
     # Run tests
     await runner.run_tests(category=args.category, test_id=args.id)